@@ -1,57 +1,3108 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, make_response
+from flask import Flask, render_template, request, jsonify, send_from_directory, make_response, Response, stream_with_context, g
 import pandas as pd
 import numpy as np
 import os
 import json
 from werkzeug.utils import secure_filename
+import click
 import io
 import csv
+import time
+import random
+import zipfile
+import gzip
+import functools
+import base64
+import fnmatch
+import hashlib
+import shutil
+import warnings
+import threading
+import sys
+import contextlib
+import bisect
+import uuid
+import queue
+import weakref
+import importlib.util
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+# Optional accelerators for response encoding; plain JSON and gzip are used without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+# POSIX only; without it /metrics leaves out the peak resident memory gauge
+try:
+    import resource
+except ImportError:
+    resource = None
+# pyarrow and ReportLab are slow to import and only needed by Arrow
+# responses and PDF bills, so they are imported on first use (see warm_up())
+ARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+# Uploads are streamed to disk and parsed in chunks, so the limit only bounds disk usage
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 1024)) * 1024 * 1024
+app.config['INGEST_CHUNK_ROWS'] = int(os.environ.get('INGEST_CHUNK_ROWS', 100000))
+# Files larger than this are analysed chunk by chunk with mergeable accumulators
+app.config['STREAMING_ANALYSIS_BYTES'] = int(os.environ.get('STREAMING_ANALYSIS_MB', 256)) * 1024 * 1024
 app.config['ALLOWED_EXTENSIONS'] = {'csv'}
+# Bulk billing runs can write their PDFs here instead of streaming a ZIP
+app.config['BILL_OUTPUT_FOLDER'] = os.environ.get('BILL_OUTPUT_FOLDER', 'bills')
+# Worker processes used for fleet-wide batch analysis and bulk billing
+app.config['FLEET_WORKERS'] = int(os.environ.get('FLEET_WORKERS', os.cpu_count() or 1))
+# Memory budget for parsed DataFrames kept between requests
+app.config['DATASET_CACHE_BYTES'] = int(os.environ.get('DATASET_CACHE_MB', 256)) * 1024 * 1024
+# Threads running queued /analyze jobs, and how long and how many of their results are kept
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', 4))
+app.config['ANALYSIS_RESULT_TTL'] = int(os.environ.get('ANALYSIS_RESULT_TTL', 600))
+app.config['ANALYSIS_RESULT_ENTRIES'] = int(os.environ.get('ANALYSIS_RESULT_ENTRIES', 256))
+# Load datasets with datetime64 timestamps, categoricals and float32 readings (see compact_values())
+app.config['COMPACT_DTYPES'] = os.environ.get('COMPACT_DTYPES', '').lower() in ('1', 'true', 'yes')
+# Most memory that dataset loads running at the same time may materialize;
+# a load that does not fit is served memory-mapped or refused
+app.config['LOAD_BUDGET_BYTES'] = int(os.environ.get('LOAD_BUDGET_MB', 1024)) * 1024 * 1024
+# Float64 readings that trend, anomaly and rollup computations stack at once (see column_groups())
+app.config['ANALYSIS_BLOCK_BYTES'] = int(os.environ.get('ANALYSIS_BLOCK_MB', 256)) * 1024 * 1024
+# Map numeric columns from files shared by every worker process (see SharedDatasetStore)
+app.config['SHARED_DATASETS'] = os.environ.get('SHARED_DATASETS', '').lower() in ('1', 'true', 'yes')
+# Readings kept per live meter, and how many live meters one process follows
+app.config['LIVE_WINDOW_READINGS'] = int(os.environ.get('LIVE_WINDOW_READINGS', 5000))
+app.config['LIVE_MAX_METERS'] = int(os.environ.get('LIVE_MAX_METERS', 256))
+# Import ReportLab and pyarrow in the background once configure_app() returns (see warm_up())
+app.config['WARMUP'] = os.environ.get('WARMUP', '').lower() in ('1', 'true', 'yes')
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+def _estimate_nbytes(value):
+    """Memory held by a cached value: a DataFrame or anything with an nbytes attribute"""
+    if isinstance(value, pd.DataFrame):
+        # Frames from _read_dataset() record their heap memory, which leaves
+        # memory-mapped columns out
+        if 'heap_bytes' in value.attrs:
+            return int(value.attrs['heap_bytes'])
+        return int(value.memory_usage(deep=True).sum())
+    return int(value.nbytes)
+
+class DatasetCache:
+    """
+    Thread-safe LRU cache of parsed CSV files
+
+    Entries are keyed by file path and validated against the file's mtime and
+    size, so a file that is overwritten on disk is never served stale. The
+    cache evicts least recently used entries once the total memory held by
+    the cached DataFrames exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (path, columns) -> (signature, df, nbytes)
+        self._lock = threading.Lock()
+        self._load_locks = {}  # key -> [lock, threads using it], only while a load is pending
+
+    @staticmethod
+    def signature(filepath):
+        stat = os.stat(filepath)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, filepath, loader, columns=None):
+        """
+        Return the cached DataFrame for filepath, calling loader on a miss
+
+        Values derived from a dataset (e.g. rollups) can be cached too under
+        a reserved column key, as long as they expose an nbytes attribute.
+
+        Args:
+            filepath: Path of the CSV file on disk
+            loader: Callable taking (filepath, columns) and returning a DataFrame
+            columns: Optional list of columns to project; each projection is
+                cached as its own entry
+
+        Returns:
+            DataFrame shared between requests; callers must not modify it
+        """
+        key = (os.path.abspath(filepath), tuple(columns) if columns is not None else None)
+        signature = self.signature(filepath)
+
+        with self._lock:
+            entry = self._lookup(key, signature)
+            if entry is not None:
+                return entry
+            load_lock = self._load_locks.setdefault(key, [threading.Lock(), 0])
+            load_lock[1] += 1
+
+        # Only one thread parses a given file; the others wait and reuse it
+        try:
+            with load_lock[0]:
+                with self._lock:
+                    entry = self._lookup(key, signature)
+                    if entry is not None:
+                        return entry
+                    self.misses += 1
+
+                df = loader(filepath, columns)
+                nbytes = _estimate_nbytes(df)
+
+                with self._lock:
+                    self._remove(key)
+                    if nbytes <= self.max_bytes:
+                        self._entries[key] = (signature, df, nbytes)
+                        self.current_bytes += nbytes
+                        self._evict()
+                return df
+        finally:
+            # The last thread out drops the lock, so keys seen once do not accumulate
+            with self._lock:
+                load_lock[1] -= 1
+                if not load_lock[1]:
+                    del self._load_locks[key]
+
+    def invalidate(self, filepath):
+        """Drop every cached projection of filepath, e.g. after it was overwritten"""
+        path = os.path.abspath(filepath)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def shrink(self, nbytes):
+        """Evict least recently used entries until about nbytes were dropped"""
+        with self._lock:
+            target = max(self.current_bytes - nbytes, 0)
+            while self.current_bytes > target and self._entries:
+                _, (_, _, size) = self._entries.popitem(last=False)
+                self.current_bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _lookup(self, key, signature):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != signature:
+            # File changed on disk since it was parsed
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, _, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+dataset_cache = DatasetCache(app.config['DATASET_CACHE_BYTES'])
+
+class PhaseTimer:
+    """
+    Wall time spent in named phases of one request or job, plus rows read
+
+    Phases nest: time spent in an inner phase is not counted again in the
+    phase around it, so the phases of a request add up to at most its
+    duration.
+    """
+
+    def __init__(self):
+        self.phases = Counter()
+        self.rows = 0
+        self._stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            inner = self._stack.pop()
+            self.phases[name] += elapsed - inner
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def merge(self, other):
+        self.phases.update(other.phases)
+        self.rows += other.rows
+
+    def to_dict(self):
+        return {
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'rows': self.rows
+        }
+
+# The PhaseTimer of the request or analysis job running on this thread
+_timing = threading.local()
+
+def current_timer():
+    return getattr(_timing, 'timer', None)
+
+@contextlib.contextmanager
+def timed(name):
+    """Count the enclosed block as phase name of the current request or job"""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    with timer.phase(name):
+        yield
+
+def timed_chunks(chunks, name):
+    """Yield from an iterator, counting the time spent producing each item as phase name"""
+    iterator = iter(chunks)
+    while True:
+        with timed(name):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def count_rows(rows):
+    timer = current_timer()
+    if timer is not None:
+        timer.rows += rows
+
+class Metrics:
+    """
+    Thread-safe counters and histograms rendered in the Prometheus text format
+
+    Each worker process keeps its own values.
+    """
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, labels, amount=1):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = self._labels(labels)
+        index = bisect.bisect_left(self.BUCKETS, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            buckets, total = series.get(key, ([0] * (len(self.BUCKETS) + 1), 0.0))
+            buckets[index] += 1
+            series[key] = (buckets, total + value)
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def _format_labels(cls, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{cls._escape(value)}"' for key, value in pairs) + '}'
+
+    def render(self, sampled=()):
+        """
+        Args:
+            sampled: (name, type, help text, [(labels dict, value)]) for
+                values read at scrape time, e.g. cache counters
+        """
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: (list(b), t) for key, (b, t) in series.items()}
+                          for name, series in self._histograms.items()}
+
+        def header(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for name, series in sorted(counters.items()):
+            header(name, 'counter', self._help.get(name, ('', name))[1])
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{self._format_labels(key)} {value}')
+        for name, series in sorted(histograms.items()):
+            header(name, 'histogram', self._help.get(name, ('', name))[1])
+            for key, (buckets, total) in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS + (float('inf'),), buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{self._format_labels(key, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{self._format_labels(key)} {total}')
+                lines.append(f'{name}_count{self._format_labels(key)} {cumulative}')
+        for name, kind, text, samples in sampled:
+            header(name, kind, text)
+            for labels, value in samples:
+                lines.append(f'{name}{self._format_labels(self._labels(labels))} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('eec_requests_total', 'counter', 'HTTP requests by endpoint, method and status')
+metrics.describe('eec_request_seconds', 'histogram', 'HTTP request latency')
+metrics.describe('eec_request_phase_seconds', 'histogram', 'Time spent per phase on the request thread')
+metrics.describe('eec_analysis_phase_seconds', 'histogram', 'Time spent per phase of analysis jobs')
+metrics.describe('eec_rows_processed_total', 'counter', 'Dataset rows read')
+metrics.describe('eec_request_bytes_total', 'counter', 'Request body bytes received')
+metrics.describe('eec_response_bytes_total', 'counter', 'Response body bytes sent, where known')
+metrics.describe('eec_live_readings_total', 'counter', 'Readings appended to live meters')
+
+
+# Columnar sidecars live next to the uploads; secure_filename never produces
+# a leading dot, so this directory cannot collide with an uploaded file
+COLUMNAR_FOLDER = '.columns'
+COLUMNAR_VERSION = 2
+
+# int64 view of NaT, used for unparseable timestamps
+NAT_INT64 = np.iinfo(np.int64).min
+
+def columnar_path(filepath):
+    folder, filename = os.path.split(filepath)
+    return os.path.join(folder, COLUMNAR_FOLDER, filename)
+
+def _column_values(series):
+    """Convert a column to a NumPy array that can be saved without pickling"""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series.to_numpy(), 'other'
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(), 'numeric'
+    return series.fillna('').astype(str).to_numpy(dtype=str), 'string'
+
+def _as_strings(values):
+    """Render a saved column part as strings, keeping missing values empty"""
+    if values.dtype.kind == 'U':
+        return values
+    strings = values.astype(str)
+    if values.dtype.kind == 'f':
+        strings = np.where(np.isnan(values), '', strings)
+    return strings
+
+def detect_time_column(df, sample_size=100):
+    """
+    Find the column holding timestamps, trying only a small sample per column
+
+    Text columns whose name mentions a date or time are tried first. Numeric
+    columns are never treated as timestamps.
+
+    Returns:
+        Column name, or None if no column parses as dates
+    """
+    candidates = [col for col in df.columns
+                  if pd.api.types.is_datetime64_any_dtype(df[col].dtype) or
+                  not (pd.api.types.is_numeric_dtype(df[col].dtype) or pd.api.types.is_bool_dtype(df[col].dtype))]
+    candidates.sort(key=lambda col: not any(word in str(col).lower() for word in ('date', 'time')))
+    for col in candidates:
+        if pd.api.types.is_datetime64_any_dtype(df[col].dtype):
+            return col
+        sample = df[col].dropna().head(sample_size)
+        if sample.empty:
+            continue
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            if pd.to_datetime(sample, errors='coerce').notna().all():
+                return col
+    return None
+
+def parse_timestamps(series):
+    """Parse a column to int64 nanoseconds since the epoch, NaT where unparseable"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        parsed = pd.to_datetime(series, errors='coerce')
+    if getattr(parsed.dt, 'tz', None) is not None:
+        parsed = parsed.dt.tz_convert(None)
+    return parsed.to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+class ColumnarSidecarWriter:
+    """
+    Build a columnar sidecar from DataFrame chunks in bounded memory
+
+    Each appended chunk is spooled to one part file per column. finish()
+    settles the final dtype of every column (chunks of a CSV can disagree,
+    e.g. ints in one chunk and floats in the next), concatenates the parts
+    into a single memory-mappable .npy file and swaps the sidecar into place.
+
+    The timestamp column, detected on the first chunk, is also stored parsed
+    as int64 nanoseconds so readers never have to parse dates again.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.target = columnar_path(filepath)
+        self.staging = f'{self.target}.tmp-{os.getpid()}-{threading.get_ident()}'
+        # Recorded up front: if the CSV is replaced while we ingest it, the
+        # finished sidecar is stale and will be ignored
+        self.source = DatasetCache.signature(filepath)
+        self.columns = None
+        self.time_column = None
+        self.row_count = 0
+        self._parts = []
+        self._has_nulls = []
+        self._time_parts = []
+        self._time_sorted = True
+        self._time_has_nat = False
+        self._time_last = None
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = df.columns.tolist()
+            self._parts = [[] for _ in self.columns]
+            self._has_nulls = [False] * len(self.columns)
+            self.time_column = detect_time_column(df)
+
+        for i, col in enumerate(self.columns):
+            series = df[col]
+            self._has_nulls[i] = self._has_nulls[i] or bool(series.isna().any())
+            values, kind = _column_values(series)
+            part = os.path.join(self.staging, f'c{i}.part{len(self._parts[i])}.npy')
+            np.save(part, values, allow_pickle=False)
+            self._parts[i].append((part, kind, values.dtype))
+
+        if self.time_column is not None:
+            timestamps = parse_timestamps(df[self.time_column])
+            valid = timestamps[timestamps != NAT_INT64]
+            self._time_has_nat = self._time_has_nat or len(valid) < len(timestamps)
+            if len(valid):
+                # Track whether the whole column is already in time order
+                if self._time_last is not None and valid[0] < self._time_last:
+                    self._time_sorted = False
+                if np.any(np.diff(valid) < 0):
+                    self._time_sorted = False
+                self._time_last = valid[-1]
+            part = os.path.join(self.staging, f'time.part{len(self._time_parts)}.npy')
+            np.save(part, timestamps, allow_pickle=False)
+            self._time_parts.append(part)
+        self.row_count += len(df)
+
+    def finish(self):
+        columns = []
+        for i, col in enumerate(self.columns or []):
+            parts = self._parts[i]
+            kinds = {kind for _, kind, _ in parts}
+            if len(kinds) == 1:
+                kind = kinds.pop()
+                dtype = np.result_type(*[dtype for _, _, dtype in parts])
+                convert = None
+            else:
+                # Mixed chunks degrade to strings, as a full pd.read_csv would
+                kind = 'string'
+                width = max(_as_strings(np.load(part)).dtype.itemsize // 4 for part, _, _ in parts)
+                dtype = np.dtype(f'<U{max(width, 1)}')
+                convert = _as_strings
+
+            column_file = f'c{i}.npy'
+            out = np.lib.format.open_memmap(
+                os.path.join(self.staging, column_file), mode='w+', dtype=dtype, shape=(self.row_count,))
+            offset = 0
+            for part, _, _ in parts:
+                values = np.load(part)
+                out[offset:offset + len(values)] = convert(values) if convert else values
+                offset += len(values)
+                os.remove(part)
+            out.flush()
+            del out
+
+            columns.append({
+                'name': col,
+                'file': column_file,
+                'dtype': str(dtype),
+                'kind': kind,
+                'has_nulls': self._has_nulls[i]
+            })
+
+        time = None
+        if self.time_column is not None:
+            out = np.lib.format.open_memmap(
+                os.path.join(self.staging, 'time.npy'), mode='w+', dtype=np.int64, shape=(self.row_count,))
+            offset = 0
+            for part in self._time_parts:
+                values = np.load(part)
+                out[offset:offset + len(values)] = values
+                offset += len(values)
+                os.remove(part)
+            out.flush()
+            del out
+            time = {'column': self.time_column, 'file': 'time.npy', 'sorted': self._time_sorted,
+                    'has_nat': self._time_has_nat}
+            if not self._time_sorted or self._time_has_nat:
+                # Rows out of time order get a sort permutation and the
+                # sorted timestamps, so range queries never sort at read time
+                timestamps = np.load(os.path.join(self.staging, 'time.npy'), mmap_mode='r')
+                order = time_order(timestamps)
+                keys = timestamps[order]
+                np.save(os.path.join(self.staging, 'time_order.npy'), order, allow_pickle=False)
+                np.save(os.path.join(self.staging, 'time_sorted.npy'),
+                        keys[:np.count_nonzero(keys != NAT_INT64)], allow_pickle=False)
+                del timestamps
+                time.update({'order_file': 'time_order.npy', 'sorted_file': 'time_sorted.npy'})
+
+        schema = {
+            'version': COLUMNAR_VERSION,
+            'source': {'mtime_ns': self.source[0], 'size': self.source[1]},
+            'row_count': self.row_count,
+            'columns': columns,
+            'time': time
+        }
+        with open(os.path.join(self.staging, 'schema.json'), 'w') as f:
+            json.dump(schema, f)
+
+        # Swap the finished sidecar into place; readers that race with the
+        # swap simply fall back to the CSV
+        retired = f'{self.staging}.old'
+        if os.path.isdir(self.target):
+            os.rename(self.target, retired)
+        os.rename(self.staging, self.target)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def abort(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+def write_columnar_sidecar(filepath, df):
+    """
+    Store each column of a parsed CSV as its own .npy file plus a schema
+
+    The sidecar records the size and mtime of the CSV it was built from, so
+    it is ignored as soon as the CSV is replaced. Strings are stored as
+    fixed-width unicode arrays to keep every column memory-mappable.
+
+    Args:
+        filepath: Path of the CSV file the DataFrame was parsed from
+        df: DataFrame holding the CSV contents as read by pd.read_csv
+    """
+    writer = ColumnarSidecarWriter(filepath)
+    try:
+        writer.append(df)
+        writer.finish()
+    except Exception:
+        writer.abort()
+        raise
+
+def read_columnar_schema(filepath):
+    """
+    Return the sidecar schema for filepath, or None if it is missing or stale
+    """
+    try:
+        with open(os.path.join(columnar_path(filepath), 'schema.json')) as f:
+            schema = json.load(f)
+        mtime_ns, size = DatasetCache.signature(filepath)
+    except (OSError, ValueError):
+        return None
+    source = schema.get('source', {})
+    if (schema.get('version') != COLUMNAR_VERSION or
+            source.get('mtime_ns') != mtime_ns or source.get('size') != size):
+        return None
+    return schema
+
+def _sidecar_series(values, column, index=None):
+    """Series for values read from a sidecar column, restoring missing strings"""
+    if column['kind'] == 'string':
+        series = pd.Series(values, index=index, dtype=object)
+        if column['has_nulls']:
+            series = series.mask(series == '')
+        return series
+    return pd.Series(np.array(values), index=index)
+
+# String columns with at most this share of distinct values load as categoricals
+CATEGORY_MAX_RATIO = 0.5
+# Readings with more decimals than this stay float64 in compact mode
+FLOAT32_MAX_DECIMALS = 6
+# Memory of an empty str object; each ASCII character adds one byte
+EMPTY_STR_BYTES = sys.getsizeof('')
+# Rough ratio of parsed DataFrame memory to CSV text size
+CSV_LOAD_FACTOR = 2
+
+def _reading_decimals(readings, sample_size=1000):
+    """
+    Fewest decimals that write every value of a float64 array exactly, or
+    None if it needs more than FLOAT32_MAX_DECIMALS
+
+    A sample picks the candidate so the whole array is usually checked once.
+    """
+    if not len(readings):
+        return 0
+    sample = readings[::max(len(readings) // sample_size, 1)]
+    start = next((d for d in range(FLOAT32_MAX_DECIMALS + 1) if np.array_equal(np.round(sample, d), sample)), None)
+    if start is None:
+        return None
+    for decimals in range(start, FLOAT32_MAX_DECIMALS + 1):
+        if np.array_equal(np.round(readings, decimals), readings):
+            return decimals
+    return None
+
+def compact_values(values):
+    """
+    Smallest faithful dtype for a numeric column
+
+    float64 becomes float32 when rounding each float32 value back to the
+    column's decimals restores the reading exactly, which holds for meter
+    readings of a few decimals but not for e.g. energy counters with many
+    significant digits. Integers are downcast to the smallest type that
+    holds them.
+
+    Args:
+        values: NumPy array, possibly memory-mapped
+
+    Returns:
+        (array in memory, decimals) where decimals is set for float32
+        columns and restores the readings in readings_block()
+    """
+    if values.dtype.kind == 'f' and values.dtype.itemsize > 4:
+        finite = np.isfinite(values)
+        readings = values[finite]
+        decimals = _reading_decimals(readings)
+        if decimals is not None:
+            small = values.astype(np.float32)
+            if np.array_equal(np.round(small[finite].astype(np.float64), decimals), readings):
+                return small, decimals
+        return np.array(values), None
+    if values.dtype.kind in 'iu':
+        return pd.to_numeric(np.array(values), downcast='integer' if values.dtype.kind == 'i' else 'unsigned'), None
+    return np.array(values), None
+
+def readings_block(df, columns):
+    """
+    Numeric columns as a 2-D float64 array, NaN where missing
+
+    float32 columns of a compact frame are rounded back to the decimals
+    they were read with, so analyses see exactly the readings in the CSV.
+    """
+    values = df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    decimals = df.attrs.get('decimals', {})
+    if any(col in decimals for col in columns) and not values.flags.writeable:
+        values = values.copy()
+    for i, col in enumerate(columns):
+        if col in decimals:
+            values[:, i] = np.round(values[:, i], decimals[col])
+    return values
+
+def numeric_column_names(df):
+    """
+    Names of the numeric columns of df, as df.select_dtypes(include=[np.number])
+    gives them but without building that frame, which copies columns that
+    are memory-mapped
+    """
+    return [col for col, dtype in df.dtypes.items()
+            if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+
+def column_groups(rows, columns):
+    """
+    Slices of columns whose readings_block() over rows fits ANALYSIS_BLOCK_BYTES
+
+    Analyses that need several temporaries the size of the block work
+    through the groups in turn, so a dataset served memory-mapped because
+    it does not fit the load budget is not copied into memory all at once.
+    """
+    width = max(1, app.config['ANALYSIS_BLOCK_BYTES'] // max(rows * 8, 1))
+    return [slice(start, start + width) for start in range(0, max(len(columns), 1), width)]
+
+def _categorical_strings(values, has_nulls, sample_size=1000):
+    """
+    Categorical for a fixed-width string column, or None if it has too many
+    distinct values; a sample rules out high-cardinality columns cheaply
+    """
+    sample = values[::max(len(values) // sample_size, 1)]
+    if len(np.unique(sample)) > CATEGORY_MAX_RATIO * len(sample):
+        return None
+    categories, codes = np.unique(values, return_inverse=True)
+    if len(categories) > CATEGORY_MAX_RATIO * len(values):
+        return None
+    if has_nulls and len(categories) and categories[0] == '':
+        # Empty strings stand for missing values and sort first
+        categories, codes = categories[1:], codes - 1
+    return pd.Categorical.from_codes(codes.ravel(), categories)
+
+def _string_bytes(values):
+    """Memory of a fixed-width string column once loaded as Python str objects"""
+    return len(values) * (8 + EMPTY_STR_BYTES) + int(np.char.str_len(values).sum())
+
+class DatasetTooLarge(MemoryError):
+    """A dataset that cannot be loaded within LOAD_BUDGET_BYTES"""
+
+class LoadBudget:
+    """
+    Bytes of loaded datasets held in memory by this process
+
+    Each load reserves its estimated size first, and a frame that loads
+    keeps its share reserved for as long as it lives, in the dataset cache
+    or in a request. A load that does not fit next to them is not started
+    until reclaim (evicting cached frames) has made room, so several
+    requests against big files cannot together push a worker out of memory.
+    """
+
+    def __init__(self, max_bytes, reclaim=None):
+        self.max_bytes = max_bytes
+        self.reclaim = reclaim
+        self.reserved = 0
+        self.spilled = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes):
+        """
+        Yield a Reservation, true when nbytes fit the budget
+
+        The bytes are held until the block exits, or until the frame passed
+        to Reservation.keep() is garbage collected.
+        """
+        granted = self._acquire(nbytes)
+        if not granted and self.reclaim is not None:
+            with self._lock:
+                excess = self.reserved + nbytes - self.max_bytes
+            if nbytes <= self.max_bytes:
+                self.reclaim(excess)
+                granted = self._acquire(nbytes)
+        reservation = Reservation(self, nbytes, granted)
+        try:
+            yield reservation
+        finally:
+            reservation.close()
+
+    def _acquire(self, nbytes):
+        with self._lock:
+            if self.reserved + nbytes > self.max_bytes:
+                return False
+            self.reserved += nbytes
+            return True
+
+    def release(self, nbytes):
+        with self._lock:
+            self.reserved -= nbytes
+
+    def count(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'reserved_bytes': self.reserved,
+                'max_bytes': self.max_bytes,
+                'spilled': self.spilled,
+                'refused': self.refused
+            }
+
+class Reservation:
+    """Bytes reserved from a LoadBudget by one load"""
+
+    def __init__(self, budget, nbytes, granted):
+        self.budget = budget
+        self.nbytes = nbytes if granted else 0
+        self.granted = granted
+
+    def __bool__(self):
+        return self.granted
+
+    def keep(self, df):
+        """
+        Hold the memory df takes until it is garbage collected
+
+        Only the heap memory the frame records is kept; the rest of the
+        estimate is returned now.
+
+        Returns:
+            df
+        """
+        held = min(int(df.attrs.get('heap_bytes', self.nbytes)), self.nbytes)
+        self.budget.release(self.nbytes - held)
+        self.nbytes = 0
+        if held:
+            weakref.finalize(df, self.budget.release, held)
+        return df
+
+    def close(self):
+        if self.nbytes:
+            self.budget.release(self.nbytes)
+            self.nbytes = 0
+
+load_budget = LoadBudget(app.config['LOAD_BUDGET_BYTES'], reclaim=dataset_cache.shrink)
+
+class MemoryReports:
+    """
+    Memory held by the latest load of each dataset, per column, against
+    what the default pd.read_csv dtypes would hold
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._reports = OrderedDict()  # path -> {column: entry}
+        self._lock = threading.Lock()
+
+    def record(self, filepath, columns):
+        """
+        Args:
+            filepath: Path of the CSV file on disk
+            columns: {name: {'dtype', 'bytes', 'default_bytes', 'memory_mapped'}};
+                projections of the same dataset are merged
+        """
+        path = os.path.abspath(filepath)
+        with self._lock:
+            report = self._reports.pop(path, {})
+            report.update(columns)
+            self._reports[path] = report
+            while len(self._reports) > self.max_entries:
+                self._reports.popitem(last=False)
+
+    @staticmethod
+    def _summary(columns):
+        default = sum(c['default_bytes'] for c in columns.values())
+        loaded = sum(c['bytes'] for c in columns.values())
+        return {
+            'columns': columns,
+            'default_bytes': default,
+            'bytes': loaded,
+            'saved_bytes': default - loaded,
+            'saved_ratio': round(1 - loaded / default, 4) if default else 0.0
+        }
+
+    def stats(self):
+        """Summaries keyed by file name"""
+        with self._lock:
+            reports = {path: dict(columns) for path, columns in self._reports.items()}
+        return {os.path.basename(path): self._summary(columns) for path, columns in reports.items()}
+
+memory_reports = MemoryReports()
+
+# Shared generations of datasets live next to the uploads, like the sidecars
+SHARED_FOLDER = '.shared'
+
+def shared_path(filepath):
+    folder, filename = os.path.split(filepath)
+    return os.path.join(folder, SHARED_FOLDER, filename)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class SharedDatasetStore:
+    """
+    Numeric columns of datasets published once as memory-mapped files that
+    every worker process maps read-only
+
+    Each version of a dataset gets its own generation directory, named
+    after the CSV's mtime and size and the dtype mode, with one .npy file
+    per numeric column and a manifest.json. The first process to load a
+    version publishes it by renaming a finished staging directory into
+    place; every other worker, and the fleet analysis processes, only map
+    the files, so the page cache holds one copy however many processes
+    read the dataset.
+
+    A process using a generation keeps a refs/<pid> file in it. Stale
+    generations are deleted once no live process holds them; on POSIX a
+    process that still has their files mapped can keep reading them.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self._holds = Counter()  # (pid, generation dir) -> frames using it
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def generation(filepath, source, compact):
+        """Directory of the generation built from the CSV version described by source"""
+        return os.path.join(shared_path(filepath),
+                            f'{source["mtime_ns"]}-{source["size"]}-{"compact" if compact else "default"}')
+
+    def attach(self, filepath, schema, compact):
+        """
+        Map the numeric columns of a dataset, publishing them first if no
+        process has yet; release() the generation when done with the arrays
+
+        Returns:
+            (generation dir, {column: read-only array}, {column: decimals})
+
+        Raises:
+            OSError: If the sidecar or the generation changed meanwhile
+        """
+        # Named after the CSV version the schema was built from, not the one
+        # on disk now, so a CSV replaced meanwhile cannot mislabel its columns
+        target = self.generation(filepath, schema['source'], compact)
+        if not os.path.exists(os.path.join(target, 'manifest.json')):
+            self._publish(filepath, schema, compact, target)
+        with open(os.path.join(target, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['source'] != schema['source']:
+            raise OSError(f'Shared generation {os.path.basename(target)} does not match the sidecar')
+        arrays = {name: np.load(os.path.join(target, column['file']), mmap_mode='r', allow_pickle=False)
+                  for name, column in manifest['columns'].items()}
+        decimals = {name: column['decimals'] for name, column in manifest['columns'].items()
+                    if column.get('decimals') is not None}
+
+        key = (os.getpid(), target)
+        with self._lock:
+            self._holds[key] += 1
+            first = self._holds[key] == 1
+        if first:
+            # Never recreates a generation deleted meanwhile: its mapped files stay readable
+            with contextlib.suppress(OSError):
+                open(os.path.join(target, 'refs', str(os.getpid())), 'a').close()
+        return target, arrays, decimals
+
+    def release(self, target):
+        key = (os.getpid(), target)
+        with self._lock:
+            self._holds[key] -= 1
+            last = self._holds[key] <= 0
+            if last:
+                del self._holds[key]
+        if last:
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(target, 'refs', str(os.getpid())))
+            self._collect(os.path.dirname(target))
+
+    def _publish(self, filepath, schema, compact, target):
+        staging = f'{target}.tmp-{os.getpid()}-{threading.get_ident()}'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(os.path.join(staging, 'refs'))
+        try:
+            sidecar = columnar_path(filepath)
+            columns = {}
+            for column in schema['columns']:
+                if column['kind'] != 'numeric':
+                    continue
+                source = os.path.join(sidecar, column['file'])
+                destination = os.path.join(staging, column['file'])
+                entry = {'file': column['file'], 'decimals': None}
+                if compact:
+                    values, entry['decimals'] = compact_values(np.load(source, mmap_mode='r', allow_pickle=False))
+                    np.save(destination, values, allow_pickle=False)
+                else:
+                    try:
+                        # Shares the sidecar's file, which outlives a sidecar rebuild
+                        os.link(source, destination)
+                    except OSError:
+                        shutil.copyfile(source, destination)
+                    values = np.load(destination, mmap_mode='r', allow_pickle=False)
+                entry['dtype'] = str(values.dtype)
+                columns[column['name']] = entry
+            manifest = {
+                'source': schema['source'],
+                'row_count': schema['row_count'],
+                'compact': compact,
+                'columns': columns
+            }
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+            try:
+                os.rename(staging, target)
+            except OSError:
+                # Another process published this generation first
+                shutil.rmtree(staging, ignore_errors=True)
+                return
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        with self._lock:
+            self.published += 1
+        self._collect(os.path.dirname(target))
+
+    def collect(self, filepath):
+        """Delete the generations of a dataset that are stale and held by no live process"""
+        self._collect(shared_path(filepath))
+
+    def _collect(self, folder):
+        try:
+            mtime_ns, size = DatasetCache.signature(os.path.join(os.path.dirname(os.path.dirname(folder)),
+                                                                 os.path.basename(folder)))
+            current = f'{mtime_ns}-{size}-'
+        except OSError:
+            current = None
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(folder, name)
+            if '.tmp-' in name:
+                # Staging left behind by a process that died while publishing
+                pid = name.split('.tmp-')[1].split('-')[0]
+                if pid.isdigit() and not _process_alive(int(pid)):
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            if current is not None and name.startswith(current):
+                continue
+            try:
+                holders = [int(pid) for pid in os.listdir(os.path.join(path, 'refs')) if pid.isdigit()]
+            except OSError:
+                holders = []
+            with self._lock:
+                held = any(self._holds[(pid, path)] if pid == os.getpid() else _process_alive(pid)
+                           for pid in holders)
+            if not held:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            pid = os.getpid()
+            return {
+                'generations_held': sum(1 for (owner, _), n in self._holds.items() if owner == pid and n > 0),
+                'frames': sum(n for (owner, _), n in self._holds.items() if owner == pid),
+                'published': self.published
+            }
+
+shared_store = SharedDatasetStore()
+
+def _read_dataset(filepath, columns=None):
+    """
+    Parse a dataset from its columnar sidecar, falling back to the CSV
+
+    The load first reserves its estimated size from load_budget, and the
+    frame keeps its memory reserved while it lives. When that does not
+    fit, numeric sidecar columns are left memory-mapped so only text is
+    materialized; without a sidecar one is built in bounded memory first.
+    With SHARED_DATASETS numeric columns are always mapped, from
+    shared_store. With COMPACT_DTYPES, timestamps load as datetime64, low
+    cardinality text as categoricals and readings as float32 where that is
+    exact (see compact_values()).
+
+    Args:
+        filepath: Path of the CSV file on disk
+        columns: Optional list of columns to load; None loads every column
+
+    Returns:
+        DataFrame with the requested columns in file order
+
+    Raises:
+        DatasetTooLarge: If even the text columns do not fit the budget
+    """
+    schema = read_columnar_schema(filepath)
+    if schema is None:
+        return _read_csv_dataset(filepath, columns)
+
+    wanted = schema['columns']
+    if columns is not None:
+        missing = set(columns) - {c['name'] for c in wanted}
+        if missing:
+            raise ValueError(f'Columns not found in data: {sorted(missing)}')
+        wanted = [c for c in wanted if c['name'] in columns]
+
+    row_count = schema['row_count']
+    folder = columnar_path(filepath)
+    numeric = [c['name'] for c in wanted if c['kind'] == 'numeric']
+    generation = None
+    try:
+        arrays = {c['name']: np.load(os.path.join(folder, c['file']), mmap_mode='r', allow_pickle=False)
+                  for c in wanted}
+        default_bytes = {c['name']: _string_bytes(arrays[c['name']]) if c['kind'] == 'string'
+                         else arrays[c['name']].nbytes for c in wanted}
+        needed = dict(default_bytes)
+        time = schema.get('time')
+        if app.config['COMPACT_DTYPES'] and time is not None and time['column'] in needed:
+            needed[time['column']] = row_count * 8
+
+        if app.config['SHARED_DATASETS'] and numeric:
+            generation, shared, decimals = shared_store.attach(filepath, schema, app.config['COMPACT_DTYPES'])
+            mapped = {name: shared[name] for name in numeric}
+            decimals = {name: decimals[name] for name in numeric if name in decimals}
+        else:
+            with load_budget.reserve(sum(needed.values())) as reservation:
+                if reservation:
+                    return reservation.keep(_load_sidecar(filepath, schema, wanted, arrays, default_bytes))
+            # Over budget: numeric columns stay in the page cache, not the heap
+            mapped = {name: arrays[name] for name in numeric}
+            decimals = {}
+
+        with load_budget.reserve(sum(n for name, n in needed.items() if name not in mapped)) as reservation:
+            if not reservation:
+                load_budget.count('refused')
+                raise DatasetTooLarge(f'{os.path.basename(filepath)} needs about {sum(needed.values()) >> 20} MiB, '
+                                      f'more than the load budget allows now')
+            if generation is None:
+                load_budget.count('spilled')
+            df = reservation.keep(_load_sidecar(filepath, schema, wanted, arrays, default_bytes, mapped, decimals))
+    except OSError:
+        # Sidecar was replaced while we were reading it
+        if generation is not None:
+            shared_store.release(generation)
+        return _read_csv_dataset(filepath, columns, spill=False)
+    except BaseException:
+        if generation is not None:
+            shared_store.release(generation)
+        raise
+    if generation is not None:
+        # The generation is held for as long as the frame lives
+        weakref.finalize(df, shared_store.release, generation)
+    return df
+
+def _load_sidecar(filepath, schema, wanted, arrays, default_bytes, mapped=None, mapped_decimals=None):
+    """
+    Args:
+        mapped: {column: memory-mapped array} used as they are, with
+            mapped_decimals for those that are compact float32
+    """
+    mapped = mapped or {}
+    compact = app.config['COMPACT_DTYPES']
+    time = schema.get('time')
+    data = {}
+    decimals = dict(mapped_decimals or {})
+    for column in wanted:
+        name = column['name']
+        values = arrays[name]
+        if name in mapped:
+            data[name] = mapped[name]
+        elif compact and time is not None and name == time['column']:
+            data[name] = np.load(os.path.join(columnar_path(filepath), time['file']),
+                                 allow_pickle=False).view('datetime64[ns]')
+        elif compact and column['kind'] == 'numeric':
+            data[name], decimals[name] = compact_values(values)
+        elif compact and column['kind'] == 'string':
+            categorical = _categorical_strings(values, column['has_nulls'])
+            data[name] = categorical if categorical is not None else _sidecar_series(values, column)
+        else:
+            data[name] = _sidecar_series(values, column)
+    # copy=False keeps memory-mapped arrays mapped instead of consolidating them
+    df = pd.DataFrame(data, index=pd.RangeIndex(schema['row_count']), copy=False)
+    df.attrs['decimals'] = {name: d for name, d in decimals.items() if d is not None}
+    return _record_memory(filepath, df, default_bytes, mapped)
+
+def _read_csv_dataset(filepath, columns=None, spill=True):
+    """
+    Parse a dataset without a sidecar from the CSV
+
+    When the parsed columns would not fit the load budget, the sidecar is
+    built chunk by chunk (as at upload) and the dataset is read from it.
+    """
+    size = os.path.getsize(filepath)
+    if columns is not None:
+        header = pd.read_csv(filepath, nrows=0).columns
+        size = size * len(columns) // max(len(header), 1)
+    with load_budget.reserve(size * CSV_LOAD_FACTOR) as reservation:
+        if reservation:
+            df = pd.read_csv(filepath, usecols=columns)
+            default_bytes = df.memory_usage(deep=True, index=False).to_dict()
+            if app.config['COMPACT_DTYPES']:
+                compact_frame(df)
+            return reservation.keep(_record_memory(filepath, df, default_bytes))
+    if spill:
+        ingest_csv(filepath)
+        if read_columnar_schema(filepath) is not None:
+            return _read_dataset(filepath, columns)
+    load_budget.count('refused')
+    raise DatasetTooLarge(f'{os.path.basename(filepath)} is too large to load within the load budget')
+
+def compact_frame(df):
+    """Convert the columns of a parsed CSV to compact dtypes in place, one at a time"""
+    time_col = detect_time_column(df)
+    decimals = {}
+    for col in df.columns:
+        series = df[col]
+        if col == time_col:
+            df[col] = parse_timestamps(series).view('datetime64[ns]')
+        elif pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+            continue
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            df[col], decimals[col] = compact_values(series.to_numpy())
+        elif series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+            df[col] = series.astype('category')
+    df.attrs['decimals'] = {col: d for col, d in decimals.items() if d is not None}
+
+def _record_memory(filepath, df, default_bytes, mapped=()):
+    """Report the memory a loaded frame holds and note it for the dataset cache"""
+    loaded = df.memory_usage(deep=True, index=False)
+    report = {name: {'dtype': str(df[name].dtype),
+                     'bytes': 0 if name in mapped else int(loaded[name]),
+                     'default_bytes': int(default_bytes[name]),
+                     'memory_mapped': name in mapped}
+              for name in df.columns}
+    memory_reports.record(filepath, report)
+    df.attrs['heap_bytes'] = sum(entry['bytes'] for entry in report.values())
+    return df
+
+def load_dataset(filepath, columns=None):
+    """
+    Load a dataset through the shared dataset cache
+
+    Args:
+        filepath: Path of the CSV file on disk
+        columns: Optional list of columns to load; only these are read from
+            the columnar sidecar when one exists
+
+    Returns:
+        Parsed DataFrame; treat it as read-only since it is shared
+    """
+    with timed('load'):
+        df = dataset_cache.get(filepath, _read_dataset, columns)
+    count_rows(len(df))
+    return df
+
+def read_rows(filepath, columns, rows):
+    """
+    Read some rows of some columns of a dataset
+
+    With a sidecar only the requested rows are read from the memory-mapped
+    column files, so the cost follows the number of rows rather than the
+    file size. Otherwise the columns are loaded through the dataset cache.
+
+    Args:
+        filepath: Path of the CSV file on disk
+        columns: List of column names
+        rows: Slice or array of row numbers
+
+    Returns:
+        DataFrame indexed by row number
+
+    Raises:
+        ValueError: If a column is not in the dataset
+    """
+    with timed('load'):
+        df = _read_rows(filepath, columns, rows)
+    count_rows(len(df))
+    return df
+
+def _read_rows(filepath, columns, rows):
+    schema = read_columnar_schema(filepath)
+    if schema is not None:
+        by_name = {c['name']: c for c in schema['columns']}
+        missing = set(columns) - set(by_name)
+        if missing:
+            raise ValueError(f'Columns not found in data: {sorted(missing)}')
+        index = np.arange(*rows.indices(schema['row_count'])) if isinstance(rows, slice) else np.asarray(rows)
+        # Gather in file order, which keeps reads from the mapped files sequential
+        gather = np.argsort(index, kind='stable') if not isinstance(rows, slice) else None
+        folder = columnar_path(filepath)
+        try:
+            data = {}
+            for col in columns:
+                values = np.load(os.path.join(folder, by_name[col]['file']), mmap_mode='r', allow_pickle=False)
+                if gather is None:
+                    picked = values[rows]
+                else:
+                    picked = np.empty(len(index), dtype=values.dtype)
+                    picked[gather] = values[index[gather]]
+                data[col] = _sidecar_series(picked, by_name[col], index)
+            return pd.DataFrame(data, index=index)
+        except OSError:
+            pass
+    df = load_dataset(filepath, list(dict.fromkeys(columns)))
+    return df.iloc[rows]
+
+def row_timestamps(filepath, rows):
+    """Parsed int64 ns timestamps of some rows, NAT_INT64 where missing"""
+    schema = read_columnar_schema(filepath)
+    time = schema.get('time') if schema is not None else None
+    if time is not None:
+        try:
+            return np.load(os.path.join(columnar_path(filepath), time['file']), mmap_mode='r')[rows]
+        except OSError:
+            pass
+    _, timestamps = dataset_time_index(filepath)
+    return timestamps[rows]
+
+def numeric_columns(filepath):
+    """Names of the numeric columns of a dataset, or None if unknown without parsing"""
+    schema = read_columnar_schema(filepath)
+    if schema is None:
+        return None
+    return [c['name'] for c in schema['columns'] if c['kind'] == 'numeric']
+
+# Cache key under which a dataset's parsed timestamps are kept
+TIME_INDEX = '__time_index__'
+
+def _read_time_index(filepath, columns=None):
+    """
+    Parsed timestamps of a dataset as a one-column DataFrame of int64 ns
+
+    Uses the timestamps stored in the sidecar at upload; only datasets
+    without a sidecar are parsed here. The column is named after the
+    source column and the frame is empty if there is no timestamp column.
+    """
+    schema = read_columnar_schema(filepath)
+    if schema is not None:
+        time = schema.get('time')
+        if time is None:
+            return pd.DataFrame()
+        try:
+            values = np.load(os.path.join(columnar_path(filepath), time['file']), allow_pickle=False)
+            return pd.DataFrame({time['column']: values})
+        except OSError:
+            pass
+    df = load_dataset(filepath)
+    time_col = detect_time_column(df)
+    if time_col is None:
+        return pd.DataFrame()
+    return pd.DataFrame({time_col: parse_timestamps(df[time_col])})
+
+def dataset_time_index(filepath):
+    """
+    Return (column name, int64 nanosecond timestamps) for a dataset
+
+    Both are None when the dataset has no timestamp column. Missing or
+    unparseable timestamps are NAT_INT64.
+    """
+    with timed('load'):
+        frame = dataset_cache.get(filepath, _read_time_index, [TIME_INDEX])
+    if frame.empty and not len(frame.columns):
+        return None, None
+    time_col = frame.columns[0]
+    return time_col, frame[time_col].to_numpy()
+
+# Cache key under which a dataset's sorted time index is kept
+SORTED_TIME_INDEX = '__sorted_time_index__'
+
+class SortedTimeIndex:
+    """
+    Timestamps of a dataset in time order, for binary-search range lookups
+
+    keys holds the sorted timestamps of the rows that have one; order maps
+    positions in keys to row numbers, or is None when the rows are already
+    in time order. Both may be memory-mapped from the sidecar.
+    """
+
+    def __init__(self, column, keys, order):
+        self.column = column
+        self.keys = keys
+        self.order = order
+
+    @property
+    def nbytes(self):
+        # Memory-mapped arrays live in the page cache, not the process heap
+        return sum(array.nbytes for array in (self.keys, self.order)
+                   if array is not None and not isinstance(array, np.memmap))
+
+    def window(self, start=None, end=None):
+        """Positions [lo, hi) of the rows with start <= timestamp < end"""
+        lo = int(np.searchsorted(self.keys, start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(self.keys, end, side='left')) if end is not None else len(self.keys)
+        return lo, max(lo, hi)
+
+    def rows(self, lo, hi):
+        """Row numbers of positions [lo, hi), as a slice when rows are in time order"""
+        if self.order is None:
+            return slice(lo, hi)
+        return np.asarray(self.order[lo:hi])
+
+def _read_sorted_time_index(filepath, columns=None):
+    """
+    Sorted time index of a dataset, memory-mapped from the permutation and
+    sorted timestamps stored at ingest when there are any
+    """
+    schema = read_columnar_schema(filepath)
+    time = schema.get('time') if schema is not None else None
+    if time is not None and 'has_nat' in time:
+        folder = columnar_path(filepath)
+        try:
+            if 'order_file' in time:
+                return SortedTimeIndex(time['column'],
+                                       np.load(os.path.join(folder, time['sorted_file']), mmap_mode='r'),
+                                       np.load(os.path.join(folder, time['order_file']), mmap_mode='r'))
+            return SortedTimeIndex(time['column'], np.load(os.path.join(folder, time['file']), mmap_mode='r'), None)
+        except OSError:
+            pass
+
+    time_col, timestamps = dataset_time_index(filepath)
+    if time_col is None:
+        return SortedTimeIndex(None, np.empty(0, dtype=np.int64), None)
+    order = time_order(timestamps)
+    keys = timestamps[order]
+    keys = keys[:np.count_nonzero(keys != NAT_INT64)]
+    if len(keys) == len(timestamps) and (np.diff(timestamps) >= 0).all():
+        order = None
+    return SortedTimeIndex(time_col, keys, order)
+
+def dataset_sorted_time_index(filepath):
+    """SortedTimeIndex of a dataset, or None if it has no timestamp column"""
+    with timed('load'):
+        index = dataset_cache.get(filepath, _read_sorted_time_index, [SORTED_TIME_INDEX])
+    return index if index.column is not None else None
+
 def process_meter_data(df):
     """
-    Process electricity meter data to ensure consistent format
-    
+    Process electricity meter data to ensure consistent format
+    
+    Args:
+        df: DataFrame containing electricity meter data
+    
+    Returns:
+        df itself when it already has consumption, otherwise a shallow copy
+        sharing df's columns with the derived consumption added; df is never
+        modified, so frames from the dataset cache can be passed in
+    """
+    result_df = df
+    
+    # Check if we have consumption data directly
+    if 'Electricity_Consumption_kWh' not in df.columns:
+        result_df = df.copy(deep=False)
+        if '3_Phase_Active_Power' in df.columns:
+            # Calculate consumption from 3-phase active power (kW to kWh conversion)
+            # Assuming the data is hourly, we divide by 1000 to convert W to kW
+            result_df['Electricity_Consumption_kWh'] = df['3_Phase_Active_Power'] / 1000
+        elif all(f'{phase}_Phase_Active_Power' in df.columns for phase in ['R', 'Y', 'B']):
+            # Sum the three phases to get total consumption
+            result_df['Electricity_Consumption_kWh'] = (
+                df['R_Phase_Active_Power'] + 
+                df['Y_Phase_Active_Power'] + 
+                df['B_Phase_Active_Power']
+            ) / 1000  # Convert W to kW
+    
+    return result_df
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+
+_content_hashes = {}
+_content_hashes_lock = threading.Lock()
+
+def _record_content_hash(filepath, digest):
+    with _content_hashes_lock:
+        _content_hashes[os.path.abspath(filepath)] = (DatasetCache.signature(filepath), digest)
+
+def content_hash(filepath, chunk_size=1024 * 1024):
+    """
+    SHA-1 of a file's contents, computed once per version of the file
+
+    Uploads record their hash while being written, so this only reads
+    files that changed on disk some other way.
+    """
+    path = os.path.abspath(filepath)
+    signature = DatasetCache.signature(filepath)
+    with _content_hashes_lock:
+        known = _content_hashes.get(path)
+    if known is not None and known[0] == signature:
+        return known[1]
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    with _content_hashes_lock:
+        _content_hashes[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+def save_upload_stream(stream, filepath, chunk_size=1024 * 1024):
+    """
+    Copy an upload to disk in fixed-size chunks and move it into place
+
+    The file is written next to its destination and renamed over it once
+    complete, so readers never see a half-written CSV.
+    """
+    partial = f'{filepath}.part-{os.getpid()}-{threading.get_ident()}'
+    digest = hashlib.sha1()
+    try:
+        with open(partial, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+                digest.update(chunk)
+        os.replace(partial, filepath)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    _record_content_hash(filepath, digest.hexdigest())
+    dataset_cache.invalidate(filepath)
+    statistics_scan.invalidate(filepath)
+    correlation_scan.invalidate(filepath)
+    shared_store.collect(filepath)
+
+def _merge_dtypes(current, new):
+    """Combine the dtypes a column had in two chunks the way a single read would"""
+    if current is None or current == new:
+        return new
+    numeric = [pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in (current, new)]
+    if all(numeric):
+        return np.result_type(current, new)
+    if numeric[0]:
+        return new
+    if numeric[1]:
+        return current
+    return np.dtype(object)
+
+def ingest_csv(filepath, chunk_rows=None):
+    """
+    Parse a CSV in chunks, summarising it and building its columnar sidecar
+
+    Memory use is bounded by the chunk size regardless of the file size.
+
+    Args:
+        filepath: Path of the CSV file on disk
+        chunk_rows: Rows per chunk, defaults to INGEST_CHUNK_ROWS
+
+    Returns:
+        Dict with the processed columns, a 10 row preview, dtypes, row count,
+        the detected timestamp column and the total of
+        Electricity_Consumption_kWh when it can be derived
+
+    Raises:
+        pd.errors.EmptyDataError, pd.errors.ParserError: If the CSV is unreadable
+    """
+    chunk_rows = chunk_rows or app.config['INGEST_CHUNK_ROWS']
+    writer = ColumnarSidecarWriter(filepath)
+    columns = None
+    time_column = None
+    preview = []
+    dtypes = {}
+    row_count = 0
+    total_consumption = None
+
+    try:
+        for chunk in timed_chunks(pd.read_csv(filepath, chunksize=chunk_rows), 'parse'):
+            count_rows(len(chunk))
+            if writer is not None:
+                try:
+                    writer.append(chunk)
+                except Exception as e:
+                    app.logger.warning('Could not write columnar sidecar for %s: %s', filepath, e)
+                    writer.abort()
+                    writer = None
+
+            # Derive consumption per chunk exactly as for a whole file
+            processed = process_meter_data(chunk)
+            if columns is None:
+                columns = processed.columns.tolist()
+                time_column = writer.time_column if writer is not None else detect_time_column(chunk)
+            if len(preview) < 10:
+                preview.extend(processed.head(10 - len(preview)).to_dict('records'))
+            for col in columns:
+                dtypes[col] = _merge_dtypes(dtypes.get(col), processed[col].dtype)
+            row_count += len(processed)
+
+            consumption = processed.get('Electricity_Consumption_kWh')
+            if consumption is not None and pd.api.types.is_numeric_dtype(consumption.dtype):
+                total_consumption = (total_consumption or 0.0) + float(consumption.sum())
+
+        if writer is not None and row_count:
+            writer.finish()
+        elif writer is not None:
+            writer.abort()
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    return {
+        'columns': columns or [],
+        'preview': preview,
+        'dtypes': {col: str(dtype) for col, dtype in dtypes.items()},
+        'row_count': row_count,
+        'time_column': time_column,
+        'total_consumption_kwh': total_consumption
+    }
+
+def _ingest_upload(filepath, filename):
+    """Ingest a freshly saved upload and build the JSON response for it"""
+    # Read the CSV file with error handling
+    try:
+        with timed('ingest'):
+            summary = ingest_csv(filepath)
+    except pd.errors.EmptyDataError:
+        return jsonify({'error': 'The uploaded CSV file is empty'}), 400
+    except pd.errors.ParserError:
+        return jsonify({'error': 'Unable to parse the CSV file. Please check the file format'}), 400
+
+    # Check if the file has any rows
+    if summary['row_count'] == 0:
+        return jsonify({'error': 'The uploaded CSV file contains no data'}), 400
+
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        **summary
+    })
+
+DOWNSAMPLING_METHODS = ('lttb', 'minmax')
+
+def _bucket_edges(n, buckets):
+    """Start offsets of `buckets` near-equal contiguous buckets over n points, plus n"""
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+def lttb_indices(x, y, max_points):
+    """
+    Select points with Largest-Triangle-Three-Buckets
+
+    The first and last points are always kept. The rest of the series is split
+    into max_points - 2 buckets and from each bucket the point forming the
+    largest triangle with the previously kept point and the average of the
+    next bucket is kept, which preserves the visual shape including spikes.
+
+    Args:
+        x: 1-D float array of x positions
+        y: 1-D float array of finite y values
+        max_points: Number of points to keep (at least 3)
+
+    Returns:
+        Sorted array of indices into x and y
+    """
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    edges = _bucket_edges(n - 2, max_points - 2) + 1
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+
+    # Averages of every bucket in one pass; the last bucket looks ahead to the final point
+    avg_x = np.append(np.add.reduceat(x[:-1], starts) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], starts) / counts, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def minmax_indices(y, max_points):
+    """
+    Keep the minimum and maximum of each bucket, plus the first and last points
+
+    Args:
+        y: 1-D float array of finite values
+        max_points: Upper bound on the number of points kept
+
+    Returns:
+        Sorted array of indices into y
+    """
+    n = len(y)
+    buckets = max(1, (max_points - 2) // 2)
+    if max_points >= n or buckets >= n:
+        return np.arange(n)
+
+    starts = _bucket_edges(n, buckets)[:-1]
+    bucket_of = np.repeat(np.arange(buckets), np.diff(_bucket_edges(n, buckets)))
+
+    # First position in each bucket that attains the bucket minimum / maximum
+    picks = []
+    for reduced in (np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)):
+        hits = np.flatnonzero(y == reduced[bucket_of])
+        _, first = np.unique(bucket_of[hits], return_index=True)
+        picks.append(hits[first])
+
+    return np.unique(np.concatenate([[0, n - 1], *picks]))
+
+def downsample_indices(x, y, max_points, method='lttb'):
+    """
+    Pick the rows of a series to plot when it has more than max_points points
+
+    Rows whose y value is missing are skipped. When x is numeric it is used
+    as the horizontal position for LTTB, otherwise rows are treated as
+    evenly spaced.
+
+    Args:
+        x: pandas Series of x values
+        y: pandas Series of numeric y values
+        max_points: Maximum number of points to return
+        method: 'lttb' or 'minmax'
+
+    Returns:
+        Sorted array of row positions to keep
+    """
+    values = y.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.flatnonzero(np.isfinite(values))
+    if len(valid) <= max_points:
+        return valid
+
+    if method == 'minmax':
+        keep = minmax_indices(values[valid], max_points)
+    else:
+        if pd.api.types.is_numeric_dtype(x.dtype):
+            positions = x.to_numpy(dtype=np.float64, na_value=np.nan)[valid]
+            if not np.isfinite(positions).all():
+                positions = valid.astype(np.float64)
+        else:
+            positions = valid.astype(np.float64)
+        keep = lttb_indices(positions, values[valid], max_points)
+    return valid[keep]
+
+STATISTICS_QUANTILES = (0.25, 0.5, 0.75)
+
+def compute_statistics(df):
+    """
+    Summary statistics for every numeric column in one vectorized pass
+
+    The numeric columns are stacked into a single column-major 2-D array so
+    each reduction runs once over all columns instead of once per column.
+
+    Args:
+        df: DataFrame to summarise
+
+    Returns:
+        Dict mapping column name to mean, median, std, min, max, q1 and q3
+    """
+    numeric_cols = numeric_column_names(df)
+    if not numeric_cols:
+        return {}
+    values = np.asfortranarray(readings_block(df, numeric_cols))
+
+    # All-NaN columns legitimately produce NaN; silence NumPy's warnings about them
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0, ddof=1)
+        minimum = np.nanmin(values, axis=0)
+        maximum = np.nanmax(values, axis=0)
+        q1, median, q3 = np.nanquantile(values, STATISTICS_QUANTILES, axis=0)
+
+    return _statistics_dict(numeric_cols, mean, median, std, minimum, maximum, q1, q3)
+
+def _statistics_dict(columns, mean, median, std, minimum, maximum, q1, q3):
+    stats = {}
+    for i, col in enumerate(columns):
+        stats[col] = {
+            'mean': float(mean[i]),
+            'median': float(median[i]),
+            'std': float(std[i]),
+            'min': float(minimum[i]),
+            'max': float(maximum[i]),
+            'q1': float(q1[i]),
+            'q3': float(q3[i])
+        }
+    return stats
+
+class MomentAccumulator:
+    """
+    Mergeable per-column count, mean, sum of squared deviations, min and max
+
+    Chunks are reduced with vectorized NumPy and combined with the parallel
+    form of Welford's update (Chan et al.), so partial results computed on
+    different chunks or files merge into exactly the moments of the union.
+    """
+
+    def __init__(self, width):
+        self.count = np.zeros(width)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+
+    def update(self, values):
+        """Fold in a 2-D float array whose columns match this accumulator"""
+        chunk = MomentAccumulator(values.shape[1])
+        valid = ~np.isnan(values)
+        chunk.count = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk.mean = np.where(valid, values, 0.0).sum(axis=0) / chunk.count
+            deviations = np.where(valid, values - chunk.mean, 0.0)
+        chunk.mean = np.nan_to_num(chunk.mean)
+        chunk.m2 = (deviations ** 2).sum(axis=0)
+        chunk.min = np.where(valid, values, np.inf).min(axis=0, initial=np.inf)
+        chunk.max = np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf)
+        self.merge(chunk)
+
+    def merge(self, other):
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(count > 0, other.count / count, 0.0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * weight
+        self.count = count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def std(self, ddof=1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, np.sqrt(self.m2 / (self.count - ddof)), np.nan)
+
+class QuantileSketch:
+    """
+    Mergeable KLL-style quantile sketch for one column
+
+    Items live in a stack of compactors where an item on level h stands for
+    2**h original values. A full level is sorted and every other item is
+    promoted to the level above, so memory stays O(k log n) while rank
+    error stays around 1/k. While nothing has been compacted the sketch
+    holds every value and quantiles are exact.
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._offset = 0
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(self.k * (2 / 3) ** depth), 2)
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # Keep an odd leftover on this level and alternate which half survives
+                keep = items[len(items) % 2:]
+                promoted = keep[self._offset::2]
+                self._offset ^= 1
+                self.levels[level] = items[:len(items) % 2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, qs):
+        values = np.concatenate(self.levels)
+        if not len(values):
+            return np.full(len(qs), np.nan)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, weights = values[order], weights[order]
+        # Rank of the centre of each item, so unit weights reproduce linear interpolation
+        centres = np.cumsum(weights) - (weights + 1) / 2
+        return np.interp(np.asarray(qs) * (weights.sum() - 1), centres, values)
+
+class StatisticsAccumulator:
+    """
+    Mergeable state for the statistics analysis over a fixed set of columns
+
+    Means, standard deviations, minima and maxima are exact; quantiles come
+    from a QuantileSketch per column and are exact until the sketch compacts.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.moments = MomentAccumulator(len(self.columns))
+        self.sketches = [QuantileSketch() for _ in self.columns]
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(numeric_column_names(df))
+
+    def update(self, df):
+        values = _numeric_block(df, self.columns)
+        self.moments.update(values)
+        for i, sketch in enumerate(self.sketches):
+            sketch.update(values[:, i])
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        for sketch, other_sketch in zip(self.sketches, other.sketches):
+            sketch.merge(other_sketch)
+
+    def result(self):
+        quantiles = np.array([sketch.quantiles(STATISTICS_QUANTILES) for sketch in self.sketches]).reshape(-1, 3)
+        empty = self.moments.count == 0
+        mean = np.where(empty, np.nan, self.moments.mean)
+        minimum = np.where(empty, np.nan, self.moments.min)
+        maximum = np.where(empty, np.nan, self.moments.max)
+        return _statistics_dict(self.columns, mean, quantiles[:, 1], self.moments.std(),
+                                minimum, maximum, quantiles[:, 0], quantiles[:, 2])
+
+def _numeric_block(df, columns):
+    """Columns of a chunk as a 2-D float array, coercing stray text to NaN"""
+    block = np.empty((len(df), len(columns)))
+    for i, col in enumerate(columns):
+        series = df[col]
+        if not pd.api.types.is_numeric_dtype(series.dtype):
+            series = pd.to_numeric(series, errors='coerce')
+        block[:, i] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return block
+
+class _FileSlice(io.RawIOBase):
+    """Read-only view of the next `remaining` bytes of an open binary file"""
+
+    def __init__(self, f, remaining):
+        self._f = f
+        self._remaining = remaining
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._f.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+class IncrementalScan:
+    """
+    Per-file accumulator state for CSVs that grow by appending rows
+
+    The first request folds the whole file into a fresh accumulator chunk by
+    chunk. Later requests only parse the bytes appended since then, provided
+    the start of the file and the bytes just before the old end are
+    unchanged; any other change rebuilds the state from scratch.
+
+    Accumulators are created with factory(first_chunk) and must provide
+    update(chunk) and merge(other).
+    """
+
+    FINGERPRINT_BYTES = 64 * 1024
+
+    def __init__(self, factory, max_files=32):
+        self.factory = factory
+        self.max_files = max_files
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._file_locks = {}  # path -> [lock, threads using it], only while a scan is pending
+
+    @classmethod
+    def _fingerprint(cls, filepath, size):
+        with open(filepath, 'rb') as f:
+            head = f.read(min(size, cls.FINGERPRINT_BYTES))
+            f.seek(max(size - 4096, 0))
+            tail = f.read(min(size, 4096))
+        return hashlib.sha1(head + tail).hexdigest()
+
+    def get(self, filepath, chunk_rows=None, progress=None):
+        """
+        Return the accumulator for filepath, folding in any appended rows
+
+        Args:
+            progress: Optional callable receiving the fraction of the new
+                bytes parsed so far
+
+        Returns:
+            The accumulator, or None if the file has no rows
+        """
+        path = os.path.abspath(filepath)
+        with self._lock:
+            file_lock = self._file_locks.setdefault(path, [threading.Lock(), 0])
+            file_lock[1] += 1
+
+        try:
+            with file_lock[0], timed('scan'):
+                return self._fold(path, filepath, chunk_rows or app.config['INGEST_CHUNK_ROWS'], progress)
+        finally:
+            # The last thread out drops the lock, so files scanned once do not accumulate
+            with self._lock:
+                file_lock[1] -= 1
+                if not file_lock[1]:
+                    del self._file_locks[path]
+
+    def _fold(self, path, filepath, chunk_rows, progress):
+        """Bring the state of path up to date; the caller holds its file lock"""
+        mtime_ns, size = DatasetCache.signature(filepath)
+        with self._lock:
+            state = self._states.get(path)
+
+        if state is not None and state['signature'] == (mtime_ns, size):
+            return state['accumulator']
+
+        resumable = (
+            state is not None and state['ends_with_newline'] and size > state['size'] and
+            self._fingerprint(filepath, state['size']) == state['fingerprint']
+        )
+        with open(filepath, 'rb') as f:
+            offset = state['size'] if resumable else 0
+            if resumable:
+                f.seek(state['size'])
+                reader = pd.read_csv(io.BufferedReader(_FileSlice(f, size - state['size'])),
+                                     header=None, names=state['columns'], chunksize=chunk_rows)
+                accumulator = state['accumulator']
+                columns = state['columns']
+            else:
+                reader = pd.read_csv(io.BufferedReader(_FileSlice(f, size)), chunksize=chunk_rows)
+                accumulator = None
+                columns = None
+            try:
+                for chunk in reader:
+                    if accumulator is None:
+                        accumulator = self.factory(chunk)
+                        columns = chunk.columns.tolist()
+                    accumulator.update(chunk)
+                    count_rows(len(chunk))
+                    if progress is not None:
+                        progress((f.tell() - offset) / max(size - offset, 1))
+            except pd.errors.EmptyDataError:
+                pass
+
+            f.seek(max(size - 1, 0))
+            ends_with_newline = f.read(1) == b'\n'
+
+        with self._lock:
+            self._states[path] = {
+                'signature': (mtime_ns, size),
+                'size': size,
+                'fingerprint': self._fingerprint(filepath, size),
+                'ends_with_newline': ends_with_newline,
+                'columns': columns,
+                'accumulator': accumulator
+            }
+            self._states.move_to_end(path)
+            while len(self._states) > self.max_files:
+                self._states.popitem(last=False)
+        return accumulator
+
+    def invalidate(self, filepath):
+        with self._lock:
+            self._states.pop(os.path.abspath(filepath), None)
+
+class CorrelationAccumulator:
+    """
+    Mergeable co-moment sums for a pairwise-complete correlation matrix
+
+    For every column pair (i, j) it keeps, over the rows where both values
+    are present, the count and the sums of x_i, x_i**2 and x_i * x_j. Each
+    chunk costs one matrix product per sum, i.e. O(rows x cols**2). Values
+    are shifted by a per-column reference (the first chunk's mean) before
+    summing to avoid catastrophic cancellation.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.shift = None
+        self.n = np.zeros((width, width))
+        self.sx = np.zeros((width, width))   # sum of x_i where x_j is also present
+        self.sxx = np.zeros((width, width))  # sum of x_i**2 where x_j is also present
+        self.sxy = np.zeros((width, width))  # sum of x_i * x_j
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(numeric_column_names(df))
+
+    def update(self, df):
+        values = _numeric_block(df, self.columns)
+        present = ~np.isnan(values)
+        if self.shift is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                self.shift = np.nan_to_num(np.nanmean(values, axis=0))
+        mask = present.astype(np.float64)
+        centred = np.where(present, values - self.shift, 0.0)
+        self.n += mask.T @ mask
+        self.sx += centred.T @ mask
+        self.sxx += (centred ** 2).T @ mask
+        self.sxy += centred.T @ centred
+
+    def _reshift(self, shift):
+        """Re-express the sums relative to a different shift vector"""
+        d = (self.shift - shift)[:, None]
+        self.sxy = self.sxy + d * self.sx.T + d.T * self.sx + d * d.T * self.n
+        self.sxx = self.sxx + 2 * d * self.sx + d ** 2 * self.n
+        self.sx = self.sx + d * self.n
+        self.shift = shift
+
+    def _reindex(self, columns):
+        """Accumulator over `columns`, with zero counts for columns not seen here"""
+        result = CorrelationAccumulator(columns)
+        result.shift = np.zeros(len(columns))
+        positions = {col: i for i, col in enumerate(columns)}
+        idx = np.array([positions[col] for col in self.columns], dtype=np.int64)
+        if self.shift is not None:
+            result.shift[idx] = self.shift
+            grid = np.ix_(idx, idx)
+            for name in ('n', 'sx', 'sxx', 'sxy'):
+                getattr(result, name)[grid] = getattr(self, name)
+        return result
+
+    def merge(self, other):
+        """Fold another accumulator's sums into this one; other is not modified"""
+        if other.shift is None:
+            return
+        if self.shift is None:
+            self.__dict__.update(other._reindex(other.columns).__dict__)
+            return
+
+        columns = self.columns + [col for col in other.columns if col not in self.columns]
+        if columns != self.columns:
+            new_columns = columns[len(self.columns):]
+            self.__dict__.update(self._reindex(columns).__dict__)
+            # Columns we have no rows for can take the other side's shift for free
+            for col in new_columns:
+                self.shift[columns.index(col)] = other.shift[other.columns.index(col)]
+
+        other = other._reindex(columns)
+        other._reshift(self.shift)
+        self.n = self.n + other.n
+        self.sx = self.sx + other.sx
+        self.sxx = self.sxx + other.sxx
+        self.sxy = self.sxy + other.sxy
+
+    @classmethod
+    def combine(cls, accumulators):
+        """Merge several accumulators into a new one, leaving them untouched"""
+        result = cls([])
+        for accumulator in accumulators:
+            if accumulator is not None:
+                result.merge(accumulator)
+        return result
+
+    def correlation(self):
+        """Pearson correlation matrix as a DataFrame; NaN where undefined"""
+        sy, syy = self.sx.T, self.sxx.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = self.n * self.sxy - self.sx * sy
+            var_x = self.n * self.sxx - self.sx ** 2
+            var_y = self.n * syy - sy ** 2
+            corr = cov / np.sqrt(var_x * var_y)
+        corr = np.where((self.n >= 2) & (var_x > 0) & (var_y > 0), np.clip(corr, -1.0, 1.0), np.nan)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+def correlation_dict(corr_matrix):
+    """Round a correlation matrix and shape it the way the frontend renders it"""
+    corr_matrix = corr_matrix.round(3)
+    corr_dict = {}
+    for col in corr_matrix.columns:
+        corr_dict[col] = corr_matrix[col].to_dict()
+    return corr_dict
+
+statistics_scan = IncrementalScan(StatisticsAccumulator.from_frame)
+correlation_scan = IncrementalScan(CorrelationAccumulator.from_frame)
+
+# Analyses that switch to chunked accumulators for files above STREAMING_ANALYSIS_BYTES
+STREAMING_ANALYSES = ('statistics', 'correlation')
+
+def time_order(timestamps):
+    """Stable permutation sorting rows by time, rows without a timestamp last"""
+    keys = np.where(timestamps == NAT_INT64, np.iinfo(np.int64).max, timestamps)
+    return np.argsort(keys, kind='stable')
+
+def compute_trends(df, order=None):
+    """
+    Linear trend of every numeric column from one batched least-squares solve
+
+    Rows are taken in `order` and regressed on their position. The normal
+    equations of all columns are formed with a few matrix reductions, each
+    column using only its non-missing rows.
+
     Args:
-        df: DataFrame containing electricity meter data
-    
+        df: DataFrame to analyse
+        order: Optional row permutation, e.g. from time_order()
+
     Returns:
-        DataFrame with processed data
+        Dict mapping column name to trend, slope, intercept and trend_strength
     """
-    # Make a copy to avoid modifying the original
-    result_df = df.copy()
-    
-    # Check if we have consumption data directly
-    if 'Electricity_Consumption_kWh' not in df.columns:
-        if '3_Phase_Active_Power' in df.columns:
-            # Calculate consumption from 3-phase active power (kW to kWh conversion)
-            # Assuming the data is hourly, we divide by 1000 to convert W to kW
-            result_df['Electricity_Consumption_kWh'] = df['3_Phase_Active_Power'] / 1000
-        elif all(f'{phase}_Phase_Active_Power' in df.columns for phase in ['R', 'Y', 'B']):
-            # Sum the three phases to get total consumption
-            result_df['Electricity_Consumption_kWh'] = (
-                df['R_Phase_Active_Power'] + 
-                df['Y_Phase_Active_Power'] + 
-                df['B_Phase_Active_Power']
-            ) / 1000  # Convert W to kW
-    
-    return result_df
+    numeric_cols = numeric_column_names(df)
+    if not numeric_cols:
+        return {}
+    x = np.arange(len(df), dtype=np.float64)[:, None]
+    fits = []
+    for group in column_groups(len(df), numeric_cols):
+        y = readings_block(df, numeric_cols[group])
+        if order is not None:
+            y = y[order]
+        valid = ~np.isnan(y)
+        xv = np.where(valid, x, 0.0)
+        yv = np.where(valid, y, 0.0)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+        n = valid.sum(axis=0)
+        sx, sy = xv.sum(axis=0), yv.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x, mean_y = sx / n, sy / n
+            sxx = ((xv - mean_x) ** 2 * valid).sum(axis=0)
+            sxy = ((xv - mean_x) * (yv - mean_y) * valid).sum(axis=0)
+            slope = sxy / sxx
+            intercept = mean_y - slope * mean_x
+            std = np.sqrt(((yv - mean_y) ** 2 * valid).sum(axis=0) / (n - 1))
+        fits.append((n, slope, intercept, std))
+    n, slope, intercept, std = (np.concatenate(parts) for parts in zip(*fits))
+
+    patterns = {}
+    for i, col in enumerate(numeric_cols):
+        if n[i] < 2:
+            patterns[col] = {
+                'trend': 'unknown',
+                'error': 'Not enough values to fit a trend'
+            }
+            continue
+        s = float(slope[i])
+        patterns[col] = {
+            'trend': 'increasing' if s > 0.01 else 'decreasing' if s < -0.01 else 'stable',
+            'slope': s,
+            'intercept': float(intercept[i]),
+            'trend_strength': abs(s) / float(std[i]) if std[i] > 0 else 0
+        }
+    return patterns
+
+NS_PER_HOUR = 3600 * 10 ** 9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+class RollupPyramid:
+    """
+    Pre-aggregated sum, count, min and max per column at several time grains
+
+    Hourly buckets are built from the raw rows; each coarser level is built
+    from the level below it, so the whole pyramid costs one sort of the
+    timestamps plus a few reduceat passes. Queries only slice the
+    precomputed arrays of one level.
+    """
+
+    LEVELS = ('hour', 'day', 'week', 'month')
+    FIELDS = ('sum', 'count', 'min', 'max')
+    LABEL_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
+
+    def __init__(self, columns, levels):
+        self.columns = list(columns)
+        self.levels = levels  # level -> {'period': int64 ns, 'sum'/'count'/'min'/'max': (periods, columns)}
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for level in self.levels.values() for array in level.values())
+
+    @staticmethod
+    def _period_starts(level, keys):
+        """Start of the period of each (sorted) int64 ns timestamp"""
+        if level == 'hour':
+            return keys - keys % NS_PER_HOUR
+        if level == 'day':
+            return keys - keys % NS_PER_DAY
+        if level == 'week':
+            days = keys // NS_PER_DAY
+            # 1970-01-01 was a Thursday; weeks start on Monday
+            return (days - (days + 3) % 7) * NS_PER_DAY
+        months = keys.view('datetime64[ns]').astype('datetime64[M]')
+        return months.astype('datetime64[ns]').view(np.int64)
+
+    @classmethod
+    def _reduce(cls, periods, sums, counts, mins, maxs):
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        return {
+            'period': periods[starts],
+            'sum': np.add.reduceat(sums, starts, axis=0),
+            'count': np.add.reduceat(counts, starts, axis=0),
+            'min': np.fmin.reduceat(mins, starts, axis=0),
+            'max': np.fmax.reduceat(maxs, starts, axis=0)
+        }
+
+    @classmethod
+    def build(cls, timestamps, df, columns):
+        """
+        Args:
+            timestamps: int64 ns timestamps, NAT_INT64 for rows to skip
+            df: DataFrame with the rows of timestamps
+            columns: Numeric columns of df to aggregate, a column_groups()
+                slice at a time
+        """
+        rows = np.flatnonzero(timestamps != NAT_INT64)
+        rows = rows[np.argsort(timestamps[rows], kind='stable')]
+        hours = cls._period_starts('hour', timestamps[rows])
+
+        levels = {}
+        if len(rows):
+            parts = []
+            for group in column_groups(len(df), columns):
+                values = readings_block(df, columns[group])[rows]
+                present = ~np.isnan(values)
+                parts.append(cls._reduce(hours, np.where(present, values, 0.0), present.astype(np.int64),
+                                         values, values))
+            hourly = {field: np.concatenate([part[field] for part in parts], axis=1) for field in cls.FIELDS}
+            hourly['period'] = parts[0]['period']
+            levels['hour'] = hourly
+            levels['day'] = cls._reduce(cls._period_starts('day', hourly['period']),
+                                        hourly['sum'], hourly['count'], hourly['min'], hourly['max'])
+            day = levels['day']
+            for level in ('week', 'month'):
+                levels[level] = cls._reduce(cls._period_starts(level, day['period']),
+                                            day['sum'], day['count'], day['min'], day['max'])
+        else:
+            width = len(columns)
+            empty = {'period': np.empty(0, dtype=np.int64)}
+            empty.update({field: np.empty((0, width)) for field in cls.FIELDS})
+            levels = {level: empty for level in cls.LEVELS}
+        return cls(columns, levels)
+
+    def save(self, path):
+        arrays = {f'{level}_{field}': array for level, data in self.levels.items() for field, array in data.items()}
+        partial = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}.npz'
+        np.savez(partial, columns=np.array(self.columns, dtype=str), **arrays)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            levels = {level: {field: data[f'{level}_{field}'] for field in ('period',) + cls.FIELDS}
+                      for level in cls.LEVELS}
+            return cls(data['columns'].tolist(), levels)
+
+    def query(self, granularity, start=None, end=None):
+        """
+        Aggregates of one level for periods starting in [start, end)
+
+        Args:
+            granularity: One of LEVELS
+            start, end: Optional int64 ns bounds
+
+        Returns:
+            Dict with period labels and, per column, sum/mean/min/max/count lists
+        """
+        level = self.levels[granularity]
+        periods = level['period']
+        lo = np.searchsorted(periods, start, side='left') if start is not None else 0
+        hi = np.searchsorted(periods, end, side='left') if end is not None else len(periods)
+        window = slice(lo, hi)
+
+        sums, counts = level['sum'][window], level['count'][window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        labels = pd.DatetimeIndex(periods[window].view('datetime64[ns]')).strftime(self.LABEL_FORMATS[granularity]).tolist()
+
+        aggregates = {}
+        for i, col in enumerate(self.columns):
+            aggregates[col] = {
+                'sum': sums[:, i].tolist(),
+                'mean': means[:, i].tolist(),
+                'min': level['min'][window, i].tolist(),
+                'max': level['max'][window, i].tolist(),
+                'count': counts[:, i].tolist()
+            }
+        return {'periods': labels, 'means': means, 'aggregates': aggregates}
+
+# Cache key under which a dataset's rollup pyramid is kept
+ROLLUP = '__rollup__'
+
+def _read_rollups(filepath, columns=None):
+    """Load the persisted rollup pyramid of a dataset, building and saving it on first use"""
+    schema = read_columnar_schema(filepath)
+    rollup_file = os.path.join(columnar_path(filepath), 'rollup.npz')
+    if schema is not None and os.path.exists(rollup_file):
+        try:
+            return RollupPyramid.load(rollup_file)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    time_col, timestamps = dataset_time_index(filepath)
+    if time_col is None:
+        return None
+    df = load_dataset(filepath, numeric_columns(filepath))
+    numeric_cols = [col for col in numeric_column_names(df) if col != time_col]
+    pyramid = RollupPyramid.build(timestamps, df, numeric_cols)
+
+    if schema is not None:
+        try:
+            pyramid.save(rollup_file)
+        except OSError as e:
+            app.logger.warning('Could not save rollups for %s: %s', filepath, e)
+    return pyramid
+
+class _NoRollup:
+    nbytes = 0
+
+def dataset_rollups(filepath):
+    """Rollup pyramid of a dataset, or None if it has no timestamp column"""
+    with timed('load'):
+        pyramid = dataset_cache.get(filepath, lambda path, columns: _read_rollups(path) or _NoRollup(), [ROLLUP])
+    return None if isinstance(pyramid, _NoRollup) else pyramid
+
+def _parse_time_bound(value):
+    """Parse an optional start/end parameter to int64 ns"""
+    if value in (None, ''):
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+    return timestamp.as_unit('ns').value
+
+ANOMALY_METHODS = ('zscore', 'rolling_zscore', 'mad', 'ewma')
+ANOMALY_PAGE_LIMIT = 500
+ANOMALY_MAX_PAGE_LIMIT = 10000
+
+# Scale factor turning a median absolute deviation into a normal-consistent sigma
+MAD_TO_SIGMA = 1.4826
+
+class StreamingAnomalyDetector:
+    """
+    Online EWMA z-score detector, O(1) work per reading and column
+
+    Each reading is compared with the exponentially weighted mean and
+    variance of the readings before it, then folded into them. Missing
+    values are skipped. Readings are only flagged once a column has seen
+    `warmup` values.
+    """
+
+    def __init__(self, width, alpha=0.05, threshold=3.0, warmup=30):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.count = np.zeros(width, dtype=np.int64)
+        self.mean = np.zeros(width)
+        self.var = np.zeros(width)
+
+    def update(self, values):
+        """
+        Score a batch of readings and fold them into the running state
+
+        Args:
+            values: 2-D float array, one row per reading, one column per signal
+
+        Returns:
+            (flags, lower, upper) arrays shaped like values
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        ready, lower, upper, (self.count, self.mean, self.var) = _ewma_bounds(
+            values, self.alpha, self.threshold, self.warmup, (self.count, self.mean, self.var))
+        with np.errstate(invalid='ignore'):
+            flags = ready & ((values < lower) | (values > upper))
+        return flags, lower, upper
+
+def _ewma_bounds(values, alpha, threshold, warmup, state=None):
+    """
+    EWMA bounds of each reading from the readings before it, as computed
+    by StreamingAnomalyDetector
+
+    Both EWMA recursions are linear filters, so pandas' ewm(adjust=False)
+    evaluates them for all columns without a Python loop over rows. Each
+    is seeded with the state carried over from earlier readings.
+
+    Args:
+        values: 2-D float array, one row per reading
+        state: (count, mean, var) per column before values; none seen by default
+
+    Returns:
+        (ready, lower, upper, state after values)
+    """
+    width = values.shape[1]
+    count, mean, var = state if state is not None else (np.zeros(width, dtype=np.int64), np.zeros(width),
+                                                        np.zeros(width))
+    valid = ~np.isnan(values)
+    seeded = count > 0
+
+    def ewm(start, rows):
+        # Row 0 is the state before values; NaN where there is none yet
+        stacked = np.vstack([np.where(seeded, start, np.nan), rows])
+        return pd.DataFrame(stacked).ewm(alpha=alpha, adjust=False, ignore_na=True).mean().to_numpy()
+
+    means = ewm(mean, values)
+    prev_mean = means[:-1]
+    # With u_t = (1 - a) * (x_t - m_{t-1})**2 the variance recursion is an EWMA of u
+    with np.errstate(invalid='ignore'):
+        increments = np.where(np.isnan(prev_mean), 0.0, (1 - alpha) * (values - prev_mean) ** 2)
+    increments[~valid] = np.nan
+    variances = ewm(var, increments)
+    spread = threshold * np.sqrt(variances[:-1])
+
+    seen = count + np.cumsum(valid, axis=0) - valid
+    state = (count + valid.sum(axis=0), np.nan_to_num(means[-1]), np.nan_to_num(variances[-1]))
+    return valid & (seen >= warmup), prev_mean - spread, prev_mean + spread, state
+
+def anomaly_bounds(df, method='zscore', window=30, threshold=3.0, alpha=0.05, order=None, columns=None):
+    """
+    Lower and upper anomaly bounds for every numeric column at once
+
+    Methods:
+        zscore: mean +/- threshold * std of the whole column
+        rolling_zscore: the same over the `window` readings before each one
+        mad: median +/- threshold * scaled MAD over a centred window, which
+            is robust to the spikes it is looking for
+        ewma: exponentially weighted mean/std of the readings before each
+            one, identical to StreamingAnomalyDetector; readings are only
+            flagged after window // 2 of them, like the rolling methods
+
+    The windowed methods take the readings in `order` (e.g. from
+    time_order()), or in file order when it is None. `columns` limits
+    them to some numeric columns; all of them by default.
+
+    Returns:
+        (columns, values, lower, upper, eligible) where the last four are
+        2-D arrays of shape (rows, columns), in file order
+    """
+    if columns is None:
+        columns = numeric_column_names(df)
+    values = readings_block(df, columns)
+    if method == 'zscore' or (order is not None and (np.diff(order) > 0).all()):
+        order = None
+    ordered = values[order] if order is not None else values
+    frame = pd.DataFrame(ordered, columns=columns, copy=False)
+    eligible = ~np.isnan(ordered)
+
+    if method == 'zscore':
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean = np.nanmean(values, axis=0)
+            std = np.nanstd(values, axis=0, ddof=1)
+        lower = np.broadcast_to(mean - threshold * std, values.shape)
+        upper = np.broadcast_to(mean + threshold * std, values.shape)
+    elif method == 'rolling_zscore':
+        # Trailing window that excludes the reading being tested
+        rolling = frame.rolling(window, min_periods=max(window // 2, 2), closed='left')
+        mean, std = rolling.mean().to_numpy(), rolling.std().to_numpy()
+        lower, upper = mean - threshold * std, mean + threshold * std
+    elif method == 'mad':
+        rolling_median = frame.rolling(window, min_periods=max(window // 2, 2), center=True).median()
+        # Median of the deviations from each point's local median approximates the windowed MAD
+        mad = (frame - rolling_median).abs().rolling(window, min_periods=max(window // 2, 2), center=True).median()
+        spread = threshold * MAD_TO_SIGMA * mad.to_numpy()
+        lower, upper = rolling_median.to_numpy() - spread, rolling_median.to_numpy() + spread
+    elif method == 'ewma':
+        eligible, lower, upper, _ = _ewma_bounds(ordered, alpha, threshold, max(window // 2, 2))
+    else:
+        raise ValueError(f'Unknown anomaly detection method: {method}')
+
+    if order is not None:
+        # Back from time order to file rows
+        restored = []
+        for array in (lower, upper, eligible):
+            unsorted = np.empty_like(array)
+            unsorted[order] = array
+            restored.append(unsorted)
+        lower, upper, eligible = restored
+    return columns, values, lower, upper, eligible
+
+def _encode_cursor(position):
+    return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+def _decode_cursor(cursor):
+    if not isinstance(cursor, str):
+        raise ValueError('Invalid cursor')
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def detect_anomalies(df, method='zscore', window=30, threshold=3.0, limit=ANOMALY_PAGE_LIMIT, cursor=None,
+                     order=None):
+    """
+    Find every anomaly in all numeric columns and return one page of them
+
+    Windowed methods score the readings in `order` (see anomaly_bounds()).
+    Anomalies are ordered by file row and then column. The cursor is an opaque
+    token for the first anomaly of the next page, so pages stay stable and
+    cost the same wherever they start. The columns are scored a
+    column_groups() slice at a time, keeping only their anomalies.
+
+    Returns:
+        (anomalies, pagination) where anomalies maps each column with at
+        least one anomaly to its total count and this page's rows
+    """
+    columns = numeric_column_names(df)
+    found = []  # per group: keys, values, lower and upper bounds of its anomalies
+    column_bounds = np.full((2, len(columns)), np.nan)
+    for group in column_groups(len(df), columns):
+        _, values, lower, upper, eligible = anomaly_bounds(df, method, window, threshold, order=order,
+                                                           columns=columns[group])
+        with np.errstate(invalid='ignore'):
+            mask = eligible & ((values < lower) | (values > upper))
+        rows, cols = np.nonzero(mask)
+        found.append((rows * len(columns) + cols + group.start, values[rows, cols], lower[rows, cols],
+                      upper[rows, cols]))
+        if method == 'zscore' and len(values):
+            column_bounds[:, group] = lower[0], upper[0]
+
+    keys, values, lower, upper = (np.concatenate(parts) for parts in zip(*found))
+    # Groups are column slices, so restore row-then-column order
+    ranked = np.argsort(keys, kind='stable')
+    keys, values, lower, upper = keys[ranked], values[ranked], lower[ranked], upper[ranked]
+    rows, cols = np.divmod(keys, len(columns)) if columns else (keys, keys)
+    start = np.searchsorted(keys, _decode_cursor(cursor)) if cursor else 0
+    page = slice(start, start + limit)
+    page_cols = cols[page]
+    counts = np.bincount(cols, minlength=len(columns))
+
+    anomalies = {}
+    for i, col in enumerate(columns):
+        if not counts[i]:
+            continue
+        in_page = start + np.flatnonzero(page_cols == i)
+        entry = {
+            'count': int(counts[i]),
+            'indices': rows[in_page].tolist(),
+            'values': values[in_page].tolist(),
+            'lower_bounds': lower[in_page].tolist(),
+            'upper_bounds': upper[in_page].tolist()
+        }
+        if method == 'zscore':
+            entry['lower_bound'] = float(column_bounds[0, i])
+            entry['upper_bound'] = float(column_bounds[1, i])
+        anomalies[col] = entry
+
+    end = start + len(page_cols)
+    pagination = {
+        'total': int(len(keys)),
+        'returned': int(len(page_cols)),
+        'limit': limit,
+        'next_cursor': _encode_cursor(int(keys[end])) if end < len(keys) else None
+    }
+    return anomalies, pagination
+
+CONSUMPTION_COLUMN = 'Electricity_Consumption_kWh'
+BILLING_PERIODS = ('day', 'week', 'month', 'all')
+
+# Maharashtra residential tariff, used when a bill names no tariff of its own
+DEFAULT_TARIFF = {
+    'name': 'Residential',
+    'slabs': [
+        {'up_to': 100, 'rate': 3.05},
+        {'up_to': 300, 'rate': 6.40},
+        {'up_to': 500, 'rate': 8.50},
+        {'up_to': None, 'rate': 9.50}
+    ],
+    'fixed_charges': [{'name': 'Fixed Charge', 'amount': 90.0}]
+}
+
+def _minute_of_day(value):
+    """Parse a window bound given as an hour (9, 17.5) or 'HH:MM' to minutes"""
+    if isinstance(value, str):
+        hours, _, minutes = value.partition(':')
+        minute = int(hours) * 60 + int(minutes or 0)
+    else:
+        minute = int(round(float(value) * 60))
+    if not 0 <= minute <= 24 * 60:
+        raise ValueError(f'Time of day out of range: {value}')
+    return minute % (24 * 60)
+
+class Tariff:
+    """
+    Declarative electricity tariff
+
+    Defined by a dict such as:
+
+        {"name": "Residential",
+         "slabs": [{"up_to": 100, "rate": 3.05}, {"up_to": null, "rate": 9.50}],
+         "time_of_use": [{"name": "Peak", "start": "09:00", "end": "17:00", "rate": 8.0}],
+         "rate": 3.0,
+         "fixed_charges": [{"name": "Fixed Charge", "amount": 90.0}]}
+
+    Consumption inside a time-of-use window is charged at that window's
+    rate. All other consumption of a billing period is charged through the
+    slabs, each applied to the units falling between the previous slab's
+    limit and its own, or at the flat rate when there are no slabs. Fixed
+    charges apply once per billing period.
+    """
+
+    def __init__(self, name, rate, slabs, windows, fixed_charges):
+        self.name = name
+        self.rate = rate
+        self.slabs = slabs  # [(lower, upper or inf, rate)]
+        self.windows = windows  # [(name, start minute, end minute, rate)]
+        self.fixed_charges = fixed_charges  # [(name, amount)]
+
+        # Window of each minute of the day; len(windows) means outside every window
+        self.minute_window = np.full(24 * 60, len(windows), dtype=np.intp)
+        for i, (window_name, start, end, _) in enumerate(windows):
+            minutes = np.arange(start, end) if start < end else np.r_[np.arange(start, 24 * 60), np.arange(end)]
+            if (self.minute_window[minutes] != len(windows)).any():
+                raise ValueError(f'Time-of-use window {window_name} overlaps another window')
+            self.minute_window[minutes] = i
+
+    @classmethod
+    def from_dict(cls, definition):
+        """
+        Raises:
+            ValueError: If the definition is incomplete or inconsistent
+        """
+        if not isinstance(definition, dict):
+            raise ValueError('tariff must be an object')
+        try:
+            rate = definition.get('rate')
+            rate = float(rate) if rate is not None else None
+
+            slabs = []
+            lower = 0.0
+            for slab in definition.get('slabs') or []:
+                upper = slab.get('up_to')
+                upper = float(upper) if upper is not None else np.inf
+                if upper <= lower:
+                    raise ValueError('Slab limits must increase')
+                slabs.append((lower, upper, float(slab['rate'])))
+                lower = upper
+            if slabs and slabs[-1][1] != np.inf:
+                raise ValueError('The last slab must have no up_to limit')
+
+            windows = []
+            for i, window in enumerate(definition.get('time_of_use') or []):
+                start, end = _minute_of_day(window['start']), _minute_of_day(window['end'])
+                if start == end:
+                    raise ValueError('A time-of-use window must not be empty')
+                windows.append((window.get('name') or f'Window {i + 1}', start, end, float(window['rate'])))
+
+            fixed_charges = [(charge.get('name') or 'Fixed Charge', float(charge['amount']))
+                             for charge in definition.get('fixed_charges') or []]
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f'Invalid tariff definition: {e}')
+
+        if not slabs and rate is None:
+            raise ValueError('A tariff needs slabs or a flat rate')
+        return cls(definition.get('name') or 'Custom', rate, slabs, windows, fixed_charges)
+
+    @staticmethod
+    def _clock(minute):
+        return f'{minute // 60:02d}:{minute % 60:02d}'
+
+    def energy_lines(self):
+        """Names and rates of the energy charge lines, in bill order"""
+        lines = [(f'{name} ({self._clock(start)}-{self._clock(end)})', rate)
+                 for name, start, end, rate in self.windows]
+        suffix = ', other hours' if self.windows else ''
+        if self.slabs:
+            for lower, upper, rate in self.slabs:
+                if upper == np.inf:
+                    units = f'{lower + 1:g}+ units'
+                else:
+                    units = f'{lower + 1 if lower else 0:g}-{upper:g} units'
+                lines.append((f'Energy Charge ({units}{suffix})', rate))
+        else:
+            lines.append(('Energy Charge (other hours)' if self.windows else 'Energy Charge', self.rate))
+        return lines
+
+    def describe(self, period='month'):
+        """Rows describing the tariff, as printed on a bill"""
+        rows = [['Tariff Category:', self.name]]
+        rows += [[f'{name}:', f'₹{rate:.2f}/unit'] for name, rate in self.energy_lines()]
+        per = 'bill' if period == 'all' else period
+        rows += [[f'{name}:', f'₹{amount:.2f}/{per}'] for name, amount in self.fixed_charges]
+        return rows
+
+    def charge(self, timestamps, kwh, period='month'):
+        """
+        Bill consumption readings per billing period
+
+        Readings are binned into periods and time-of-use windows with one
+        sort and a bincount, and the slabs of every period are applied at
+        once with a clip and a matrix product.
+
+        Args:
+            timestamps: int64 ns timestamps, NAT_INT64 for readings to skip
+            kwh: Consumption of each reading; NaN readings are skipped
+            period: One of BILLING_PERIODS
+
+        Returns:
+            Dict with a breakdown per period, totals and the readings skipped
+        """
+        keep = (timestamps != NAT_INT64) & ~np.isnan(kwh)
+        order = np.argsort(timestamps[keep], kind='stable')
+        timestamps, kwh = timestamps[keep][order], kwh[keep][order]
+
+        if period == 'all':
+            starts = np.zeros(len(timestamps), dtype=np.int64)
+        else:
+            starts = RollupPyramid._period_starts(period, timestamps)
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]]) if len(starts) else np.empty(0, dtype=np.intp)
+        last = np.r_[first[1:], len(starts)] - 1
+        period_of = np.cumsum(np.r_[True, starts[1:] != starts[:-1]]) - 1 if len(starts) else starts
+
+        # kWh per (period, window); the last column is consumption outside every window
+        slots = len(self.windows) + 1
+        minutes = (timestamps // (60 * 10 ** 9)) % (24 * 60)
+        binned = np.bincount(period_of * slots + self.minute_window[minutes],
+                             weights=kwh, minlength=len(first) * slots).reshape(len(first), slots)
+        window_units, base_units = binned[:, :-1], binned[:, -1]
+
+        if self.slabs:
+            lower, upper, rates = (np.array(values) for values in zip(*self.slabs))
+            base_lines = np.clip(base_units[:, None] - lower, 0, upper - lower)
+            base_rates = rates
+        else:
+            base_lines = base_units[:, None]
+            base_rates = np.array([self.rate])
+        units = np.hstack([window_units, base_lines])
+        line_rates = np.r_[[rate for *_, rate in self.windows], base_rates]
+        amounts = units * line_rates
+
+        days = timestamps // NS_PER_DAY
+        billing_days = np.add.reduceat(np.r_[True, days[1:] != days[:-1]], first) if len(first) else first
+        fixed = sum(amount for _, amount in self.fixed_charges)
+        line_names = [name for name, _ in self.energy_lines()]
+
+        def dates(rows):
+            return pd.DatetimeIndex(timestamps[rows].view('datetime64[ns]')).strftime('%Y-%m-%d')
+        start_dates, end_dates = dates(first), dates(last)
+        if period == 'all':
+            labels = [f'{start} to {end}' for start, end in zip(start_dates, end_dates)]
+        else:
+            labels = pd.DatetimeIndex(starts[first].view('datetime64[ns]')).strftime(
+                RollupPyramid.LABEL_FORMATS[period])
+
+        periods = []
+        for p in range(len(first)):
+            energy = float(amounts[p].sum())
+            periods.append({
+                'period': labels[p],
+                'start': start_dates[p],
+                'end': end_dates[p],
+                'billing_days': int(billing_days[p]),
+                'readings': int(last[p] - first[p] + 1),
+                'consumption_kwh': round(float(binned[p].sum()), 3),
+                'energy': [{'name': name, 'units': round(float(units[p, i]), 3), 'rate': float(line_rates[i]),
+                            'amount': round(float(amounts[p, i]), 2)}
+                           for i, name in enumerate(line_names)],
+                'energy_charges': round(energy, 2),
+                'fixed': [{'name': name, 'amount': round(amount, 2)} for name, amount in self.fixed_charges],
+                'fixed_charges': round(fixed, 2),
+                'total': round(energy + fixed, 2)
+            })
+
+        energy_total = float(amounts.sum())
+        fixed_total = fixed * len(first)
+        bill = {
+            'tariff': self.name,
+            'billing_period': period,
+            'periods': periods,
+            'totals': {
+                'consumption_kwh': round(float(kwh.sum()), 3),
+                'energy_charges': round(energy_total, 2),
+                'fixed_charges': round(fixed_total, 2),
+                'total': round(energy_total + fixed_total, 2)
+            },
+            'skipped_readings': int((~keep).sum())
+        }
+        if self.windows and len(timestamps) > 1 and np.median(np.diff(timestamps)) > 60 * 10 ** 9 * 60:
+            bill['warning'] = ('Readings are more than an hour apart, so each one is billed '
+                               'in the time-of-use window its timestamp falls in')
+        return bill
+
+def compute_bill(filepath, tariff=None, period='month', column=CONSUMPTION_COLUMN):
+    """
+    Bill the consumption of a dataset under a tariff
+
+    Consumption is derived from the phase active powers, as at upload, when
+    the dataset has no consumption column.
+
+    Args:
+        filepath: Path of the CSV file on disk
+        tariff: Tariff definition dict, DEFAULT_TARIFF when None
+        period: One of BILLING_PERIODS
+        column: Column holding kWh per reading
+
+    Raises:
+        ValueError: For an invalid tariff or period, or data that cannot be billed
+    """
+    if period not in BILLING_PERIODS:
+        raise ValueError(f'Unknown billing period: {period}')
+    tariff = Tariff.from_dict(DEFAULT_TARIFF if tariff is None else tariff)
+
+    time_col, timestamps = dataset_time_index(filepath)
+    if time_col is None:
+        raise ValueError('No date or time column found for billing')
+    try:
+        df = load_dataset(filepath, [column])
+    except ValueError:
+        if column != CONSUMPTION_COLUMN:
+            raise ValueError(f'Column not found in data: {column}')
+        df = process_meter_data(load_dataset(filepath, numeric_columns(filepath)))
+        if column not in df.columns:
+            raise ValueError('No consumption column found for billing')
+    if not pd.api.types.is_numeric_dtype(df[column].dtype):
+        raise ValueError(f'Column {column} is not numeric')
+
+    bill = tariff.charge(timestamps, readings_block(df, [column])[:, 0], period)
+    bill['column'] = column
+    bill['tariff_rates'] = tariff.describe(period)
+    return bill
+
+JSON_MIMETYPE = 'application/json'
+# Raw little-endian column buffers behind a small JSON header, see encode_columns()
+COLUMNS_MIMETYPE = 'application/vnd.eec.columns'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+RESPONSE_FORMATS = {'json': JSON_MIMETYPE, 'columns': COLUMNS_MIMETYPE, 'arrow': ARROW_MIMETYPE}
+# Smaller bodies are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == 'M':
+            return np.datetime_as_string(value, unit='s').tolist()
+        if value.dtype == np.float32:
+            # Shortest float32 text, so compact readings print as they were read
+            return value.astype(str).astype(np.float64).tolist()
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def dumps_json(payload):
+    """
+    Serialize a payload to JSON bytes
+
+    With orjson installed, NumPy arrays are written directly from their
+    buffers instead of being turned into lists of Python objects first.
+    Keys are sorted as jsonify() sorts them.
+    """
+    with timed('serialize'):
+        return _dumps_json(payload)
+
+def _dumps_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=(
+            orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS))
+    return json.dumps(payload, default=_json_default, sort_keys=True).encode('utf-8')
+
+def _column_buffers(values):
+    """Header entry fields and buffers of one column for encode_columns()"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'fiub' or values.dtype.kind == 'M':
+        if values.dtype.kind == 'b':
+            values = values.astype(np.uint8)
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+        return {'dtype': values.dtype.str}, [values.tobytes()]
+    # Text as UTF-8 bytes plus int64 offsets, as Arrow stores it
+    encoded = ['' if v is None or v != v else str(v) for v in values.tolist()]
+    encoded = [s.encode('utf-8') for s in encoded]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    return {'dtype': 'utf8'}, [offsets.tobytes(), b''.join(encoded)]
+
+def encode_columns(columns, meta=None):
+    """
+    Encode named columns as raw little-endian buffers
+
+    Layout: the magic b'EECC', a little-endian uint32 header length, the
+    UTF-8 JSON header and zero padding to a multiple of 8 bytes, followed
+    by the column buffers, each starting on an 8-byte boundary. The header
+    holds meta and, per column, its name, length, dtype (a NumPy dtype
+    string such as '<f8', or 'utf8') and the offset, counted from the end
+    of the header, and size of each of its buffers. utf8 columns have an
+    int64 offsets buffer of length + 1 and a data buffer.
+
+    Args:
+        columns: Dict of column name to array or Series
+        meta: JSON-serializable dict carried in the header
+    """
+    with timed('serialize'):
+        return _encode_columns(columns, meta)
+
+def _encode_columns(columns, meta):
+    entries = []
+    chunks = []
+    position = 0
+    for name, values in columns.items():
+        entry, buffers = _column_buffers(values.to_numpy() if isinstance(values, pd.Series) else values)
+        entry.update({'name': name, 'length': len(values), 'buffers': []})
+        for buffer in buffers:
+            entry['buffers'].append({'offset': position, 'nbytes': len(buffer)})
+            padding = -len(buffer) % 8
+            chunks.append(buffer + b'\0' * padding)
+            position += len(buffer) + padding
+        entries.append(entry)
+
+    header = dumps_json({'meta': meta or {}, 'columns': entries})
+    header += b' ' * (-(len(header) + 8) % 8)
+    return b''.join([b'EECC', np.uint32(len(header)).astype('<u4').tobytes(), header] + chunks)
+
+def encode_arrow(columns, meta=None):
+    """Encode named columns as an Arrow IPC stream, with meta as schema metadata"""
+    with timed('serialize'):
+        return _encode_arrow(columns, meta)
+
+@functools.lru_cache(maxsize=None)
+def _pyarrow():
+    import pyarrow
+    return pyarrow
+
+def _encode_arrow(columns, meta):
+    pa = _pyarrow()
+    arrays = {}
+    for name, values in columns.items():
+        values = values.to_numpy() if isinstance(values, pd.Series) else np.asarray(values)
+        arrays[name] = pa.array(values, from_pandas=True)
+    table = pa.table(arrays).replace_schema_metadata({'meta': dumps_json(meta or {})})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def negotiate_format():
+    """
+    Response format asked for by the ?format= parameter or the Accept header
+
+    Returns:
+        One of RESPONSE_FORMATS' keys; arrow only when pyarrow is installed
+    """
+    requested = request.args.get('format')
+    if requested in RESPONSE_FORMATS:
+        if requested == 'arrow' and not ARROW_AVAILABLE:
+            return 'json'
+        return requested
+    offered = [JSON_MIMETYPE, COLUMNS_MIMETYPE] + ([ARROW_MIMETYPE] if ARROW_AVAILABLE else [])
+    best = request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+    return next(name for name, mimetype in RESPONSE_FORMATS.items() if mimetype == best)
+
+def payload_response(body, mimetype, status=200, etag=None):
+    """
+    Response for an encoded body, compressed with brotli or gzip when the
+    client accepts it and tagged with a weak ETag
+    """
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    encodings = request.accept_encodings
+    if len(body) >= COMPRESS_MIN_BYTES and (encodings['br'] or encodings['gzip']):
+        with timed('compress'):
+            if brotli is not None and encodings['br']:
+                response.set_data(brotli.compress(body, quality=4))
+                response.headers['Content-Encoding'] = 'br'
+            elif encodings['gzip']:
+                response.set_data(gzip.compress(body, compresslevel=5))
+                response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def json_response(payload, status=200, etag=None):
+    """jsonify() replacement using the fast encoder and response compression"""
+    return payload_response(dumps_json(payload), JSON_MIMETYPE, status, etag)
+
+def columns_response(fmt, columns, meta, etag=None):
+    """Respond with named columns in a binary format from negotiate_format()"""
+    if fmt == 'arrow':
+        return payload_response(encode_arrow(columns, meta), ARROW_MIMETYPE, etag=etag)
+    return payload_response(encode_columns(columns, meta), COLUMNS_MIMETYPE, etag=etag)
+
+def not_modified(etag):
+    """304 response if the request's If-None-Match already holds etag, else None"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def dataset_etag(filepath, *parts):
+    """ETag of a representation of the current version of a dataset"""
+    mtime_ns, size = DatasetCache.signature(filepath)
+    version = json.dumps([os.path.basename(filepath), mtime_ns, size, parts], sort_keys=True, default=str)
+    return hashlib.sha1(version.encode('utf-8')).hexdigest()
 
 @app.route('/')
 def index():
@@ -68,54 +3119,86 @@ def upload_file():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        # Read the file into a pandas DataFrame
         try:
-            # Save the file temporarily
+            # Stream the file to disk, then parse it in chunks
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Read the CSV file with error handling
-            try:
-                df = pd.read_csv(filepath)
-            except pd.errors.EmptyDataError:
-                return jsonify({'error': 'The uploaded CSV file is empty'}), 400
-            except pd.errors.ParserError:
-                return jsonify({'error': 'Unable to parse the CSV file. Please check the file format'}), 400
-            
-            # Check if DataFrame is empty
-            if df.empty:
-                return jsonify({'error': 'The uploaded CSV file contains no data'}), 400
-                
-            # Process the meter data
-            df = process_meter_data(df)
-            
-            # Get basic info about the data
-            columns = df.columns.tolist()
-            preview = df.head(10).to_dict('records')
+            with timed('save'):
+                save_upload_stream(file.stream, filepath)
             
-            # Get data types for each column
-            dtypes = {col: str(df[col].dtype) for col in columns}
-            
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'columns': columns,
-                'preview': preview,
-                'dtypes': dtypes,
-                'row_count': len(df)
-            })
+            return _ingest_upload(filepath, filename)
             
         except Exception as e:
             # More detailed error handling
             error_message = str(e)
-            print(f"File upload error: {error_message}")
+            app.logger.error('File upload error: %s', error_message)
             return jsonify({
                 'error': f"Error processing file: {error_message}",
                 'details': "Please ensure your CSV file is properly formatted with valid data"
             }), 500
     
-    return jsonify({'error': 'File type not allowed. Please upload a CSV file'}), 400
+    return jsonify({'error': 'File type not allowed. Please upload a CSV file'}), 400
+
+@app.route('/upload/stream', methods=['POST', 'PUT'])
+def upload_stream():
+    """
+    Upload a CSV sent as the raw request body, e.g.
+    curl -T meter.csv 'http://host/upload/stream?filename=meter.csv'
+    """
+    filename = request.args.get('filename') or request.headers.get('X-Filename', '')
+    
+    if not filename:
+        return jsonify({'error': 'Missing filename parameter'}), 400
+    
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed. Please upload a CSV file'}), 400
+    
+    try:
+        filename = secure_filename(filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        with timed('save'):
+            save_upload_stream(request.stream, filepath)
+        
+        return _ingest_upload(filepath, filename)
+        
+    except Exception as e:
+        error_message = str(e)
+        app.logger.error('File upload error: %s', error_message)
+        return jsonify({
+            'error': f"Error processing file: {error_message}",
+            'details': "Please ensure your CSV file is properly formatted with valid data"
+        }), 500
+
+def derive_phase_columns(df):
+    """
+    Add the columns a three-phase meter derives from its measurements:
+    average voltage, neutral current and per-phase and 3-phase reactive and
+    apparent power
+
+    Args:
+        df: DataFrame with R/Y/B voltages, power factors, active currents
+            and active powers; modified in place
+    """
+    # Calculate derived values
+    df['Average_Phase_Voltage'] = np.round((df['R_Ph_Voltage'] + df['Y_Ph_Voltage'] + df['B_Ph_Voltage']) / 3, 1)
+    df['Neutral_Line_current'] = np.round(np.abs(df['R_Phase_Active_Current'] + df['Y_Phase_Active_Current'] + df['B_Phase_Active_Current']) * 0.1, 2)
+    
+    # Calculate reactive currents
+    for phase in ['R', 'Y', 'B']:
+        pf = df[f'{phase}_PF']
+        active_current = df[f'{phase}_Phase_Active_Current']
+        df[f'{phase}_Phase_Reactive_Current'] = np.round(active_current * np.tan(np.arccos(pf)), 2)
+    
+    # Calculate reactive powers
+    for phase in ['R', 'Y', 'B']:
+        active_power = df[f'{phase}_Phase_Active_Power']
+        pf = df[f'{phase}_PF']
+        df[f'{phase}_Phase_Reactive_Power'] = np.round(active_power * np.tan(np.arccos(pf)), 2)
+        df[f'{phase}_Phase_Apparent_Power'] = np.round(active_power / pf, 2)
+    
+    # Calculate 3-phase reactive and apparent power
+    df['3_Phase_Reactive_Power'] = df['R_Phase_Reactive_Power'] + df['Y_Phase_Reactive_Power'] + df['B_Phase_Reactive_Power']
+    df['3_Phase_Apparent_Power'] = df['R_Phase_Apparent_Power'] + df['Y_Phase_Apparent_Power'] + df['B_Phase_Apparent_Power']
 
 @app.route('/sample')
 def get_sample_data():
@@ -126,7 +3209,7 @@ def get_sample_data():
     np.random.seed(42)
     base_consumption = 20 + 15 * np.sin(np.linspace(0, 2*np.pi, len(dates)))  # Seasonal pattern
     random_variation = np.random.normal(0, 3, len(dates))  # Random daily variation
-    weekday_effect = [2 if d.weekday() < 5 else -3 for d in dates]  # Weekday vs weekend effect
+    weekday_effect = np.where(dates.weekday < 5, 2, -3)  # Weekday vs weekend effect
     
     consumption = base_consumption + random_variation + weekday_effect
     
@@ -168,243 +3251,1627 @@ def get_sample_data():
         '3_Phase_Active_Power': np.round(consumption * 1000, 2),  # in Watts
     })
     
-    # Calculate derived values
-    df['Average_Phase_Voltage'] = np.round((df['R_Ph_Voltage'] + df['Y_Ph_Voltage'] + df['B_Ph_Voltage']) / 3, 1)
-    df['Neutral_Line_current'] = np.round(np.abs(df['R_Phase_Active_Current'] + df['Y_Phase_Active_Current'] + df['B_Phase_Active_Current']) * 0.1, 2)
+    derive_phase_columns(df)
+    
+    # Save to a CSV file
+    sample_file = os.path.join(app.config['UPLOAD_FOLDER'], 'sample_meter_data.csv')
+    df.to_csv(sample_file, index=False)
+    dataset_cache.invalidate(sample_file)
+    statistics_scan.invalidate(sample_file)
+    correlation_scan.invalidate(sample_file)
+    shared_store.collect(sample_file)
+    # Build the sidecar from the parsed CSV so both read paths see identical values
+    write_columnar_sidecar(sample_file, pd.read_csv(sample_file))
+    
+    # Return the same format as the upload endpoint
+    return jsonify({
+        'success': True,
+        'filename': 'sample_meter_data.csv',
+        'columns': df.columns.tolist(),
+        'preview': df.head(10).to_dict('records'),
+        'dtypes': {col: str(df[col].dtype) for col in df.columns},
+        'row_count': len(df)
+    })
+
+@app.route('/data/<filename>')
+def get_chart_data(filename):
+    """
+    Columns of a dataset for charting
+
+    Query parameters:
+        x: Column for the x axis
+        y: Column for the y axis; repeat for several series
+        start, end: Optional time window [start, end), answered from the
+            sorted time index; rows are then returned in time order
+        offset, limit: Optional page of the selected rows
+        max_points, downsample: Optional server-side downsampling of the page
+        format: json, columns or arrow (see negotiate_format())
+    """
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    
+    try:
+        # Get columns requested in query parameters
+        x_col = request.args.get('x')
+        y_cols = list(dict.fromkeys(request.args.getlist('y')))
+        
+        if not x_col or not y_cols:
+            return jsonify({'error': 'Missing x or y column parameters'}), 400
+        
+        # Optional server-side downsampling for large series
+        max_points = request.args.get('max_points')
+        method = request.args.get('downsample', 'lttb')
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                return jsonify({'error': 'max_points must be an integer'}), 400
+            if max_points < 3:
+                return jsonify({'error': 'max_points must be at least 3'}), 400
+            if method not in DOWNSAMPLING_METHODS:
+                return jsonify({'error': f'Unknown downsample method: {method}'}), 400
+        
+        # Optional time window and page
+        try:
+            start = _parse_time_bound(request.args.get('start'))
+            end = _parse_time_bound(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'start and end must be dates or timestamps'}), 400
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = request.args.get('limit')
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            return jsonify({'error': 'offset and limit must be integers'}), 400
+        if offset < 0 or (limit is not None and limit < 1):
+            return jsonify({'error': 'offset must be at least 0 and limit at least 1'}), 400
+        
+        # Repeat loads of an unchanged dataset are answered without reading it
+        fmt = negotiate_format()
+        etag = dataset_etag(filepath, sorted(request.args.items(multi=True)), fmt)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+        
+        columns = list(dict.fromkeys([x_col] + y_cols))
+        pagination = None
+        if start is None and end is None and not offset and limit is None:
+            # Whole columns, kept in the dataset cache
+            try:
+                df = load_dataset(filepath, columns)
+            except ValueError:
+                return jsonify({'error': 'Requested columns not found in data'}), 400
+        else:
+            # Only the selected rows are read: a binary search on the sorted
+            # time index finds the window, the page is sliced from it
+            if start is not None or end is not None:
+                time_index = dataset_sorted_time_index(filepath)
+                if time_index is None:
+                    return jsonify({'error': 'No date or time column found for time range queries'}), 400
+                lo, hi = time_index.window(start, end)
+            else:
+                time_index = None
+                schema = read_columnar_schema(filepath)
+                try:
+                    lo, hi = 0, schema['row_count'] if schema is not None else len(load_dataset(filepath, columns))
+                except ValueError:
+                    return jsonify({'error': 'Requested columns not found in data'}), 400
+            total = hi - lo
+            first = min(lo + offset, hi)
+            last = hi if limit is None else min(first + limit, hi)
+            rows = time_index.rows(first, last) if time_index is not None else slice(first, last)
+            try:
+                df = read_rows(filepath, columns, rows)
+            except ValueError:
+                return jsonify({'error': 'Requested columns not found in data'}), 400
+            pagination = {
+                'total': total,
+                'offset': offset,
+                'limit': limit,
+                'returned': len(df),
+                'next_offset': offset + len(df) if first + len(df) < hi else None
+            }
+        
+        x_values = df[x_col]
+        series = {col: df[col] for col in y_cols}
+        original_points = len(df)
+        downsampling = {'applied': False, 'original_points': original_points}
+        
+        if max_points is not None and original_points > max_points:
+            if not all(pd.api.types.is_numeric_dtype(values.dtype) for values in series.values()):
+                return jsonify({'error': 'Downsampling requires numeric y columns'}), 400
+            # Several series share one x axis: keep the union of the points
+            # each series selects from its share of the budget
+            budget = max(max_points // len(series), 3)
+            keep = np.unique(np.concatenate([downsample_indices(x_values, values, budget, method)
+                                             for values in series.values()]))
+            x_values = x_values.iloc[keep]
+            series = {col: values.iloc[keep] for col, values in series.items()}
+            downsampling = {
+                'applied': True,
+                'method': method,
+                'max_points': max_points,
+                'original_points': original_points,
+                'returned_points': len(keep),
+                'reduction_ratio': round(original_points / max(len(keep), 1), 2)
+            }
+        
+        meta = {'x_label': x_col, 'y_label': y_cols[0], 'downsampling': downsampling}
+        if len(y_cols) > 1:
+            meta['y_labels'] = y_cols
+        if pagination is not None:
+            meta['pagination'] = pagination
+        
+        # Binary formats send the column buffers as they are, and a
+        # timestamp x axis as datetime64[ns] rather than text
+        if fmt != 'json':
+            time_col, _ = dataset_time_index(filepath)
+            if x_col == time_col:
+                x_values = row_timestamps(filepath, x_values.index.to_numpy()).view('datetime64[ns]')
+            return columns_response(fmt, {'x': x_values, **series}, meta, etag)
+        
+        # Extract the data for the requested columns
+        y_first = series[y_cols[0]]
+        data = {
+            'x': x_values.to_numpy(),
+            'y': y_first.to_numpy(),
+            'x_label': x_col,
+            'y_label': y_cols[0]
+        }
+        if len(y_cols) > 1:
+            data['series'] = {col: values.to_numpy() for col, values in series.items()}
+            data['y_labels'] = y_cols
+        
+        response = {
+            'success': True,
+            'data': data,
+            'downsampling': downsampling
+        }
+        if pagination is not None:
+            response['pagination'] = pagination
+        return json_response(response, etag=etag)
+        
+    except DatasetTooLarge as e:
+        return jsonify({'error': str(e)}), 507
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+class AnalysisError(Exception):
+    """An analysis request that cannot be answered, with the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+ANALYSIS_TYPES = ('statistics', 'correlation', 'time_series', 'anomaly_detection', 'patterns', 'billing')
+
+def run_analysis(filepath, analysis_type, params, progress=None):
+    """
+    Run one analysis on a dataset
+
+    Args:
+        filepath: Path of the CSV file on disk
+        analysis_type: statistics, correlation, time_series, anomaly_detection,
+            patterns or billing
+        params: Dict of analysis options, e.g. the /analyze request body
+        progress: Optional callable receiving the fraction of the file
+            scanned, reported by streaming analyses
+
+    Returns:
+        Dict of results as returned under 'results' by /analyze
+
+    Raises:
+        AnalysisError: For invalid parameters or data the analysis cannot use
+    """
+    # Very large files (or an explicit request) are folded chunk by chunk
+    # into accumulators that later requests extend with appended rows
+    streaming = analysis_type in STREAMING_ANALYSES and (
+        params.get('streaming') or os.path.getsize(filepath) > app.config['STREAMING_ANALYSIS_BYTES'])
+    
+    # Analyses that only look at numeric columns read just those columns
+    if streaming or analysis_type in ('time_series', 'billing'):
+        df = None
+    elif analysis_type in ('statistics', 'correlation', 'anomaly_detection', 'patterns'):
+        df = load_dataset(filepath, numeric_columns(filepath))
+    else:
+        df = load_dataset(filepath)
+    results = {}
+    
+    if analysis_type == 'statistics':
+        # Calculate basic statistics
+        if streaming:
+            accumulator = statistics_scan.get(filepath, progress=progress)
+            results['statistics'] = accumulator.result() if accumulator else {}
+        else:
+            results['statistics'] = compute_statistics(df)
+        
+    elif analysis_type == 'correlation':
+        # Calculate correlation matrix
+        if streaming:
+            accumulator = correlation_scan.get(filepath, progress=progress)
+            results['correlation'] = correlation_dict(accumulator.correlation()) if accumulator else {}
+        else:
+            numeric_cols = numeric_column_names(df)
+            results['correlation'] = correlation_dict(df[numeric_cols].corr())
+        
+    elif analysis_type == 'time_series':
+        # Answered from the precomputed hour/day/week/month rollups
+        granularity = params.get('granularity', 'month')
+        if granularity not in RollupPyramid.LEVELS:
+            raise AnalysisError(f'Unknown granularity: {granularity}')
+        try:
+            start = _parse_time_bound(params.get('start'))
+            end = _parse_time_bound(params.get('end'))
+        except ValueError:
+            raise AnalysisError('start and end must be dates or timestamps')
+        
+        pyramid = dataset_rollups(filepath)
+        if pyramid is None:
+            raise AnalysisError('No date or time column found for time series analysis')
+        
+        rollup = pyramid.query(granularity, start, end)
+        averages = pd.DataFrame(rollup['means'], columns=pyramid.columns)
+        averages.insert(0, 'period', rollup['periods'])
+        results['time_series'] = {
+            'granularity': granularity,
+            'periods': rollup['periods'],
+            'averages': averages.to_dict('records'),
+            'aggregates': rollup['aggregates']
+        }
+        if granularity == 'month':
+            results['time_series']['monthly_averages'] = averages.rename(columns={'period': 'month'}).to_dict('records')
+        
+    elif analysis_type == 'anomaly_detection':
+        # Anomaly detection over all numeric columns at once, one page at a time
+        method = params.get('method', 'zscore')
+        if method not in ANOMALY_METHODS:
+            raise AnalysisError(f'Unknown anomaly detection method: {method}')
+        try:
+            window = int(params.get('window', 30))
+            threshold = float(params.get('threshold', 3.0))
+            limit = min(int(params.get('limit', ANOMALY_PAGE_LIMIT)), ANOMALY_MAX_PAGE_LIMIT)
+        except (TypeError, ValueError):
+            raise AnalysisError('window, threshold and limit must be numbers')
+        if window < 2 or limit < 1:
+            raise AnalysisError('window must be at least 2 and limit at least 1')
+        # Windows run over the readings in time order, not file order
+        date_col, timestamps = dataset_time_index(filepath)
+        try:
+            anomalies, pagination = detect_anomalies(
+                df, method, window, threshold, limit, params.get('cursor'),
+                time_order(timestamps) if date_col else None)
+        except ValueError as e:
+            raise AnalysisError(str(e))
+        results['anomalies'] = anomalies
+        results['method'] = method
+        results['pagination'] = pagination
+        
+    elif analysis_type == 'patterns':
+        # Detect patterns - trend analysis in time order, using the
+        # timestamp column detected and parsed at upload
+        date_col, timestamps = dataset_time_index(filepath)
+        if date_col:
+            results['patterns'] = compute_trends(df, time_order(timestamps))
+        else:
+            results['patterns'] = {'error': 'No date column found for pattern analysis'}
+    
+    elif analysis_type == 'billing':
+        # Exact cost per billing period under a declarative tariff
+        try:
+            results['billing'] = compute_bill(filepath, params.get('tariff'), params.get('period', 'month'),
+                                              params.get('column') or CONSUMPTION_COLUMN)
+        except ValueError as e:
+            raise AnalysisError(str(e))
+    
+    else:
+        raise AnalysisError(f'Unknown analysis type: {analysis_type}')
+    
+    return results
+
+FLEET_ANALYSES = ('statistics', 'anomaly_detection', 'patterns')
+
+def analyze_meter_file(filepath, analysis_types, params):
+    """
+    Run several analyses on one meter file; executed in a worker process
+
+    Returns:
+        Dict with the filename, success flag, per-analysis results or
+        errors and the time spent
+    """
+    started = time.perf_counter()
+    filename = os.path.basename(filepath)
+    results = {}
+    errors = {}
+    for analysis_type in analysis_types:
+        try:
+            results[analysis_type] = run_analysis(filepath, analysis_type, params)
+        except Exception as e:
+            errors[analysis_type] = str(e)
+    return {
+        'filename': filename,
+        'success': not errors,
+        'results': results,
+        'errors': errors,
+        'seconds': round(time.perf_counter() - started, 4)
+    }
+
+class FleetSummary:
+    """Cross-meter aggregates folded in as per-meter results arrive"""
+
+    def __init__(self):
+        self.meters = 0
+        self.failed = []
+        self.columns = {}
+        self.anomalies = {}
+        self.trends = {}
+
+    def add(self, meter):
+        self.meters += 1
+        if not meter['success']:
+            self.failed.append(meter['filename'])
+        results = meter['results']
+
+        for col, stats in results.get('statistics', {}).get('statistics', {}).items():
+            summary = self.columns.setdefault(col, {'meters': 0, 'mean_sum': 0.0, 'min': np.inf, 'max': -np.inf})
+            if stats['mean'] == stats['mean']:
+                summary['meters'] += 1
+                summary['mean_sum'] += stats['mean']
+                summary['min'] = min(summary['min'], stats['min'])
+                summary['max'] = max(summary['max'], stats['max'])
+
+        anomalies = results.get('anomaly_detection', {}).get('anomalies')
+        if anomalies is not None:
+            self.anomalies[meter['filename']] = sum(entry['count'] for entry in anomalies.values())
+
+        for col, pattern in results.get('patterns', {}).get('patterns', {}).items():
+            if isinstance(pattern, dict) and 'trend' in pattern:
+                self.trends.setdefault(col, Counter())[pattern['trend']] += 1
+
+    def result(self, seconds):
+        columns = {}
+        for col, summary in self.columns.items():
+            if summary['meters']:
+                columns[col] = {
+                    'meters': summary['meters'],
+                    'mean_of_means': summary['mean_sum'] / summary['meters'],
+                    'min': summary['min'],
+                    'max': summary['max']
+                }
+        ranked = sorted(self.anomalies.items(), key=lambda item: item[1], reverse=True)
+        return {
+            'meters': self.meters,
+            'succeeded': self.meters - len(self.failed),
+            'failed': self.failed,
+            'seconds': round(seconds, 4),
+            'meters_per_second': round(self.meters / seconds, 2) if seconds > 0 else None,
+            'columns': columns,
+            'total_anomalies': sum(self.anomalies.values()),
+            'most_anomalous_meters': [{'filename': name, 'anomalies': count} for name, count in ranked[:10]],
+            'trends': {col: dict(counts) for col, counts in self.trends.items()}
+        }
+
+def iter_fleet_analysis(filepaths, analysis_types=FLEET_ANALYSES, params=None, workers=None):
+    """
+    Analyse many meter files in parallel, yielding results as they finish
+
+    Files are fanned out over a process pool sized to the available cores.
+    Each per-meter result is yielded as soon as its worker finishes, and a
+    final {'summary': ...} item carries the fleet-wide aggregates.
+    """
+    params = params or {}
+    workers = max(1, min(workers or app.config['FLEET_WORKERS'], len(filepaths) or 1))
+    summary = FleetSummary()
+    started = time.perf_counter()
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(analyze_meter_file, path, list(analysis_types), params): path
+                   for path in filepaths}
+        for future in as_completed(futures):
+            try:
+                meter = future.result()
+            except Exception as e:
+                meter = {
+                    'filename': os.path.basename(futures[future]),
+                    'success': False,
+                    'results': {},
+                    'errors': {'worker': str(e)}
+                }
+            summary.add(meter)
+            yield meter
+    finally:
+        # Also reached when a streaming client disconnects early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield {'summary': summary.result(time.perf_counter() - started)}
+
+def requested_workers(value):
+    """
+    Worker processes asked for in a request body, capped at FLEET_WORKERS
+
+    Raises:
+        ValueError: Unless value is None or a positive integer
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError('workers must be a positive integer')
+    return min(value, app.config['FLEET_WORKERS'])
+
+def ndjson_line(item):
+    """
+    One NDJSON line for a fleet result
+
+    NaN and infinities, e.g. the mean of an empty column, are written as
+    null so that strict JSON parsers accept every line.
+    """
+    return json.dumps(_finite_json(item), default=_json_default, allow_nan=False)
+
+def _finite_json(value):
+    if isinstance(value, dict):
+        return {key: _finite_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _finite_json(_json_default(value))
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    return value
+
+def resolve_fleet_files(filenames=None, pattern=None):
+    """
+    Uploaded CSV files named explicitly or matching a glob pattern
+
+    Returns:
+        (filepaths, missing filenames)
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    if filenames:
+        paths = [os.path.join(folder, secure_filename(name)) for name in filenames]
+        missing = [name for name, path in zip(filenames, paths) if not os.path.isfile(path)]
+        return [path for path in paths if os.path.isfile(path)], missing
+    names = sorted(name for name in os.listdir(folder)
+                   if allowed_file(name) and fnmatch.fnmatch(name, pattern or '*'))
+    return [os.path.join(folder, name) for name in names], []
+
+def _correlate_files(filenames):
+    """Correlation over the rows of several meter files, merged from cached accumulators"""
+    if not all(isinstance(name, str) and name for name in filenames):
+        return jsonify({'error': 'filenames must be non-empty strings'}), 400
+    filepaths = [os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(name)) for name in filenames]
+    missing = [name for name, path in zip(filenames, filepaths) if not os.path.isfile(path)]
+    if missing:
+        return jsonify({'error': f'Files not found: {", ".join(missing)}'}), 404
+    
+    try:
+        accumulator = CorrelationAccumulator.combine(correlation_scan.get(path) for path in filepaths)
+        return jsonify({
+            'success': True,
+            'analysis_type': 'correlation',
+            'results': {
+                'correlation': correlation_dict(accumulator.correlation()),
+                'filenames': filenames
+            }
+        })
+    except DatasetTooLarge as e:
+        return jsonify({'error': str(e)}), 507
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of analysis results whose entries expire after ttl seconds
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None
+            }
+
+class AnalysisJob:
+    """One queued run of run_analysis(), shared by every identical submission"""
+
+    def __init__(self, key, filepath, analysis_type, params):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.filepath = filepath
+        self.analysis_type = analysis_type
+        self.params = params
+        self.status = 'queued'
+        self.progress = 0.0
+        self.cached = False
+        self.subscribers = 1
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.submitted = time.time()
+        self.timer = None
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def finish(self, result=None, error=None, error_status=None):
+        self.result = result
+        self.error = error
+        self.error_status = error_status
+        self.status = 'failed' if error is not None else 'done'
+        self.progress = 1.0
+        self.finished = time.time()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def profile(self):
+        """Phase breakdown of the run that produced this job's result"""
+        profile = {'cached': self.cached, 'subscribers': self.subscribers}
+        if self.timer is not None:
+            profile.update(self.timer.to_dict())
+        return profile
+
+    def to_dict(self):
+        job = {
+            'job_id': self.id,
+            'filename': os.path.basename(self.filepath),
+            'analysis_type': self.analysis_type,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'cached': self.cached,
+            'subscribers': self.subscribers,
+            'submitted_at': datetime.fromtimestamp(self.submitted).isoformat()
+        }
+        if self.started is not None:
+            job['started_at'] = datetime.fromtimestamp(self.started).isoformat()
+        if self.finished is not None:
+            job['seconds'] = round(self.finished - (self.started or self.submitted), 4)
+        if self.status == 'done':
+            job['results'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+class AnalysisJobQueue:
+    """
+    Runs analyses on a thread pool with memoized results
+
+    Jobs are keyed by (file content hash, analysis type, parameters). A
+    submission whose result is cached finishes immediately, and one that
+    matches a job still queued or running joins that job instead of
+    starting another, so concurrent identical requests cost one run.
+    Threads share the process's dataset cache and NumPy releases the GIL
+    in the heavy kernels.
+    """
+
+    # Request fields that select the dataset or the mode rather than the analysis
+    NON_PARAMETERS = ('filename', 'analysis_type', 'async', 'profile')
+
+    def __init__(self, workers, result_entries, result_ttl, max_jobs=1000):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.results = ResultCache(result_entries, result_ttl)
+        self._jobs = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.coalesced = 0
+
+    @classmethod
+    def key(cls, filepath, analysis_type, params):
+        options = {k: v for k, v in params.items() if k not in cls.NON_PARAMETERS}
+        return (content_hash(filepath), analysis_type, json.dumps(options, sort_keys=True, default=str))
+
+    def submit(self, filepath, analysis_type, params):
+        """
+        Queue an analysis, or return the job that already answers it
+
+        Raises:
+            OSError: If the file cannot be read
+        """
+        key = self.key(filepath, analysis_type, params)
+        with self._lock:
+            running = self._running.get(key)
+            if running is not None:
+                running.subscribers += 1
+                self.coalesced += 1
+                return running
+
+            job = AnalysisJob(key, filepath, analysis_type, params)
+            cached = self.results.get(key)
+            if cached is not None:
+                job.cached = True
+                job.finish(cached)
+            else:
+                self._running[key] = job
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analysis')
+                self._executor.submit(self._run, job)
+
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+            return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started = time.time()
+
+        def progress(fraction):
+            job.progress = min(fraction, 1.0)
+
+        job.timer = _timing.timer = PhaseTimer()
+        try:
+            with job.timer.phase('compute'):
+                result = run_analysis(job.filepath, job.analysis_type, job.params, progress)
+        except AnalysisError as e:
+            outcome = {'error': str(e), 'error_status': e.status}
+        except DatasetTooLarge as e:
+            outcome = {'error': str(e), 'error_status': 507}
+        except Exception as e:
+            outcome = {'error': str(e), 'error_status': 500}
+        else:
+            self.results.put(job.key, result)
+            outcome = {'result': result}
+        finally:
+            _timing.timer = None
+        for phase, seconds in job.timer.phases.items():
+            metrics.observe('eec_analysis_phase_seconds', {'analysis_type': job.analysis_type, 'phase': phase}, seconds)
+        metrics.inc('eec_rows_processed_total', {'endpoint': 'analysis_job', 'analysis_type': job.analysis_type},
+                    job.timer.rows)
+        with self._lock:
+            self._running.pop(job.key, None)
+            job.finish(**outcome)
+
+    def stats(self):
+        with self._lock:
+            running = len(self._running)
+            jobs = len(self._jobs)
+        return {
+            'workers': self.workers,
+            'jobs': jobs,
+            'running': running,
+            'coalesced': self.coalesced,
+            'results': self.results.stats()
+        }
+
+analysis_jobs = AnalysisJobQueue(app.config['ANALYSIS_WORKERS'],
+                                 app.config['ANALYSIS_RESULT_ENTRIES'],
+                                 app.config['ANALYSIS_RESULT_TTL'])
+
+@app.route('/analyze', methods=['POST'])
+def analyze_data():
+    """
+    Run an analysis of an uploaded file
+
+    Identical requests share one computation and its cached result. With
+    {"async": true} the response is 202 with a job id to poll at
+    /analyze/jobs/<job_id> instead of the results.
+    """
+    data = request.json
+    filename = data.get('filename')
+    analysis_type = data.get('analysis_type')
+    
+    # Correlation can also be computed across several meter files at once
+    if analysis_type == 'correlation' and isinstance(data.get('filenames'), list) and data['filenames']:
+        return _correlate_files(data['filenames'])
+    
+    if not filename or not analysis_type:
+        return jsonify({'error': 'Missing required parameters'}), 400
+    if analysis_type not in ANALYSIS_TYPES:
+        return jsonify({'error': f'Unknown analysis type: {analysis_type}'}), 400
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    
+    try:
+        job = analysis_jobs.submit(filepath, analysis_type, data)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if data.get('async'):
+        response = jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/analyze/jobs/{job.id}'
+        })
+        response.status_code = 202
+        response.headers['Location'] = f'/analyze/jobs/{job.id}'
+        return response
+    
+    job.wait()
+    g.analysis_type = analysis_type
+    g.job = job
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), job.error_status
+    
+    response = {
+        'success': True,
+        'analysis_type': analysis_type,
+        'results': job.result
+    }
+    if profile_requested():
+        response['profile'] = job.profile()
+    return json_response(response)
+
+@app.route('/analyze/jobs/<job_id>')
+def get_analysis_job(job_id):
+    """Status and progress of a queued analysis, with its results once done"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    if job.status != 'done':
+        return jsonify({'success': True, **job.to_dict()})
+    
+    # A finished job never changes, so polling clients can revalidate cheaply
+    etag = job.id
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+    payload = {'success': True, **job.to_dict()}
+    if profile_requested():
+        payload['profile'] = job.profile()
+    return json_response(payload, etag=etag)
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyse many uploaded meter files and stream one NDJSON line per meter
+
+    Accepts {"filenames": [...]} or {"pattern": "meter_*.csv"}, plus
+    optional "analysis_types" and analysis parameters. The last line holds
+    the fleet summary.
+    """
+    data = request.json or {}
+    analysis_types = data.get('analysis_types') or list(FLEET_ANALYSES)
+    unknown = [t for t in analysis_types if t not in ANALYSIS_TYPES]
+    if unknown:
+        return jsonify({'error': f'Unknown analysis type: {", ".join(unknown)}'}), 400
+    try:
+        workers = requested_workers(data.get('workers'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filenames = data.get('filenames')
+    if filenames is not None and not (isinstance(filenames, list) and filenames
+                                      and all(isinstance(name, str) and name for name in filenames)):
+        return jsonify({'error': 'filenames must be a non-empty list of non-empty strings'}), 400
+    if data.get('pattern') is not None and not isinstance(data['pattern'], str):
+        return jsonify({'error': 'pattern must be a string'}), 400
+    
+    filepaths, missing = resolve_fleet_files(filenames, data.get('pattern'))
+    if missing:
+        return jsonify({'error': f'Files not found: {", ".join(missing)}'}), 404
+    if not filepaths:
+        return jsonify({'error': 'No matching files'}), 404
+    
+    params = {key: value for key, value in data.items()
+              if key not in ('filenames', 'pattern', 'analysis_types', 'workers')}
+    
+    def generate():
+        for item in iter_fleet_analysis(filepaths, analysis_types, params, workers):
+            yield ndjson_line(item) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.cli.command('analyze-fleet')
+@click.argument('pattern', default='*.csv')
+@click.option('--analysis', 'analysis_types', multiple=True, type=click.Choice(ANALYSIS_TYPES),
+              help='Analysis to run; repeat for several (default: statistics, anomaly_detection, patterns)')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+def analyze_fleet_command(pattern, analysis_types, workers):
+    """Analyse every upload matching PATTERN and print NDJSON results"""
+    filepaths, _ = resolve_fleet_files(pattern=pattern)
+    if not filepaths:
+        raise click.ClickException(f'No uploaded files match {pattern}')
+    for item in iter_fleet_analysis(filepaths, analysis_types or FLEET_ANALYSES, {}, workers):
+        click.echo(ndjson_line(item))
+
+# Live meters push batches of readings; each keeps only a recent window in memory
+LIVE_KEEPALIVE_SECONDS = 15
+# A subscriber this many events behind is dropped; EventSource then reconnects
+LIVE_SUBSCRIBER_BACKLOG = 100
+
+class MeterRingBuffer:
+    """
+    The most recent readings of one meter in fixed-size NumPy arrays
+
+    Once the buffer is full each batch overwrites the oldest readings, so a
+    meter holds at most capacity rows however long it streams.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.timestamps = np.full(capacity, NAT_INT64, dtype=np.int64)
+        self.values = np.full((capacity, width), np.nan)
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamps, values):
+        """
+        Add a batch of readings in arrival order
+
+        Returns:
+            Rows of values that no longer fit, from the buffer or the batch
+        """
+        dropped = []
+        if len(timestamps) > self.capacity:
+            dropped.append(values[:-self.capacity])
+            timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+        overflow = max(self.size + len(timestamps) - self.capacity, 0)
+        if overflow:
+            dropped.append(self.values[(self.start + np.arange(overflow)) % self.capacity])
+            self.start = (self.start + overflow) % self.capacity
+            self.size -= overflow
+        positions = (self.start + self.size + np.arange(len(timestamps))) % self.capacity
+        self.timestamps[positions] = timestamps
+        self.values[positions] = values
+        self.size += len(timestamps)
+        return np.concatenate(dropped) if dropped else self.values[:0]
+
+    def window(self):
+        """(timestamps, values) of the buffered readings, oldest first"""
+        positions = (self.start + np.arange(self.size)) % self.capacity
+        return self.timestamps[positions], self.values[positions]
+
+def _iso_timestamps(timestamps):
+    return np.datetime_as_string(timestamps.view('datetime64[ns]'), unit='s').tolist()
+
+def _nullable(values):
+    """Floats as a list with None for NaN, which JSON cannot represent"""
+    return np.where(np.isnan(values), None, values).tolist()
+
+def _sse_event(name, event_id, payload):
+    """One Server-Sent Events message; JSON never contains a raw newline"""
+    return f'id: {event_id}\nevent: {name}\ndata: {dumps_json(payload).decode("utf-8")}\n\n'
+
+class LiveMeter:
+    """
+    One live meter: its ring buffer, running totals and anomaly state
+
+    Every append costs O(batch): totals are adjusted by the readings added
+    and dropped, and the StreamingAnomalyDetector carries its EWMA state
+    from batch to batch. Subscribers get each update as an SSE message.
+    """
+
+    def __init__(self, meter_id, columns, capacity):
+        self.id = meter_id
+        self.columns = columns
+        self.buffer = MeterRingBuffer(capacity, len(columns))
+        self.detector = StreamingAnomalyDetector(len(columns))
+        self.consumption = columns.index(CONSUMPTION_COLUMN) if CONSUMPTION_COLUMN in columns else None
+        self.readings = 0
+        self.total_kwh = 0.0
+        self.window_kwh = 0.0
+        self.anomaly_counts = np.zeros(len(columns), dtype=np.int64)
+        self.last_timestamp = None
+        self.version = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def append(self, timestamps, values):
+        """
+        Fold a batch into the meter and notify subscribers
+
+        Args:
+            timestamps: int64 ns per reading
+            values: 2-D float array, one column per entry of self.columns
+
+        Returns:
+            The update as sent to subscribers
+        """
+        with self._lock:
+            flags, lower, upper = self.detector.update(values)
+            dropped = self.buffer.append(timestamps, values)
+            if self.consumption is not None:
+                added = float(np.nansum(values[:, self.consumption]))
+                self.total_kwh += added
+                self.window_kwh += added - float(np.nansum(dropped[:, self.consumption]))
+            self.anomaly_counts += flags.sum(axis=0)
+            self.readings += len(timestamps)
+            valid = timestamps[timestamps != NAT_INT64]
+            if len(valid):
+                latest = int(valid.max())
+                self.last_timestamp = latest if self.last_timestamp is None else max(self.last_timestamp, latest)
+            self.version += 1
+
+            rows, cols = np.nonzero(flags)
+            update = {
+                'meter': self.id,
+                'version': self.version,
+                'x': _iso_timestamps(timestamps),
+                'series': {col: _nullable(values[:, i]) for i, col in enumerate(self.columns)},
+                'anomalies': [{'timestamp': _iso_timestamps(timestamps[r:r + 1])[0],
+                               'column': self.columns[c],
+                               'value': float(values[r, c]),
+                               'lower': float(lower[r, c]),
+                               'upper': float(upper[r, c])} for r, c in zip(rows, cols)],
+                'totals': self._totals()
+            }
+            message = _sse_event('readings', self.version, update)
+            for subscription in list(self._subscribers):
+                if subscription.qsize() >= LIVE_SUBSCRIBER_BACKLOG:
+                    # Too slow to keep up: end its stream rather than buffer without bound
+                    self._subscribers.discard(subscription)
+                    subscription.put(None)
+                else:
+                    subscription.put(message)
+            return update
+
+    def _totals(self):
+        return {
+            'readings': self.readings,
+            'window_readings': len(self.buffer),
+            'total_kwh': round(self.total_kwh, 6) if self.consumption is not None else None,
+            'window_kwh': round(self.window_kwh, 6) if self.consumption is not None else None,
+            'last_timestamp': _iso_timestamps(np.array([self.last_timestamp]))[0]
+            if self.last_timestamp is not None else None,
+            'anomalies': {col: int(n) for col, n in zip(self.columns, self.anomaly_counts)}
+        }
+
+    def snapshot(self):
+        """The buffered window and totals"""
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        timestamps, values = self.buffer.window()
+        return {
+            'meter': self.id,
+            'version': self.version,
+            'columns': self.columns,
+            'capacity': self.buffer.capacity,
+            'x': _iso_timestamps(timestamps),
+            'series': {col: _nullable(values[:, i]) for i, col in enumerate(self.columns)},
+            'totals': self._totals()
+        }
+
+    def subscribe(self):
+        """
+        Returns:
+            (queue of SSE messages, snapshot message); no update can fall
+            between the snapshot and the first queued message
+        """
+        subscription = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscription)
+            return subscription, _sse_event('snapshot', self.version, self._snapshot())
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return len(self._subscribers)
+
+class LiveMeters:
+    """Live meters of this process by id, created by their first batch"""
+
+    def __init__(self, capacity, max_meters):
+        self.capacity = capacity
+        self.max_meters = max_meters
+        self._meters = {}
+        self._lock = threading.Lock()
+
+    def get(self, meter_id):
+        with self._lock:
+            return self._meters.get(meter_id)
+
+    def append(self, meter_id, frame):
+        """
+        Append a parsed batch of readings to a meter
+
+        Consumption is derived as in process_meter_data(). Readings without
+        a timestamp column are stamped with the time they arrived. The
+        first batch of a meter fixes its numeric columns; later batches may
+        leave some out, and columns the meter does not have are ignored.
+
+        Returns:
+            (update, ignored column names)
+
+        Raises:
+            ValueError: For a batch without numeric readings, or without
+                any of the meter's columns
+            LookupError: When this process already holds max_meters meters
+        """
+        frame = process_meter_data(frame)
+        time_col = detect_time_column(frame)
+        if time_col is not None:
+            timestamps = parse_timestamps(frame[time_col])
+        else:
+            timestamps = np.full(len(frame), time.time_ns(), dtype=np.int64)
+        numeric = [col for col in frame.columns if col != time_col and
+                   pd.api.types.is_numeric_dtype(frame[col].dtype) and not pd.api.types.is_bool_dtype(frame[col].dtype)]
+
+        with self._lock:
+            meter = self._meters.get(meter_id)
+            if meter is None:
+                if not numeric:
+                    raise ValueError('The batch has no numeric readings')
+                if len(self._meters) >= self.max_meters:
+                    raise LookupError(f'This server already follows {self.max_meters} live meters')
+                meter = self._meters[meter_id] = LiveMeter(meter_id, numeric, self.capacity)
+
+        ignored = [col for col in frame.columns if col != time_col and col not in meter.columns]
+        if not set(meter.columns).intersection(frame.columns):
+            # Rows of nothing but NaN would only push real readings out of the window
+            raise ValueError(f'The batch has none of the meter\'s columns: {", ".join(meter.columns)}')
+        values = _numeric_block(frame.reindex(columns=meter.columns), meter.columns)
+        return meter.append(timestamps, values), ignored
+
+    def stats(self):
+        with self._lock:
+            meters = list(self._meters.values())
+        return {
+            'meters': len(meters),
+            'subscribers': sum(meter.subscribers for meter in meters),
+            'readings': sum(meter.readings for meter in meters)
+        }
+
+    def list(self):
+        with self._lock:
+            meters = list(self._meters.values())
+        return [{'meter': meter.id, 'columns': meter.columns, 'version': meter.version,
+                 'subscribers': meter.subscribers} for meter in meters]
+
+live_meters = LiveMeters(app.config['LIVE_WINDOW_READINGS'], app.config['LIVE_MAX_METERS'])
+
+def parse_live_batch(body, mimetype):
+    """
+    Readings of one batch: NDJSON, a JSON array of objects or CSV
+
+    Raises:
+        ValueError, pd.errors.ParserError: If the body cannot be parsed, or
+            a JSON reading is not an object
+    """
+    if mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = [json.loads(line) for line in body.splitlines() if line.strip()]
+    elif mimetype == 'application/json':
+        rows = json.loads(body)
+        if not isinstance(rows, list):
+            raise ValueError('Expected a JSON array of readings')
+    else:
+        return pd.read_csv(io.BytesIO(body))
+    if not all(isinstance(row, dict) for row in rows):
+        raise ValueError('Each reading must be a JSON object')
+    return pd.DataFrame.from_records(rows)
+
+def _live_meter_id(meter_id):
+    """meter_id if it is safe to use as given, else None"""
+    return meter_id if meter_id and secure_filename(meter_id) == meter_id else None
+
+@app.route('/live/<meter_id>/readings', methods=['POST'])
+def append_live_readings(meter_id):
+    """
+    Append a batch of readings to a live meter, creating it on first use
+
+    The body holds one reading per line or row, as NDJSON
+    (application/x-ndjson), a JSON array or CSV (text/csv, the default).
+    The response carries the anomalies found in the batch and the meter's
+    running totals; the same update is pushed to /live/<meter_id>/events.
+    """
+    if _live_meter_id(meter_id) is None:
+        return jsonify({'error': 'Invalid meter id'}), 400
+    body = request.get_data()
+    if not body.strip():
+        return jsonify({'error': 'Empty batch'}), 400
     
-    # Calculate reactive currents
-    for phase in ['R', 'Y', 'B']:
-        pf = df[f'{phase}_PF']
-        active_current = df[f'{phase}_Phase_Active_Current']
-        df[f'{phase}_Phase_Reactive_Current'] = np.round(active_current * np.tan(np.arccos(pf)), 2)
+    try:
+        with timed('parse'):
+            frame = parse_live_batch(body, request.mimetype)
+    except (ValueError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        return jsonify({'error': f'Unable to parse the batch: {e}'}), 400
+    if frame.empty:
+        return jsonify({'error': 'Empty batch'}), 400
+    count_rows(len(frame))
     
-    # Calculate reactive powers
-    for phase in ['R', 'Y', 'B']:
-        active_power = df[f'{phase}_Phase_Active_Power']
-        pf = df[f'{phase}_PF']
-        df[f'{phase}_Phase_Reactive_Power'] = np.round(active_power * np.tan(np.arccos(pf)), 2)
-        df[f'{phase}_Phase_Apparent_Power'] = np.round(active_power / pf, 2)
+    try:
+        with timed('compute'):
+            update, ignored = live_meters.append(meter_id, frame)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 507
+    metrics.inc('eec_live_readings_total', {}, len(frame))
     
-    # Calculate 3-phase reactive and apparent power
-    df['3_Phase_Reactive_Power'] = df['R_Phase_Reactive_Power'] + df['Y_Phase_Reactive_Power'] + df['B_Phase_Reactive_Power']
-    df['3_Phase_Apparent_Power'] = df['R_Phase_Apparent_Power'] + df['Y_Phase_Apparent_Power'] + df['B_Phase_Apparent_Power']
+    return json_response({
+        'success': True,
+        'meter': meter_id,
+        'accepted': len(frame),
+        'version': update['version'],
+        'ignored_columns': ignored,
+        'anomalies': update['anomalies'],
+        'totals': update['totals']
+    })
+
+@app.route('/live')
+def list_live_meters():
+    return jsonify({'success': True, 'meters': live_meters.list()})
+
+@app.route('/live/<meter_id>')
+def get_live_meter(meter_id):
+    """The buffered readings and running totals of a live meter"""
+    meter = live_meters.get(meter_id)
+    if meter is None:
+        return jsonify({'error': 'Live meter not found'}), 404
+    return json_response({'success': True, **meter.snapshot()})
+
+@app.route('/live/<meter_id>/events')
+def stream_live_meter(meter_id):
+    """
+    Server-Sent Events for a live meter
+
+    The first message (event "snapshot") holds the buffered window, as
+    GET /live/<meter_id>; each later one (event "readings") holds one
+    appended batch with its anomalies and the updated totals.
+    """
+    meter = live_meters.get(meter_id)
+    if meter is None:
+        return jsonify({'error': 'Live meter not found'}), 404
+    subscription, snapshot = meter.subscribe()
     
-    # Save to a CSV file
-    sample_file = os.path.join(app.config['UPLOAD_FOLDER'], 'sample_meter_data.csv')
-    df.to_csv(sample_file, index=False)
+    def generate():
+        try:
+            yield snapshot
+            while True:
+                try:
+                    message = subscription.get(timeout=LIVE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Comment line that keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            meter.unsubscribe(subscription)
     
-    # Return the same format as the upload endpoint
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/cache/stats')
+def get_cache_stats():
     return jsonify({
         'success': True,
-        'filename': 'sample_meter_data.csv',
-        'columns': df.columns.tolist(),
-        'preview': df.head(10).to_dict('records'),
-        'dtypes': {col: str(df[col].dtype) for col in df.columns},
-        'row_count': len(df)
+        'cache': dataset_cache.stats(),
+        'analysis': analysis_jobs.stats(),
+        'memory': {
+            'compact_dtypes': app.config['COMPACT_DTYPES'],
+            'load_budget': load_budget.stats(),
+            'shared': shared_store.stats() if app.config['SHARED_DATASETS'] else None,
+            'datasets': memory_reports.stats()
+        }
     })
 
-@app.route('/data/<filename>')
-def get_chart_data(filename):
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+def profile_requested():
+    """Whether the client asked for a profile with ?profile=1, X-Profile: 1 or "profile": true"""
+    if request.args.get('profile', '').lower() in ('1', 'true') or request.headers.get('X-Profile', '').lower() in ('1', 'true'):
+        return True
+    body = request.get_json(silent=True) if request.is_json else None
+    return isinstance(body, dict) and bool(body.get('profile'))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    _timing.timer = PhaseTimer()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Record latency, phases and volumes of the request, and attach a
+    Server-Timing breakdown to the response when a profile was requested
+    """
+    timer = current_timer()
+    started = g.get('request_started')
+    if timer is None or started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
+    metrics.inc('eec_requests_total', labels)
+    metrics.observe('eec_request_seconds', labels, elapsed)
     
+    phase_labels = {'endpoint': endpoint}
+    if g.get('analysis_type'):
+        phase_labels['analysis_type'] = g.analysis_type
+    for phase, seconds in timer.phases.items():
+        metrics.observe('eec_request_phase_seconds', {**phase_labels, 'phase': phase}, seconds)
+    if timer.rows:
+        metrics.inc('eec_rows_processed_total', phase_labels, timer.rows)
+    if request.content_length:
+        metrics.inc('eec_request_bytes_total', {'endpoint': endpoint}, request.content_length)
+    if not response.is_streamed and response.content_length is not None:
+        metrics.inc('eec_response_bytes_total', {'endpoint': endpoint}, response.content_length)
+    
+    if profile_requested():
+        # Phases of a queued analysis ran on a job thread; show them with the request's own
+        phases = Counter(timer.phases)
+        job = g.get('job')
+        if job is not None and job.timer is not None and not job.cached:
+            phases.update(job.timer.phases)
+        timings = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in phases.items()]
+        timings.append(f'total;dur={elapsed * 1000:.3f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+@app.teardown_request
+def clear_request_timer(exc):
+    _timing.timer = None
+
+def _resident_bytes():
+    """Current resident set size, or None where /proc is unavailable"""
     try:
-        df = pd.read_csv(filepath)
-        
-        # Get columns requested in query parameters
-        x_col = request.args.get('x')
-        y_col = request.args.get('y')
-        
-        if not x_col or not y_col:
-            return jsonify({'error': 'Missing x or y column parameters'}), 400
-        
-        if x_col not in df.columns or y_col not in df.columns:
-            return jsonify({'error': 'Requested columns not found in data'}), 400
-        
-        # Extract the data for the requested columns
-        data = {
-            'x': df[x_col].tolist(),
-            'y': df[y_col].tolist(),
-            'x_label': x_col,
-            'y_label': y_col
-        }
-        
-        return jsonify({
-            'success': True,
-            'data': data
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
 
+def _peak_resident_bytes():
+    """Peak resident set size, or None where the resource module is unavailable"""
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
 
+@app.route('/metrics')
+def get_metrics():
+    """Request, phase, cache and memory metrics in the Prometheus text format"""
+    cache = dataset_cache.stats()
+    analysis = analysis_jobs.stats()
+    results = analysis['results']
+    budget = load_budget.stats()
+    live = live_meters.stats()
+    shared = shared_store.stats()
+    sampled = [
+        ('eec_dataset_cache_hits_total', 'counter', 'Dataset cache hits', [({}, cache['hits'])]),
+        ('eec_dataset_cache_misses_total', 'counter', 'Dataset cache misses', [({}, cache['misses'])]),
+        ('eec_dataset_cache_evictions_total', 'counter', 'Dataset cache evictions', [({}, cache['evictions'])]),
+        ('eec_dataset_cache_hit_ratio', 'gauge', 'Share of dataset cache lookups that hit', [({}, cache['hit_rate'])]),
+        ('eec_dataset_cache_bytes', 'gauge', 'Memory held by the dataset cache', [({}, cache['bytes'])]),
+        ('eec_analysis_result_hits_total', 'counter', 'Analysis result cache hits', [({}, results['hits'])]),
+        ('eec_analysis_result_misses_total', 'counter', 'Analysis result cache misses', [({}, results['misses'])]),
+        ('eec_analysis_result_hit_ratio', 'gauge', 'Share of analysis submissions answered from cache',
+         [({}, results['hit_rate'] or 0.0)]),
+        ('eec_analysis_coalesced_total', 'counter', 'Analysis submissions that joined a running job',
+         [({}, analysis['coalesced'])]),
+        ('eec_analysis_jobs_running', 'gauge', 'Analysis jobs queued or running', [({}, analysis['running'])]),
+        ('eec_load_budget_reserved_bytes', 'gauge', 'Memory reserved by dataset loads in progress',
+         [({}, budget['reserved_bytes'])]),
+        ('eec_loads_spilled_total', 'counter', 'Dataset loads served memory-mapped to stay within the load budget',
+         [({}, budget['spilled'])]),
+        ('eec_loads_refused_total', 'counter', 'Dataset loads refused by the load budget', [({}, budget['refused'])]),
+        ('eec_shared_generations_held', 'gauge', 'Shared dataset generations mapped by this process',
+         [({}, shared['generations_held'])]),
+        ('eec_shared_generations_published_total', 'counter', 'Shared dataset generations published by this process',
+         [({}, shared['published'])]),
+        ('eec_live_meters', 'gauge', 'Live meters held by this process', [({}, live['meters'])]),
+        ('eec_live_subscribers', 'gauge', 'Open live meter event streams', [({}, live['subscribers'])]),
+        ('eec_dataset_memory_bytes', 'gauge', 'Memory held by the latest load of a dataset, and with default dtypes',
+         [({'dataset': name, 'dtypes': dtypes}, report[key])
+          for name, report in memory_reports.stats().items()
+          for dtypes, key in (('loaded', 'bytes'), ('default', 'default_bytes'))]),
+    ]
+    resident = _resident_bytes()
+    if resident is not None:
+        sampled.append(('eec_process_resident_bytes', 'gauge', 'Resident set size of this process', [({}, resident)]))
+    peak = _peak_resident_bytes()
+    if peak is not None:
+        sampled.append(('eec_process_peak_resident_bytes', 'gauge', 'Peak resident set size of this process', [({}, peak)]))
+    return Response(metrics.render(sampled), mimetype='text/plain; version=0.0.4')
 
-@app.route('/analyze', methods=['POST'])
-def analyze_data():
-    data = request.json
-    filename = data.get('filename')
-    analysis_type = data.get('analysis_type')
+@functools.lru_cache(maxsize=None)
+def _bill_templates():
+    """
+    Paragraph and table styles shared by every bill rendered in this process
+
+    Built once per process instead of once per bill, which matters when a
+    billing run renders thousands of PDFs.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import TableStyle
     
-    if not filename or not analysis_type:
-        return jsonify({'error': 'Missing required parameters'}), 400
+    styles = getSampleStyleSheet()
+    info_table = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ])
+    breakdown_table = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ])
+    return {
+        'title': styles['Heading1'],
+        'subtitle': styles['Heading2'],
+        'normal': styles['Normal'],
+        'info_table': info_table,
+        'breakdown_table': breakdown_table
+    }
+
+def render_bill_pdf(data):
+    """
+    Render one electricity bill
+
+    Args:
+        data: Dict with total_consumption, energy_charges, fixed_charges and
+            optionally customer_name, account_number, billing_period,
+            billing_days and tariff_type; bill_document() adds the tariff
+            rates and itemised lines of a bill computed by the tariff engine
+
+    Returns:
+        The PDF as bytes
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
     
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    templates = _bill_templates()
+    title_style = templates['title']
+    subtitle_style = templates['subtitle']
     
-    try:
-        df = pd.read_csv(filepath)
-        results = {}
-        
-        if analysis_type == 'statistics':
-            # Calculate basic statistics
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-            stats = {}
-            for col in numeric_cols:
-                stats[col] = {
-                    'mean': float(df[col].mean()),
-                    'median': float(df[col].median()),
-                    'std': float(df[col].std()),
-                    'min': float(df[col].min()),
-                    'max': float(df[col].max()),
-                    'q1': float(df[col].quantile(0.25)),
-                    'q3': float(df[col].quantile(0.75))
-                }
-            results['statistics'] = stats
-            
-        elif analysis_type == 'correlation':
-            # Calculate correlation matrix
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-            corr_matrix = df[numeric_cols].corr().round(3)
-            # Convert to dictionary format
-            corr_dict = {}
-            for col in corr_matrix.columns:
-                corr_dict[col] = corr_matrix[col].to_dict()
-            results['correlation'] = corr_dict
-            
-        elif analysis_type == 'time_series':
-            # Check if there's a date column
-            date_cols = [col for col in df.columns if 'date' in col.lower() or 'time' in col.lower()]
-            if not date_cols:
-                return jsonify({'error': 'No date or time column found for time series analysis'}), 400
-            
-            date_col = date_cols[0]
-            # Convert to datetime if not already
-            try:
-                df[date_col] = pd.to_datetime(df[date_col])
-            except:
-                return jsonify({'error': f'Could not convert {date_col} to datetime'}), 400
-            
-            # Get numeric columns for analysis
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-            # Calculate monthly averages
-            df['month'] = df[date_col].dt.to_period('M')
-            monthly_avg = df.groupby('month')[numeric_cols].mean().reset_index()
-            monthly_avg['month'] = monthly_avg['month'].astype(str)
-            results['time_series'] = {
-                'monthly_averages': monthly_avg.to_dict('records')
-            }
-            
-        elif analysis_type == 'anomaly_detection':
-            # Simple anomaly detection using Z-score
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-            anomalies = {}
-            for col in numeric_cols:
-                mean = df[col].mean()
-                std = df[col].std()
-                # Consider values beyond 3 standard deviations as anomalies
-                lower_bound = mean - 3 * std
-                upper_bound = mean + 3 * std
-                anomaly_indices = df[(df[col] < lower_bound) | (df[col] > upper_bound)].index.tolist()
-                if anomaly_indices:
-                    anomalies[col] = {
-                        'indices': anomaly_indices[:10],  # Limit to first 10 anomalies
-                        'values': df.loc[anomaly_indices[:10], col].tolist(),
-                        'lower_bound': float(lower_bound),
-                        'upper_bound': float(upper_bound)
-                    }
-            results['anomalies'] = anomalies
-            
-        elif analysis_type == 'patterns':
-            # Detect patterns - simple trend analysis
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-            patterns = {}
-            # Check for date columns
-            date_col = None
-            for col in df.columns:
-                try:
-                    pd.to_datetime(df[col])
-                    date_col = col
-                    break
-                except:
-                    continue
-            
-            if date_col:
-                df['temp_date'] = pd.to_datetime(df[date_col])
-                df = df.sort_values('temp_date')
-                for col in numeric_cols:
-                    # Calculate trend (simple linear regression)
-                    x = np.arange(len(df))
-                    y = df[col].values
-                    # Calculate slope using numpy's polyfit
-                    try:
-                        slope, intercept = np.polyfit(x, y, 1)
-                        patterns[col] = {
-                            'trend': 'increasing' if slope > 0.01 else 'decreasing' if slope < -0.01 else 'stable',
-                            'slope': float(slope),
-                            'trend_strength': abs(float(slope)) / df[col].std() if df[col].std() > 0 else 0
-                        }
-                    except Exception as e:
-                        patterns[col] = {
-                            'trend': 'unknown',
-                            'error': str(e)
-                        }
-                df = df.drop('temp_date', axis=1)
-                results['patterns'] = patterns
-            else:
-                results['patterns'] = {'error': 'No date column found for pattern analysis'}
-        
-        else:
-            return jsonify({'error': f'Unknown analysis type: {analysis_type}'}), 400
-        
-        return jsonify({
-            'success': True,
-            'analysis_type': analysis_type,
-            'results': results
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/data/<filename>')
-def get_data(filename):
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    # Create a PDF in memory
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
     
-    try:
-        df = pd.read_csv(filepath)
-        
-        # Get columns requested in query parameters
-        x_col = request.args.get('x')
-        y_col = request.args.get('y')
-        
-        if not x_col or not y_col:
-            return jsonify({'error': 'Missing x or y column parameters'}), 400
-        
-        if x_col not in df.columns or y_col not in df.columns:
-            return jsonify({'error': 'Requested columns not found in data'}), 400
-        
-        # Extract the data for the requested columns
-        data = {
-            'x': df[x_col].tolist(),
-            'y': df[y_col].tolist(),
-            'x_label': x_col,
-            'y_label': y_col
-        }
-        
-        return jsonify({
-            'success': True,
-            'data': data
-        })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    # Title
+    elements.append(Paragraph("Electricity Bill", title_style))
+    elements.append(Spacer(1, 12))
+    
+    # Customer Information
+    elements.append(Paragraph("Customer Information", subtitle_style))
+    elements.append(Spacer(1, 6))
+    
+    account_number = data.get('account_number') or "MAHA" + str(random.randint(10000000, 99999999))
+    customer_info = [
+        ["Customer Name:", data.get('customer_name', 'Sample Customer')],
+        ["Account Number:", str(account_number)],
+        ["Billing Period:", data.get('billing_period', 'Current Month')],
+        ["Bill Date:", datetime.now().strftime("%d-%m-%Y")]
+    ]
+    
+    t = Table(customer_info, colWidths=[150, 350])
+    t.setStyle(templates['info_table'])
+    elements.append(t)
+    elements.append(Spacer(1, 12))
+    
+    # Tariff Information
+    if data.get('tariff_rates'):
+        elements.append(Paragraph("Electricity Tariff Rates", subtitle_style))
+        tariff_info = data['tariff_rates']
+    else:
+        elements.append(Paragraph("Maharashtra Electricity Tariff Rates", subtitle_style))
+        tariff_info = Tariff.from_dict(DEFAULT_TARIFF).describe()
+        tariff_info[0] = ["Tariff Category:", data.get('tariff_type', 'Residential')]
+    elements.append(Spacer(1, 6))
+    
+    t = Table(tariff_info, colWidths=[200, 300])
+    t.setStyle(templates['info_table'])
+    elements.append(t)
+    elements.append(Spacer(1, 12))
+    
+    # Consumption Summary
+    elements.append(Paragraph("Consumption Summary", subtitle_style))
+    elements.append(Spacer(1, 6))
+    
+    total_consumption = data.get('total_consumption', 0)
+    billing_days = data.get('billing_days', 30)
+    
+    consumption_summary = [
+        ["Total Consumption:", f"{total_consumption} kWh"],
+        ["Billing Period:", f"{billing_days} days"],
+        ["Average Daily Consumption:", f"{round(total_consumption/billing_days, 2)} kWh"]
+    ]
+    
+    t = Table(consumption_summary, colWidths=[200, 300])
+    t.setStyle(templates['info_table'])
+    elements.append(t)
+    elements.append(Spacer(1, 12))
+    
+    # Bill Breakdown
+    elements.append(Paragraph("Bill Breakdown", subtitle_style))
+    elements.append(Spacer(1, 6))
+    
+    energy_charges = data.get('energy_charges', 0)
+    fixed_charges = data.get('fixed_charges', 0)
+    total_bill = energy_charges + fixed_charges
+    
+    bill_data = [["Description", "Units", "Rate (₹)", "Amount (₹)"]]
+    if 'energy_lines' in data:
+        # Itemised lines of a bill computed by the tariff engine
+        per = data.get('period_unit', 'month')
+        for line in data['energy_lines']:
+            bill_data.append([line['name'], f"{line['units']} kWh", f"{line['rate']:.2f}", f"{line['amount']:.2f}"])
+        for line in data.get('fixed_lines', []):
+            bill_data.append([line['name'], f"1 {per}", f"{line['amount']:.2f}", f"{line['amount']:.2f}"])
+    else:
+        bill_data += [
+            ["Energy Charges", f"{total_consumption} kWh", "Variable", f"{energy_charges:.2f}"],
+            ["Fixed Charges", "1 month", "90.00", f"{fixed_charges:.2f}"]
+        ]
+    bill_data.append(["Total Amount Due", "", "", f"{total_bill:.2f}"])
+    
+    t = Table(bill_data, colWidths=[150, 100, 100, 150])
+    t.setStyle(templates['breakdown_table'])
+    elements.append(t)
+    
+    # Build PDF
+    with timed('render'):
+        doc.build(elements)
+    
+    # Get PDF from buffer
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
+
+def bill_document(bill, billing_period=None):
+    """
+    Fields for render_bill_pdf from one period of a compute_bill() result
+
+    Args:
+        bill: Result of compute_bill()
+        billing_period: Label of the period to print; the latest by default
+
+    Raises:
+        ValueError: If the bill has no such period
+    """
+    periods = bill['periods']
+    if billing_period:
+        periods = [p for p in periods if p['period'] == billing_period]
+    if not periods:
+        raise ValueError(f'No readings in billing period {billing_period}' if billing_period else 'No readings to bill')
+    period = periods[-1]
+    return {
+        'tariff_type': bill['tariff'],
+        'tariff_rates': bill['tariff_rates'],
+        'billing_period': period['period'],
+        'billing_days': period['billing_days'],
+        'total_consumption': period['consumption_kwh'],
+        'energy_charges': period['energy_charges'],
+        'fixed_charges': period['fixed_charges'],
+        'energy_lines': period['energy'],
+        'fixed_lines': period['fixed'],
+        'period_unit': 'bill' if bill['billing_period'] == 'all' else bill['billing_period']
+    }
+
+def resolve_bill_data(data):
+    """
+    Bill request fields, with the charges computed server side when the
+    request names an uploaded dataset ("filename") and optionally a tariff
+    and billing period
+    """
+    if not data.get('filename'):
+        return data
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(data['filename']))
+    if not os.path.isfile(filepath):
+        raise ValueError(f'File not found: {data["filename"]}')
+    bill = compute_bill(filepath, data.get('tariff'), data.get('period', 'month'))
+    return {**data, **bill_document(bill, data.get('billing_period'))}
+
+def render_account_bill(account):
+    """Resolve and render one account's bill; executed in a worker process"""
+    return render_bill_pdf(resolve_bill_data(account))
+
+def _bill_filename(account):
+    name = secure_filename(str(account.get('account_number', ''))) or 'account'
+    return f'bill_{name}.pdf'
+
+def iter_rendered_bills(accounts, workers=None):
+    """
+    Render bills across worker processes, yielding (pdf, None) or
+    (None, error message) per account in input order
+
+    An account whose bill fails does not stop the others. At most a few
+    bills per worker are in flight at any time, so memory stays bounded
+    however many accounts are billed.
+    """
+    workers = max(1, min(workers or app.config['FLEET_WORKERS'], len(accounts) or 1))
+    window = workers * 4
+    pending = deque()
+
+    def outcome(future):
+        error = future.exception()
+        return (None, str(error) or type(error).__name__) if error is not None else (future.result(), None)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for account in accounts:
+            pending.append(executor.submit(render_account_bill, account))
+            if len(pending) >= window:
+                yield outcome(pending.popleft())
+        while pending:
+            yield outcome(pending.popleft())
+
+def _bill_summary(accounts, failed, seconds):
+    """Throughput and failed accounts of a batch bill run"""
+    rendered = len(accounts) - len(failed)
+    return {
+        'bills': rendered,
+        'failed': failed,
+        'seconds': round(seconds, 4),
+        'bills_per_second': round(rendered / seconds, 2) if seconds > 0 else None
+    }
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file object whose contents are drained piecewise"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _unique_names(names):
+    """Suffix repeated archive names so accounts sharing a number keep separate files"""
+    seen = Counter()
+    for name in names:
+        seen[name] += 1
+        if seen[name] > 1:
+            stem, ext = os.path.splitext(name)
+            name = f'{stem}_{seen[name]}{ext}'
+        yield name
 
 # Generate PDF bill
 @app.route('/generate_bill_pdf', methods=['POST'])
@@ -412,121 +4879,12 @@ def generate_bill_pdf():
     try:
         data = request.json
         
-        # Create a PDF in memory
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        elements = []
-        
-        # Styles
-        styles = getSampleStyleSheet()
-        title_style = styles['Heading1']
-        subtitle_style = styles['Heading2']
-        normal_style = styles['Normal']
-        
-        # Title
-        elements.append(Paragraph("Electricity Bill", title_style))
-        elements.append(Spacer(1, 12))
-        
-        # Customer Information
-        elements.append(Paragraph("Customer Information", subtitle_style))
-        elements.append(Spacer(1, 6))
-        
-        customer_info = [
-            ["Customer Name:", "Sample Customer"],
-            ["Account Number:", "MAHA" + str(random.randint(10000000, 99999999))],
-            ["Billing Period:", data.get('billing_period', 'Current Month')],
-            ["Bill Date:", datetime.now().strftime("%d-%m-%Y")]
-        ]
-        
-        t = Table(customer_info, colWidths=[150, 350])
-        t.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
-        elements.append(t)
-        elements.append(Spacer(1, 12))
-        
-        # Tariff Information
-        elements.append(Paragraph("Maharashtra Electricity Tariff Rates", subtitle_style))
-        elements.append(Spacer(1, 6))
-        
-        tariff_info = [
-            ["Tariff Category:", data.get('tariff_type', 'Residential')],
-            ["Energy Charge (0-100 units):", "₹3.05/unit"],
-            ["Energy Charge (101-300 units):", "₹6.40/unit"],
-            ["Energy Charge (301-500 units):", "₹8.50/unit"],
-            ["Energy Charge (501+ units):", "₹9.50/unit"],
-            ["Fixed Charge:", "₹90.00/month"]
-        ]
-        
-        t = Table(tariff_info, colWidths=[200, 300])
-        t.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
-        elements.append(t)
-        elements.append(Spacer(1, 12))
-        
-        # Consumption Summary
-        elements.append(Paragraph("Consumption Summary", subtitle_style))
-        elements.append(Spacer(1, 6))
-        
-        total_consumption = data.get('total_consumption', 0)
-        billing_days = data.get('billing_days', 30)
-        
-        consumption_summary = [
-            ["Total Consumption:", f"{total_consumption} kWh"],
-            ["Billing Period:", f"{billing_days} days"],
-            ["Average Daily Consumption:", f"{round(total_consumption/billing_days, 2)} kWh"]
-        ]
-        
-        t = Table(consumption_summary, colWidths=[200, 300])
-        t.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
-        elements.append(t)
-        elements.append(Spacer(1, 12))
-        
-        # Bill Breakdown
-        elements.append(Paragraph("Bill Breakdown", subtitle_style))
-        elements.append(Spacer(1, 6))
-        
-        energy_charges = data.get('energy_charges', 0)
-        fixed_charges = data.get('fixed_charges', 0)
-        total_bill = energy_charges + fixed_charges
-        
-        bill_data = [
-            ["Description", "Units", "Rate (₹)", "Amount (₹)"],
-            ["Energy Charges", f"{total_consumption} kWh", "Variable", f"{energy_charges:.2f}"],
-            ["Fixed Charges", "1 month", "90.00", f"{fixed_charges:.2f}"],
-            ["Total Amount Due", "", "", f"{total_bill:.2f}"]
-        ]
-        
-        t = Table(bill_data, colWidths=[150, 100, 100, 150])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-        ]))
-        elements.append(t)
-        
-        # Build PDF
-        doc.build(elements)
-        
-        # Get PDF from buffer
-        pdf_data = buffer.getvalue()
-        buffer.close()
+        # Charges are computed from the dataset when a filename is given
+        try:
+            data = resolve_bill_data(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        pdf_data = render_bill_pdf(data)
         
         # Create response
         response = make_response(pdf_data)
@@ -535,8 +4893,145 @@ def generate_bill_pdf():
         
         return response
     
+    except DatasetTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 507
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/generate_bill_pdf/batch', methods=['POST'])
+def generate_bill_pdf_batch():
+    """
+    Render bills for many accounts in parallel
+
+    Accepts {"accounts": [{...}, ...]} where each account carries the same
+    fields as /generate_bill_pdf plus account_number; accounts naming a
+    "filename" are billed from that dataset in the worker. By default the PDFs
+    are streamed back as a ZIP archive whose last entry, summary.json,
+    reports throughput. With {"output": "directory"} they are written to
+    BILL_OUTPUT_FOLDER/<run> instead and the summary is returned as JSON.
+    Accounts whose bill fails are left out and listed under "failed" in
+    the summary, with their account number and error.
+    """
+    data = request.json or {}
+    accounts = data.get('accounts')
+    if not isinstance(accounts, list) or not accounts:
+        return jsonify({'error': 'accounts must be a non-empty list'}), 400
+    if not all(isinstance(account, dict) for account in accounts):
+        return jsonify({'error': 'Each account must be an object'}), 400
+    # Catch bad tariffs, missing datasets and bad worker counts before any worker starts
+    try:
+        workers = requested_workers(data.get('workers'))
+        for account in accounts:
+            if account.get('filename'):
+                Tariff.from_dict(account.get('tariff') or DEFAULT_TARIFF)
+                if account.get('period', 'month') not in BILLING_PERIODS:
+                    raise ValueError(f'Unknown billing period: {account["period"]}')
+                if not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(account['filename']))):
+                    raise ValueError(f'File not found: {account["filename"]}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if data.get('output') == 'directory':
+        run = secure_filename(data.get('run') or datetime.now().strftime('%Y%m%d_%H%M%S'))
+        folder = os.path.join(app.config['BILL_OUTPUT_FOLDER'], run)
+        os.makedirs(folder, exist_ok=True)
+        started = time.perf_counter()
+        failed = []
+        try:
+            names = _unique_names(_bill_filename(account) for account in accounts)
+            for account, name, (pdf, error) in zip(accounts, names, iter_rendered_bills(accounts, workers)):
+                if error is not None:
+                    failed.append({'account_number': account.get('account_number'), 'error': error})
+                    continue
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(pdf)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({
+            'success': True,
+            'folder': folder,
+            **_bill_summary(accounts, failed, time.perf_counter() - started)
+        })
+    
+    def generate():
+        sink = _ChunkSink()
+        started = time.perf_counter()
+        failed = []
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            names = _unique_names(_bill_filename(account) for account in accounts)
+            for account, name, (pdf, error) in zip(accounts, names, iter_rendered_bills(accounts, workers)):
+                if error is not None:
+                    failed.append({'account_number': account.get('account_number'), 'error': error})
+                    continue
+                archive.writestr(name, pdf)
+                yield sink.drain()
+            summary = _bill_summary(accounts, failed, time.perf_counter() - started)
+            archive.writestr('summary.json', json.dumps(summary))
+        yield sink.drain()
+    
+    response = Response(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=electricity_bills.zip'
+    return response
+
+def warm_up(background=True):
+    """
+    Import the dependencies deferred at startup before a request needs them
+
+    Builds the bill templates, which imports ReportLab, and imports pyarrow
+    when it is installed, so the first PDF bill or Arrow response does not
+    pay for them.
+
+    Args:
+        background: Run in a daemon thread instead of the calling thread
+
+    Returns:
+        The warm-up thread, or None when run in the calling thread
+    """
+    def run():
+        started = time.perf_counter()
+        _bill_templates()
+        if ARROW_AVAILABLE:
+            _pyarrow()
+        app.logger.info('Warm-up finished in %.3fs', time.perf_counter() - started)
+    
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+def configure_app(config=None):
+    """
+    Configure the module's app for serving
+
+    Importing this module builds the app, and the caches, pools and
+    budgets it uses, from environment variables; there is one app per
+    process. configure_app() applies config on top of that and resizes
+    those to match. With WARMUP set it then starts warm_up() in the
+    background, so a worker accepts requests before ReportLab is loaded.
+    Serve it with gunicorn 'app:configure_app()'.
+
+    Args:
+        config: Optional dict of app.config overrides
+
+    Returns:
+        The Flask app
+    """
+    if config:
+        app.config.update(config)
+    dataset_cache.max_bytes = app.config['DATASET_CACHE_BYTES']
+    load_budget.max_bytes = app.config['LOAD_BUDGET_BYTES']
+    # Takes effect unless a job has already started the thread pool
+    analysis_jobs.workers = app.config['ANALYSIS_WORKERS']
+    analysis_jobs.results.max_entries = app.config['ANALYSIS_RESULT_ENTRIES']
+    analysis_jobs.results.ttl = app.config['ANALYSIS_RESULT_TTL']
+    live_meters.capacity = app.config['LIVE_WINDOW_READINGS']
+    live_meters.max_meters = app.config['LIVE_MAX_METERS']
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    if app.config['WARMUP']:
+        warm_up()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    configure_app().run(debug=True)
\ No newline at end of file
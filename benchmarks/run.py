@@ -0,0 +1,240 @@
+"""
+Benchmark the endpoints of app.py on synthetic meter data
+
+Drives /upload, /data, every /analyze type and /generate_bill_pdf through
+the Flask test client for each dataset size and records latency,
+throughput and peak RSS per operation. Results are written as JSON so a
+later run can be compared against them:
+
+    python benchmarks/run.py --sizes 10k,100k,1M --output benchmarks/baseline.json
+    python benchmarks/run.py --sizes 10k,100k,1M --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+# POSIX only; without it peak RSS is only read from /proc where there is one
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as meter_app
+from synthetic import generate_meter_data, write_meter_csv
+
+FILENAME = 'benchmark_meter.csv'
+DEFAULT_SIZES = '10k,100k,1M'
+# Fine enough that 10M readings stay within the timestamps pandas can represent
+DEFAULT_RESOLUTION = '1min'
+# An operation counts as a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 1.25
+
+
+def parse_size(text):
+    """Parse '10k', '1M' or '250000' to a row count"""
+    text = text.strip().lower()
+    scale = {'k': 10 ** 3, 'm': 10 ** 6}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter; returns False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where the platform does not report it"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def clear_caches():
+    """Drop everything the app keeps between requests, so each operation starts cold"""
+    meter_app.dataset_cache.clear()
+    meter_app.analysis_jobs.results.clear()
+    meter_app.statistics_scan.invalidate(os.path.join(meter_app.app.config['UPLOAD_FOLDER'], FILENAME))
+    meter_app.correlation_scan.invalidate(os.path.join(meter_app.app.config['UPLOAD_FOLDER'], FILENAME))
+
+
+def measure(name, rows, request, warm=False):
+    """
+    Time one request
+
+    Returns:
+        Dict with the operation name, rows, seconds, rows per second, peak
+        RSS, response size and status code
+    """
+    if not warm:
+        clear_caches()
+    reset_peak_rss()
+    started = time.perf_counter()
+    response = request()
+    seconds = time.perf_counter() - started
+    body = response.get_data()
+    peak = peak_rss_mb()
+    result = {
+        'operation': name,
+        'rows': rows,
+        'seconds': round(seconds, 6),
+        'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        'response_bytes': len(body),
+        'status': response.status_code
+    }
+    if response.status_code >= 400:
+        result['error'] = body[:200].decode('utf-8', 'replace')
+    return result
+
+
+def operations(client, csv_path, df):
+    """(name, request) pairs covering every benchmarked endpoint"""
+    x = 'Date'
+    y = 'Electricity_Consumption_kWh'
+    start = df['Date'].iloc[len(df) // 2]
+    week = start + pd.Timedelta(days=7)
+
+    def upload():
+        with open(csv_path, 'rb') as f:
+            return client.post('/upload', data={'file': (f, FILENAME)}, content_type='multipart/form-data')
+
+    def analyze(analysis_type, **params):
+        return lambda: client.post('/analyze', json={'filename': FILENAME, 'analysis_type': analysis_type, **params})
+
+    yield 'upload', upload
+    yield 'data_full', lambda: client.get(f'/data/{FILENAME}?x={x}&y={y}')
+    yield 'data_downsampled', lambda: client.get(f'/data/{FILENAME}?x={x}&y={y}&max_points=2000')
+    yield 'data_columns', lambda: client.get(f'/data/{FILENAME}?x={x}&y={y}&format=columns')
+    yield 'data_week', lambda: client.get(f'/data/{FILENAME}?x={x}&y={y}&start={start.isoformat()}&end={week.isoformat()}')
+    for analysis_type in meter_app.ANALYSIS_TYPES:
+        yield f'analyze_{analysis_type}', analyze(analysis_type)
+    yield 'analyze_statistics_streaming', analyze('statistics', streaming=True)
+    yield 'generate_bill_pdf', lambda: client.post('/generate_bill_pdf', json={'filename': FILENAME})
+
+
+def run(sizes, resolution, seed, warm, compact=False):
+    meter_app.app.config['COMPACT_DTYPES'] = compact
+    # 10M rows at one-minute resolution exceed the default upload limit
+    meter_app.app.config['MAX_CONTENT_LENGTH'] = None
+    folder = tempfile.mkdtemp(prefix='eec-bench-')
+    meter_app.app.config['UPLOAD_FOLDER'] = os.path.join(folder, 'uploads')
+    os.makedirs(meter_app.app.config['UPLOAD_FOLDER'])
+    client = meter_app.app.test_client()
+    results = []
+    try:
+        for rows in sizes:
+            df = generate_meter_data(rows=rows, resolution=resolution, seed=seed)
+            csv_path = os.path.join(folder, FILENAME)
+            write_meter_csv(df, csv_path)
+            file_mb = os.path.getsize(csv_path) / (1024 * 1024)
+            print(f'{rows:>10,} rows ({file_mb:.1f} MiB)', file=sys.stderr)
+
+            for name, request in operations(client, csv_path, df):
+                result = measure(name, rows, request, warm)
+                if name == 'upload':
+                    result['mb_per_second'] = round(file_mb / result['seconds'], 2)
+                results.append(result)
+                peak = f'{result["peak_rss_mb"]:>9.1f} MiB' if result['peak_rss_mb'] is not None else ''
+                print(f'  {name:<32} {result["seconds"]:>9.4f}s {peak}'
+                      f'{"  HTTP " + str(result["status"]) if result["status"] >= 400 else ""}', file=sys.stderr)
+                if name == 'upload' and result['status'] >= 400:
+                    # The other operations would read the previous size's file
+                    break
+            del df
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each operation's time against the baseline
+
+    Returns:
+        List of (operation, rows, ratio) slower than tolerance
+    """
+    previous = {(r['operation'], r['rows']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['operation'], result['rows']))
+        if before is None or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = ''
+        if ratio > tolerance:
+            regressions.append((result['operation'], result['rows'], ratio))
+            flag = '  REGRESSION'
+        print(f'{result["operation"]:<32} {result["rows"]:>10,} {before["seconds"]:>9.4f}s -> '
+              f'{result["seconds"]:>9.4f}s ({ratio:.2f}x){flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Comma-separated row counts (default {DEFAULT_SIZES}; up to 10M)')
+    parser.add_argument('--resolution', default=DEFAULT_RESOLUTION,
+                        help=f'Reading interval of the synthetic data (default {DEFAULT_RESOLUTION})')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--warm', action='store_true', help='Keep caches between operations')
+    parser.add_argument('--compact', action='store_true', help='Load datasets with COMPACT_DTYPES')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Slowdown ratio reported as a regression (default {DEFAULT_TOLERANCE})')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    results = run(sizes, args.resolution, args.seed, args.warm, args.compact)
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'resolution': args.resolution,
+            'seed': args.seed,
+            'warm': args.warm,
+            'compact_dtypes': args.compact
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmark how long a fresh worker takes to serve its first requests
+
+Each repeat starts a new interpreter that imports app.py, calls
+configure_app() and sends its first requests through the Flask test client:
+the dashboard, /cache/stats and a PDF bill. The medians are written as JSON
+so a later run, or another checkout, can be compared against them:
+
+    python benchmarks/startup.py --output benchmarks/startup_baseline.json
+    python benchmarks/startup.py --compare benchmarks/startup_baseline.json
+    git worktree add ../eec-before <commit>
+    python benchmarks/startup.py --app-dir ../eec-before --output benchmarks/startup_before.json
+
+Also reported is the time to compile app.py, which every start pays when
+its bytecode cannot be cached (see "Deployment" in the README).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REPEATS = 7
+# A phase counts as a regression when it is this much slower than the baseline
+DEFAULT_TOLERANCE = 1.25
+BILL = {'customer_name': 'Startup Benchmark', 'total_consumption': 250, 'billing_days': 30}
+
+
+def child(warmup):
+    """Time one start in this process and print the phases as JSON"""
+    started = time.perf_counter()
+    import app as meter_app
+    phases = {'import': time.perf_counter() - started}
+
+    mark = time.perf_counter()
+    # Older checkouts name it create_app(), or have only the module-level app
+    configure_app = getattr(meter_app, 'configure_app', None) or getattr(meter_app, 'create_app', None)
+    app = configure_app({'WARMUP': warmup}) if configure_app else meter_app.app
+    phases['configure_app'] = time.perf_counter() - mark
+
+    client = app.test_client()
+    for name, request in (('first_response', lambda: client.get('/')),
+                          ('cache_stats', lambda: client.get('/cache/stats'))):
+        mark = time.perf_counter()
+        response = request()
+        phases[name] = time.perf_counter() - mark
+        assert response.status_code == 200, (name, response.status_code)
+    phases['time_to_first_response'] = phases['import'] + phases['configure_app'] + phases['first_response']
+    phases['modules_loaded'] = len(sys.modules)
+    phases['reportlab_at_startup'] = 'reportlab' in sys.modules
+
+    if warmup:
+        # A worker idles for a moment before its first bill arrives
+        mark = time.perf_counter()
+        for thread in meter_app.threading.enumerate():
+            if thread.name == 'warm-up':
+                thread.join()
+        phases['warm_up_wait'] = time.perf_counter() - mark
+    mark = time.perf_counter()
+    response = client.post('/generate_bill_pdf', json=BILL)
+    phases['first_bill'] = time.perf_counter() - mark
+    assert response.mimetype == 'application/pdf', response.get_data()[:200]
+    json.dump(phases, sys.stdout)
+
+
+def git_commit(app_dir):
+    """Commit checked out in app_dir, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=app_dir, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compile_seconds(app_dir, repeats):
+    """Median time to compile app.py from source"""
+    with open(os.path.join(app_dir, 'app.py')) as f:
+        source = f.read()
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        compile(source, 'app.py', 'exec')
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def run(app_dir, repeats, warmup):
+    """
+    Start repeats fresh workers
+
+    Returns:
+        Dict of each phase's median seconds
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [app_dir, os.environ.get('PYTHONPATH')])))
+    env.pop('WARMUP', None)
+    samples = []
+    with tempfile.TemporaryDirectory(prefix='eec-startup-') as folder:
+        # Prime the bytecode cache so every measured start reads it
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=folder, env=env, check=True)
+        for _ in range(repeats):
+            command = [sys.executable, os.path.abspath(__file__), '--child'] + (['--warmup'] if warmup else [])
+            output = subprocess.run(command, cwd=folder, env=env, check=True, capture_output=True, text=True).stdout
+            samples.append(json.loads(output))
+    results = {}
+    for phase, value in samples[0].items():
+        if not isinstance(value, float):
+            results[phase] = value
+        else:
+            results[phase] = round(statistics.median(sample[phase] for sample in samples), 6)
+    results['compile_app'] = round(compile_seconds(app_dir, repeats), 6)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each phase's time against the baseline
+
+    Returns:
+        List of (phase, ratio) slower than tolerance
+    """
+    previous = baseline['results']
+    regressions = []
+    for phase, seconds in results.items():
+        before = previous.get(phase)
+        if not isinstance(seconds, float) or not isinstance(before, float) or not before:
+            continue
+        ratio = seconds / before
+        flag = ''
+        if ratio > tolerance:
+            regressions.append((phase, ratio))
+            flag = '  REGRESSION'
+        print(f'{phase:<24} {before:>9.4f}s -> {seconds:>9.4f}s ({ratio:.2f}x){flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help=f'Fresh starts to measure (default {DEFAULT_REPEATS})')
+    parser.add_argument('--warmup', action='store_true', help='Start with WARMUP on and let it finish before the first bill')
+    parser.add_argument('--app-dir', default=REPO, help='Directory holding the app.py to measure (default this checkout)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Slowdown ratio reported as a regression (default {DEFAULT_TOLERANCE})')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.warmup)
+        return
+
+    app_dir = os.path.abspath(args.app_dir)
+    results = run(app_dir, args.repeats, args.warmup)
+    for phase, value in results.items():
+        print(f'  {phase:<24} {value:>9.4f}s' if isinstance(value, float) else f'  {phase:<24} {value!s:>10}',
+              file=sys.stderr)
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'commit': git_commit(app_dir),
+            'repeats': args.repeats,
+            'warmup': args.warmup
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,10 @@
 // Global variables
 let csvData = null;
 let currentChart = null;
+let liveSource = null;
+
+// Charts are downsampled on the server beyond this many points
+const MAX_CHART_POINTS = 2000;
 
 // DOM elements
 document.addEventListener('DOMContentLoaded', function() {
@@ -48,7 +52,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     detectPatternsBtn.addEventListener('click', () => performAnalysis('patterns'));
-    findAnomaliesBtn.addEventListener('click', () => performAnalysis('anomalies'));
+    findAnomaliesBtn.addEventListener('click', () => performAnalysis('anomaly_detection', {method: 'mad'}));
     calculateStatsBtn.addEventListener('click', () => performAnalysis('statistics'));
     
     exportChartBtn.addEventListener('click', exportChart);
@@ -69,6 +73,11 @@ document.addEventListener('DOMContentLoaded', function() {
     // Calculate cost button event
     calculateCostBtn.addEventListener('click', calculateCost);
     
+    // Live meter updates are pushed by the server instead of polled
+    document.getElementById('follow-live').addEventListener('click', function() {
+        followLiveMeter(document.getElementById('live-meter-id').value.trim());
+    });
+    
     // Initialize Chart.js
     Chart.defaults.font.family = "'Segoe UI', Tahoma, Geneva, Verdana, sans-serif";
     Chart.defaults.color = '#555';
@@ -306,13 +315,23 @@ function generateChart() {
         return;
     }
     
+    // Stop following a live meter, or its batches would be appended to this chart
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+    
     // Fetch the data for the selected columns
-    fetch(`/data/${csvData.filename}?x=${xColumn}&y=${yColumn}`)
+    fetch(`/data/${csvData.filename}?x=${xColumn}&y=${yColumn}&max_points=${MAX_CHART_POINTS}`)
     .then(response => response.json())
     .then(result => {
         if (result.success) {
             createChart(result.data, chartType);
             
+            if (result.downsampling && result.downsampling.applied) {
+                showSuccessToast(`Showing ${result.downsampling.returned_points} of ${result.downsampling.original_points} points`);
+            }
+            
             // Enable export chart button
             document.getElementById('export-chart').disabled = false;
             document.getElementById('export-analysis').disabled = false;
@@ -394,8 +413,62 @@ function createChart(data, chartType) {
     });
 }
 
+// Follow a live meter: the server sends its buffered window once, then each new batch
+function followLiveMeter(meterId) {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
+    if (!meterId) return;
+    
+    const chartType = document.getElementById('chart-type-select').value;
+    let column = null;
+    let capacity = 0;
+    
+    liveSource = new EventSource(`/live/${encodeURIComponent(meterId)}/events`);
+    
+    liveSource.addEventListener('snapshot', function(event) {
+        const snapshot = JSON.parse(event.data);
+        const selected = document.getElementById('y-axis-select').value;
+        column = snapshot.columns.includes(selected) ? selected :
+            snapshot.columns.includes('Electricity_Consumption_kWh') ? 'Electricity_Consumption_kWh' : snapshot.columns[0];
+        capacity = snapshot.capacity;
+        createChart({x: snapshot.x, y: snapshot.series[column], x_label: 'Time', y_label: column}, chartType);
+        document.getElementById('export-chart').disabled = false;
+    });
+    
+    liveSource.addEventListener('readings', function(event) {
+        const update = JSON.parse(event.data);
+        if (!currentChart || !column) return;
+        
+        // Append the new points and drop those the server no longer keeps
+        const labels = currentChart.data.labels;
+        const values = currentChart.data.datasets[0].data;
+        labels.push(...update.x);
+        values.push(...update.series[column]);
+        const excess = labels.length - capacity;
+        if (excess > 0) {
+            labels.splice(0, excess);
+            values.splice(0, excess);
+        }
+        currentChart.update('none');
+        
+        if (update.anomalies.length) {
+            showErrorToast(`${update.anomalies.length} anomalous reading(s) from ${meterId}`);
+        }
+    });
+    
+    liveSource.onerror = function() {
+        // The browser reconnects on its own unless the stream was refused
+        if (liveSource && liveSource.readyState === EventSource.CLOSED) {
+            showErrorToast(`Live meter ${meterId} is not available`);
+            liveSource = null;
+        }
+    };
+}
+
 // Perform analysis
-function performAnalysis(analysisType) {
+function performAnalysis(analysisType, params = {}) {
     if (!csvData) return;
     
     const analysisOutput = document.getElementById('analysis-output');
@@ -408,13 +481,14 @@ function performAnalysis(analysisType) {
         },
         body: JSON.stringify({
             filename: csvData.filename,
-            analysis_type: analysisType
+            analysis_type: analysisType,
+            ...params
         })
     })
     .then(response => response.json())
     .then(result => {
         if (result.success) {
-            displayAnalysisResults(result.analysis_type, result.results);
+            displayAnalysisResults(result.analysis_type, result.results, params);
         } else {
             analysisOutput.innerHTML = `<p>Error: ${result.error}</p>`;
         }
@@ -426,7 +500,7 @@ function performAnalysis(analysisType) {
 }
 
 // Display analysis results
-function displayAnalysisResults(analysisType, results) {
+function displayAnalysisResults(analysisType, results, params = {}) {
     const analysisOutput = document.getElementById('analysis-output');
     
     if (analysisType === 'statistics') {
@@ -493,8 +567,13 @@ function displayAnalysisResults(analysisType, results) {
         
         analysisOutput.innerHTML = html;
         
-    } else if (analysisType === 'anomalies') {
+    } else if (analysisType === 'anomaly_detection') {
         let html = '<h4>Anomaly Detection</h4>';
+        const pagination = results.pagination;
+        
+        if (pagination && pagination.total > 0) {
+            html += `<p>Showing ${pagination.returned} of ${pagination.total} anomalies</p>`;
+        }
         
         if (Object.keys(results.anomalies).length === 0) {
             html += '<p>No anomalies detected in the data.</p>';
@@ -527,7 +606,17 @@ function displayAnalysisResults(analysisType, results) {
             }
         }
         
+        if (pagination && pagination.next_cursor) {
+            html += '<button id="next-anomalies">Next page</button>';
+        }
+        
         analysisOutput.innerHTML = html;
+        
+        if (pagination && pagination.next_cursor) {
+            document.getElementById('next-anomalies').addEventListener('click', () => {
+                performAnalysis('anomaly_detection', {...params, cursor: pagination.next_cursor});
+            });
+        }
     }
 }
 
@@ -596,6 +685,29 @@ function exportAnalysis() {
     link.click();
 }
 
+// Build the tariff definition from the calculator settings
+function buildTariff() {
+    const tariffType = document.getElementById('tariff-structure').value;
+    
+    if (tariffType === 'flat') {
+        return {
+            name: 'Flat Rate',
+            rate: parseFloat(document.getElementById('base-rate').value)
+        };
+    }
+    
+    return {
+        name: 'Time of Use',
+        rate: parseFloat(document.getElementById('off-peak-rate').value),
+        time_of_use: [{
+            name: 'Peak',
+            start: parseInt(document.getElementById('peak-hours-start').value),
+            end: parseInt(document.getElementById('peak-hours-end').value),
+            rate: parseFloat(document.getElementById('peak-rate').value)
+        }]
+    };
+}
+
 // Calculate electricity cost
 function calculateCost() {
     if (!csvData) {
@@ -606,13 +718,22 @@ function calculateCost() {
     const costOutput = document.getElementById('cost-output');
     costOutput.innerHTML = '<p>Calculating costs...</p>';
     
-    // Get tariff settings
-    const tariffType = document.getElementById('tariff-structure').value;
-    let totalConsumption = 0;
-    let totalCost = 0;
+    const tariff = buildTariff();
     
-    // Get consumption data from the uploaded file
-    fetch(`/data/${csvData.filename}?x=Date&y=Electricity_Consumption_kWh`)
+    // Costs are computed on the server from the dataset's own timestamps,
+    // so only the bill breakdown is downloaded
+    fetch('/analyze', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            filename: csvData.filename,
+            analysis_type: 'billing',
+            tariff: tariff,
+            period: 'month'
+        })
+    })
     .then(response => response.json())
     .then(result => {
         if (!result.success) {
@@ -620,116 +741,48 @@ function calculateCost() {
             return;
         }
         
-        const consumptionData = result.data.y;
-        const dates = result.data.x;
+        const bill = result.results.billing;
         
-        // Calculate total consumption
-        totalConsumption = consumptionData.reduce((sum, value) => sum + parseFloat(value), 0);
-        
-        // Calculate cost based on tariff type
-        if (tariffType === 'flat') {
-            // Flat rate calculation
-            const baseRate = parseFloat(document.getElementById('base-rate').value);
-            totalCost = totalConsumption * baseRate;
-            
-            // Display results as a table
-            costOutput.innerHTML = `
-                <div class="cost-summary">
-                    <h4>Cost Summary (Flat Rate)</h4>
-                    <table class="cost-table">
-                        <thead>
-                            <tr>
-                                <th>Item</th>
-                                <th>Value</th>
-                            </tr>
-                        </thead>
-                        <tbody>
+        // One row per billing period, one column per charge line
+        const lineNames = bill.periods.length ? bill.periods[0].energy.map(line => line.name) : [];
+        const periodRows = bill.periods.map(period => `
                             <tr>
-                                <td>Total Consumption (kWh)</td>
-                                <td>${totalConsumption.toFixed(2)}</td>
-                            </tr>
-                            <tr>
-                                <td>Rate (₹/kWh)</td>
-                                <td>₹${baseRate.toFixed(2)}</td>
-                            </tr>
-                        </tbody>
-                        <tfoot>
-                            <tr>
-                                <td>Total Cost</td>
-                                <td>₹${totalCost.toFixed(2)}</td>
-                            </tr>
-                        </tfoot>
-                    </table>
-                </div>
-                <button id="generate-bill" class="btn btn-primary">Generate Bill PDF</button>
-            `;
-            
-            // Add event listener for the generate bill button
-            document.getElementById('generate-bill').addEventListener('click', () => generateBillPDF(totalConsumption, totalCost));
-            
-        } else {
-            // Time of use calculation
-            const peakRate = parseFloat(document.getElementById('peak-rate').value);
-            const offPeakRate = parseFloat(document.getElementById('off-peak-rate').value);
-            const peakStart = parseInt(document.getElementById('peak-hours-start').value);
-            const peakEnd = parseInt(document.getElementById('peak-hours-end').value);
-            
-            // Assume data is hourly and has timestamps
-            // For this demo, we'll just split the consumption evenly
-            const peakHours = peakEnd - peakStart;
-            const totalHours = 24;
-            const offPeakHours = totalHours - peakHours;
-            
-            // Estimate peak and off-peak consumption
-            const peakConsumption = totalConsumption * (peakHours / totalHours);
-            const offPeakConsumption = totalConsumption * (offPeakHours / totalHours);
-            
-            // Calculate costs
-            const peakCost = peakConsumption * peakRate;
-            const offPeakCost = offPeakConsumption * offPeakRate;
-            totalCost = peakCost + offPeakCost;
-            
-            // Display results as a table
-            costOutput.innerHTML = `
+                                <td>${period.period}</td>
+                                <td>${period.consumption_kwh.toFixed(2)}</td>
+                                ${period.energy.map(line => `<td>₹${line.amount.toFixed(2)}</td>`).join('')}
+                                <td>₹${period.total.toFixed(2)}</td>
+                            </tr>`).join('');
+        
+        costOutput.innerHTML = `
                 <div class="cost-summary">
-                    <h4>Cost Summary (Time of Use)</h4>
+                    <h4>Cost Summary (${bill.tariff})</h4>
+                    ${bill.warning ? `<p>${bill.warning}</p>` : ''}
                     <table class="cost-table">
                         <thead>
                             <tr>
-                                <th>Segment</th>
+                                <th>Period</th>
                                 <th>Consumption (kWh)</th>
-                                <th>Rate (₹/kWh)</th>
-                                <th>Cost (₹)</th>
+                                ${lineNames.map(name => `<th>${name}</th>`).join('')}
+                                <th>Total (₹)</th>
                             </tr>
                         </thead>
-                        <tbody>
-                            <tr>
-                                <td>Peak (${peakStart}:00–${peakEnd}:00)</td>
-                                <td>${peakConsumption.toFixed(2)}</td>
-                                <td>₹${peakRate.toFixed(2)}</td>
-                                <td>₹${peakCost.toFixed(2)}</td>
-                            </tr>
-                            <tr>
-                                <td>Off-Peak</td>
-                                <td>${offPeakConsumption.toFixed(2)}</td>
-                                <td>₹${offPeakRate.toFixed(2)}</td>
-                                <td>₹${offPeakCost.toFixed(2)}</td>
-                            </tr>
+                        <tbody>${periodRows}
                         </tbody>
                         <tfoot>
                             <tr>
-                                <td colspan="3">Total Cost</td>
-                                <td>₹${totalCost.toFixed(2)}</td>
+                                <td>Total</td>
+                                <td>${bill.totals.consumption_kwh.toFixed(2)}</td>
+                                <td colspan="${lineNames.length}"></td>
+                                <td>₹${bill.totals.total.toFixed(2)}</td>
                             </tr>
                         </tfoot>
                     </table>
                 </div>
                 <button id="generate-bill" class="btn btn-primary">Generate Bill PDF</button>
             `;
-            
-            // Add event listener for the generate bill button
-            document.getElementById('generate-bill').addEventListener('click', () => generateBillPDF(totalConsumption, totalCost));
-        }
+        
+        // The PDF is rendered from the same breakdown for the latest period
+        document.getElementById('generate-bill').addEventListener('click', () => generateBillPDF(tariff));
     })
     .catch(error => {
         console.error('Error:', error);
@@ -738,23 +791,24 @@ function calculateCost() {
 }
 
 // Generate bill PDF
-function generateBillPDF(totalConsumption, totalCost) {
-    const billingPeriod = csvData ? `${csvData.filename.replace('.csv', '')}` : 'Current Period';
-    
+function generateBillPDF(tariff) {
     fetch('/generate_bill_pdf', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-            total_consumption: totalConsumption,
-            total_cost: totalCost,
-            billing_period: billingPeriod,
-            billing_days: 30, // Default to 30 days
-            tariff_type: document.getElementById('tariff-structure').value
+            filename: csvData.filename,
+            tariff: tariff,
+            period: 'month'
         })
     })
-    .then(response => response.blob())
+    .then(response => {
+        if (!response.ok) {
+            return response.json().then(result => { throw new Error(result.error); });
+        }
+        return response.blob();
+    })
     .then(blob => {
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
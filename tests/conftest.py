@@ -0,0 +1,44 @@
+"""
+Fixtures shared by the tests: an isolated upload folder, a test client and
+synthetic meter files uploaded through /upload
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import app as meter_app
+from synthetic import generate_meter_data, write_meter_csv
+
+
+@pytest.fixture
+def upload_folder(tmp_path, monkeypatch):
+    folder = tmp_path / 'uploads'
+    folder.mkdir()
+    monkeypatch.setitem(meter_app.app.config, 'UPLOAD_FOLDER', str(folder))
+    yield folder
+    # Module-level caches outlive a test; results are keyed by content hash
+    meter_app.dataset_cache.clear()
+    meter_app.analysis_jobs.results.clear()
+
+
+@pytest.fixture
+def client(upload_folder):
+    return meter_app.app.test_client()
+
+
+@pytest.fixture
+def upload_meter(client, tmp_path):
+    """Upload synthetic readings and return the path of the stored file"""
+    def upload(filename='meter.csv', rows=2000, resolution='1h', seed=42):
+        source = tmp_path / f'source_{filename}'
+        write_meter_csv(generate_meter_data(rows=rows, resolution=resolution, seed=seed), source)
+        with open(source, 'rb') as f:
+            response = client.post('/upload', data={'file': (f, filename)}, content_type='multipart/form-data')
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return os.path.join(meter_app.app.config['UPLOAD_FOLDER'], filename)
+    return upload
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+import app as meter_app
+
+
+def analyze(client, **params):
+    return client.post('/analyze', json={'filename': 'meter.csv', 'analysis_type': 'anomaly_detection', **params})
+
+
+def flatten(anomalies):
+    """(row, column) of every anomaly in one page"""
+    return sorted((row, column) for column, entry in anomalies.items() for row in entry['indices'])
+
+
+def test_cursor_pages_cover_every_anomaly_once(client, upload_meter):
+    upload_meter(rows=3000)
+    everything = analyze(client, threshold=2.0, limit=meter_app.ANOMALY_MAX_PAGE_LIMIT).get_json()['results']
+    total = everything['pagination']['total']
+    assert 10 < total <= meter_app.ANOMALY_MAX_PAGE_LIMIT
+    assert everything['pagination']['next_cursor'] is None
+
+    seen = []
+    cursor = None
+    while True:
+        results = analyze(client, threshold=2.0, limit=7, cursor=cursor).get_json()['results']
+        assert results['pagination']['total'] == total
+        seen += flatten(results['anomalies'])
+        cursor = results['pagination']['next_cursor']
+        if cursor is None:
+            break
+    assert len(seen) == total
+    assert sorted(seen) == flatten(everything['anomalies'])
+
+
+def test_counts_cover_all_pages(client, upload_meter):
+    upload_meter(rows=3000)
+    page = analyze(client, threshold=2.0, limit=3).get_json()['results']
+    assert page['pagination']['returned'] == 3
+    assert sum(entry['count'] for entry in page['anomalies'].values()) == page['pagination']['total']
+
+
+def test_rejects_malformed_cursors(client, upload_meter):
+    upload_meter(rows=500)
+    for cursor in ('not-a-cursor', 5, ['x']):
+        response = analyze(client, cursor=cursor)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid cursor'
+
+
+def reference_ewma(values, alpha=0.05, threshold=3.0, warmup=30):
+    """Row-by-row EWMA detector the vectorized one must reproduce"""
+    count, mean, var = np.zeros(values.shape[1], dtype=np.int64), np.zeros(values.shape[1]), np.zeros(values.shape[1])
+    flags = np.zeros(values.shape, dtype=bool)
+    for r, row in enumerate(values):
+        valid = ~np.isnan(row)
+        spread = threshold * np.sqrt(var)
+        flags[r] = valid & (count >= warmup) & ((row < mean - spread) | (row > mean + spread))
+        first = valid & (count == 0)
+        delta = np.where(valid, row - mean, 0.0)
+        var = np.where(valid & ~first, (1 - alpha) * (var + alpha * delta ** 2), var)
+        mean = np.where(first, np.where(valid, row, 0.0), mean + alpha * delta)
+        count += valid
+    return flags
+
+
+def test_streaming_detector_matches_row_by_row_updates():
+    rng = np.random.default_rng(4)
+    values = rng.normal(size=(600, 3))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[rng.random(values.shape) < 0.02] *= 8
+
+    detector = meter_app.StreamingAnomalyDetector(3)
+    flags = np.vstack([detector.update(batch)[0] for batch in np.array_split(values, 7)])
+    assert flags.any()
+    np.testing.assert_array_equal(flags, reference_ewma(values))
+
+
+def test_ewma_flags_frames_shorter_than_the_window():
+    values = np.r_[np.linspace(1.0, 1.2, 20), 50.0]
+    df = pd.DataFrame({'kWh': values})
+    anomalies, _ = meter_app.detect_anomalies(df, 'ewma', window=30)
+    assert anomalies['kWh']['indices'] == [20]
+
+
+def test_windows_follow_time_not_file_order(client, upload_meter, tmp_path):
+    path = upload_meter(rows=1000)
+    expected = analyze(client, method='rolling_zscore', limit=meter_app.ANOMALY_MAX_PAGE_LIMIT).get_json()['results']
+    times = pd.read_csv(path)['Date']
+    found = {(times[row], column) for row, column in flatten(expected['anomalies'])}
+
+    shuffled = pd.read_csv(path).sample(frac=1, random_state=0).reset_index(drop=True)
+    shuffled.to_csv(tmp_path / 'shuffled.csv', index=False)
+    with open(tmp_path / 'shuffled.csv', 'rb') as f:
+        assert client.post('/upload', data={'file': (f, 'meter.csv')},
+                           content_type='multipart/form-data').status_code == 200
+    results = analyze(client, method='rolling_zscore', limit=meter_app.ANOMALY_MAX_PAGE_LIMIT).get_json()['results']
+    assert {(shuffled['Date'][row], column) for row, column in flatten(results['anomalies'])} == found
@@ -0,0 +1,47 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+import app as meter_app
+
+ACCOUNTS = [
+    {'account_number': 'A1', 'customer_name': 'First', 'total_consumption': 120,
+     'energy_charges': 600.0, 'fixed_charges': 90.0},
+    # Charges that cannot be added fail in the worker
+    {'account_number': 'B2', 'customer_name': 'Broken', 'total_consumption': 'abc',
+     'energy_charges': 'abc', 'fixed_charges': 90.0},
+    {'account_number': 'C3', 'customer_name': 'Third', 'total_consumption': 80,
+     'energy_charges': 400.0, 'fixed_charges': 90.0},
+]
+
+
+@pytest.fixture
+def bill_folder(tmp_path, monkeypatch):
+    folder = tmp_path / 'bills'
+    monkeypatch.setitem(meter_app.app.config, 'BILL_OUTPUT_FOLDER', str(folder))
+    return folder
+
+
+def test_failing_account_is_reported_in_the_archive(client):
+    response = client.post('/generate_bill_pdf/batch', json={'accounts': ACCOUNTS, 'workers': 1})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.namelist() == ['bill_A1.pdf', 'bill_C3.pdf', 'summary.json']
+        assert archive.read('bill_C3.pdf').startswith(b'%PDF')
+        summary = json.loads(archive.read('summary.json'))
+    assert summary['bills'] == 2
+    assert [entry['account_number'] for entry in summary['failed']] == ['B2']
+    assert summary['failed'][0]['error']
+
+
+def test_failing_account_is_reported_in_directory_mode(client, bill_folder):
+    response = client.post('/generate_bill_pdf/batch', json={'accounts': ACCOUNTS, 'workers': 1,
+                                                             'output': 'directory', 'run': 'test'})
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary['bills'] == 2
+    assert [entry['account_number'] for entry in summary['failed']] == ['B2']
+    assert sorted(os.listdir(bill_folder / 'test')) == ['bill_A1.pdf', 'bill_C3.pdf']
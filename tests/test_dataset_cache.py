@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+
+import app as meter_app
+
+
+def write_csv(path, values):
+    pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=len(values), freq='D').strftime('%Y-%m-%d'),
+                  'kWh': values}).to_csv(path, index=False)
+
+
+def test_reloads_a_file_that_changed_size(upload_folder):
+    path = str(upload_folder / 'meter.csv')
+    write_csv(path, [1.0, 2.0, 3.0])
+    assert len(meter_app.load_dataset(path)) == 3
+    assert len(meter_app.load_dataset(path)) == 3
+
+    write_csv(path, [1.0, 2.0, 3.0, 4.0])
+    assert meter_app.load_dataset(path)['kWh'].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_reloads_a_file_rewritten_with_the_same_size(upload_folder):
+    path = str(upload_folder / 'meter.csv')
+    write_csv(path, [1.0, 2.0, 3.0])
+    meter_app.load_dataset(path)
+    stat = os.stat(path)
+
+    write_csv(path, [7.0, 8.0, 9.0])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert os.path.getsize(path) == stat.st_size
+    assert meter_app.load_dataset(path)['kWh'].tolist() == [7.0, 8.0, 9.0]
+
+
+def test_serves_repeat_loads_from_the_cache(upload_folder):
+    path = str(upload_folder / 'meter.csv')
+    write_csv(path, [1.0, 2.0, 3.0])
+    before = meter_app.dataset_cache.stats()
+    first = meter_app.load_dataset(path, ['kWh'])
+    assert meter_app.load_dataset(path, ['kWh']) is first
+    after = meter_app.dataset_cache.stats()
+    assert (after['misses'] - before['misses'], after['hits'] - before['hits']) == (1, 1)
+    # Load locks only exist while a load is pending
+    assert not meter_app.dataset_cache._load_locks
+
+
+def test_evicts_least_recently_used_entries_over_budget(upload_folder, monkeypatch):
+    paths = [str(upload_folder / f'meter_{i}.csv') for i in range(3)]
+    for path in paths:
+        write_csv(path, list(range(1000)))
+    nbytes = meter_app._estimate_nbytes(meter_app.load_dataset(paths[0]))
+    meter_app.dataset_cache.clear()
+    monkeypatch.setattr(meter_app.dataset_cache, 'max_bytes', nbytes * 2)
+
+    for path in paths:
+        meter_app.load_dataset(path)
+    stats = meter_app.dataset_cache.stats()
+    assert stats['entries'] == 2
+    assert stats['bytes'] <= stats['max_bytes']
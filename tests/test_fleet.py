@@ -0,0 +1,21 @@
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize('filenames', [[1], 'meter.csv', [], [''], {'name': 'meter.csv'}])
+def test_rejects_malformed_filenames(client, filenames):
+    response = client.post('/analyze/batch', json={'filenames': filenames})
+    assert response.status_code == 400
+    assert 'filenames' in response.get_json()['error']
+
+
+def test_streams_one_line_per_meter_and_a_summary(client, upload_meter):
+    upload_meter('meter_a.csv', seed=1)
+    upload_meter('meter_b.csv', seed=2)
+    response = client.post('/analyze/batch', json={'filenames': ['meter_a.csv', 'meter_b.csv'],
+                                                   'analysis_types': ['statistics'], 'workers': 1})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line['filename'] for line in lines[:-1]) == ['meter_a.csv', 'meter_b.csv']
+    assert 'summary' in lines[-1]
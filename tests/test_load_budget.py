@@ -0,0 +1,73 @@
+import gc
+
+import pytest
+
+import app as meter_app
+
+NUMERIC = ['Electricity_Consumption_kWh', '3_Phase_Active_Power']
+
+
+def test_numeric_columns_over_budget_are_spilled(client, upload_meter, monkeypatch):
+    path = upload_meter()
+    assert meter_app.read_columnar_schema(path) is not None
+    monkeypatch.setattr(meter_app.load_budget, 'max_bytes', 1024)
+    before = meter_app.load_budget.stats()
+
+    df = meter_app.load_dataset(path, NUMERIC)
+    assert len(df) == 2000
+    # Mapped columns stay in the page cache and hold none of the budget
+    assert df.attrs['heap_bytes'] == 0
+    after = meter_app.load_budget.stats()
+    assert after['spilled'] == before['spilled'] + 1
+    assert after['refused'] == before['refused']
+
+    response = client.get(f'/data/meter.csv?x={NUMERIC[0]}&y={NUMERIC[1]}')
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def test_text_columns_over_budget_are_refused(client, upload_meter, monkeypatch):
+    upload_meter()
+    monkeypatch.setattr(meter_app.load_budget, 'max_bytes', 1024)
+    refused = meter_app.load_budget.stats()['refused']
+
+    response = client.get('/data/meter.csv?x=Date&y=Electricity_Consumption_kWh')
+    assert response.status_code == 507
+    assert 'load budget' in response.get_json()['error']
+    assert meter_app.load_budget.stats()['refused'] == refused + 1
+
+
+def test_frames_hold_their_reservation_until_collected(upload_meter):
+    path = upload_meter()
+    reserved = meter_app.load_budget.stats()['reserved_bytes']
+    df = meter_app.load_dataset(path)
+    assert meter_app.load_budget.stats()['reserved_bytes'] > reserved
+
+    del df
+    meter_app.dataset_cache.clear()
+    gc.collect()
+    assert meter_app.load_budget.stats()['reserved_bytes'] == reserved
+
+
+def test_analyses_in_column_groups_match_one_block(upload_meter, monkeypatch):
+    path = upload_meter(rows=3000)
+    df = meter_app.load_dataset(path, meter_app.numeric_columns(path))
+    _, timestamps = meter_app.dataset_time_index(path)
+    order = meter_app.time_order(timestamps)
+    columns = meter_app.numeric_column_names(df)
+
+    def run():
+        anomalies = [meter_app.detect_anomalies(df, method, threshold=2.0, limit=50, order=order)
+                     for method in meter_app.ANOMALY_METHODS]
+        pyramid = meter_app.RollupPyramid.build(timestamps, df, columns)
+        return anomalies, meter_app.compute_trends(df, order), pyramid.query('day')['aggregates']
+
+    anomalies, trends, rollups = run()
+    # Two columns per group
+    monkeypatch.setitem(meter_app.app.config, 'ANALYSIS_BLOCK_BYTES', len(df) * 8 * 2)
+    assert len(meter_app.column_groups(len(df), columns)) > 1
+    grouped_anomalies, grouped_trends, grouped_rollups = run()
+    assert grouped_anomalies == anomalies
+    assert grouped_rollups == rollups
+    # Sums over narrower blocks may round differently in the last bit
+    for column, trend in trends.items():
+        assert grouped_trends[column] == pytest.approx(trend, rel=1e-9)
@@ -0,0 +1,80 @@
+import gzip
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import app as meter_app
+
+DATA_URL = '/data/meter.csv?x=Date&y=Electricity_Consumption_kWh'
+
+
+def decode_columns(body):
+    """Columns of an application/vnd.eec.columns body, as laid out by encode_columns()"""
+    assert body[:4] == b'EECC'
+    (length,) = struct.unpack('<I', body[4:8])
+    header = json.loads(body[8:8 + length])
+    data = body[8 + length:]
+    columns = {}
+    for entry in header['columns']:
+        if entry['dtype'] == 'utf8':
+            offsets, text = entry['buffers']
+            bounds = np.frombuffer(data, '<i8', entry['length'] + 1, offsets['offset'])
+            raw = data[text['offset']:text['offset'] + text['nbytes']]
+            columns[entry['name']] = [raw[a:b].decode('utf-8') for a, b in zip(bounds[:-1], bounds[1:])]
+        else:
+            (buffer,) = entry['buffers']
+            columns[entry['name']] = np.frombuffer(data, entry['dtype'], entry['length'], buffer['offset'])
+    return header['meta'], columns
+
+
+def test_repeat_requests_are_not_modified(client, upload_meter):
+    upload_meter()
+    first = client.get(DATA_URL)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    repeat = client.get(DATA_URL, headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b''
+    assert repeat.headers['ETag'] == etag
+
+
+def test_etag_changes_with_the_dataset_and_the_format(client, upload_meter):
+    upload_meter(seed=1)
+    etag = client.get(DATA_URL).headers['ETag']
+    assert client.get(DATA_URL + '&format=columns').headers['ETag'] != etag
+
+    upload_meter(seed=2)
+    response = client.get(DATA_URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_columns_format_matches_json(client, upload_meter):
+    upload_meter()
+    expected = client.get(DATA_URL).get_json()['data']
+
+    for response in (client.get(DATA_URL + '&format=columns'),
+                     client.get(DATA_URL, headers={'Accept': meter_app.COLUMNS_MIMETYPE})):
+        assert response.mimetype == meter_app.COLUMNS_MIMETYPE
+        _, columns = decode_columns(response.get_data())
+        assert list(columns['Electricity_Consumption_kWh']) == pytest.approx(expected['y'])
+        assert len(columns['x']) == len(expected['x'])
+
+
+def test_unavailable_arrow_falls_back_to_json(client, upload_meter, monkeypatch):
+    upload_meter()
+    monkeypatch.setattr(meter_app, 'ARROW_AVAILABLE', False)
+    assert client.get(DATA_URL + '&format=arrow').mimetype == meter_app.JSON_MIMETYPE
+    assert client.get(DATA_URL, headers={'Accept': meter_app.ARROW_MIMETYPE}).mimetype == meter_app.JSON_MIMETYPE
+
+
+def test_large_bodies_are_gzipped_on_request(client, upload_meter):
+    upload_meter()
+    plain = client.get(DATA_URL)
+    compressed = client.get(DATA_URL, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert 'Accept-Encoding' in compressed.headers['Vary']
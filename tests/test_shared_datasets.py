@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+import app as meter_app
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    monkeypatch.setitem(meter_app.app.config, 'SHARED_DATASETS', True)
+
+
+@pytest.mark.parametrize('analysis_type', ['statistics', 'anomaly_detection', 'patterns', 'time_series'])
+def test_analyses_run_on_shared_columns(client, upload_meter, shared, analysis_type):
+    path = upload_meter()
+    response = client.post('/analyze', json={'filename': 'meter.csv', 'analysis_type': analysis_type})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.get_json()['success']
+    assert os.listdir(meter_app.shared_path(path))
+
+
+def test_numeric_data_is_served_from_shared_columns(client, upload_meter, shared):
+    upload_meter()
+    response = client.get('/data/meter.csv?x=Electricity_Consumption_kWh&y=3_Phase_Active_Power')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert len(response.get_json()['data']['y']) > 0
+    assert meter_app.shared_store.stats()['generations_held'] >= 1
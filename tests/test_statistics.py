@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import app as meter_app
+
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+def rank_error(values, estimates):
+    """Distance between each estimate's rank in values and the quantile asked for"""
+    ranks = np.searchsorted(np.sort(values), estimates) / len(values)
+    return np.abs(ranks - np.array(QUANTILES))
+
+
+def test_sketch_is_exact_before_it_compacts():
+    values = np.random.default_rng(1).normal(size=500)
+    sketch = meter_app.QuantileSketch()
+    sketch.update(values)
+    assert sketch.quantiles(QUANTILES) == pytest.approx(np.quantile(values, QUANTILES))
+
+
+def test_sketch_quantiles_stay_within_rank_error():
+    values = np.random.default_rng(2).lognormal(size=200000)
+    sketch = meter_app.QuantileSketch()
+    for chunk in np.array_split(values, 20):
+        sketch.update(chunk)
+    assert rank_error(values, sketch.quantiles(QUANTILES)).max() < 0.01
+
+
+def test_merged_sketches_match_the_union():
+    rng = np.random.default_rng(3)
+    parts = [rng.normal(loc, size=50000) for loc in (0, 5, 10)]
+    merged = meter_app.QuantileSketch()
+    for part in parts:
+        sketch = meter_app.QuantileSketch()
+        sketch.update(part)
+        merged.merge(sketch)
+    assert rank_error(np.concatenate(parts), merged.quantiles(QUANTILES)).max() < 0.01
+
+
+def test_streaming_statistics_match_the_in_memory_analysis(client, upload_meter):
+    upload_meter(rows=5000)
+    exact = client.post('/analyze', json={'filename': 'meter.csv', 'analysis_type': 'statistics'}).get_json()
+    streamed = client.post('/analyze', json={'filename': 'meter.csv', 'analysis_type': 'statistics',
+                                             'streaming': True}).get_json()
+    column = 'Electricity_Consumption_kWh'
+    exact, streamed = exact['results']['statistics'][column], streamed['results']['statistics'][column]
+    for key in ('mean', 'std', 'min', 'max'):
+        assert streamed[key] == pytest.approx(exact[key])
+    for key in ('median', 'q1', 'q3'):
+        assert streamed[key] == pytest.approx(exact[key], rel=0.02)
+
+
+def test_incremental_scan_folds_appended_rows(upload_folder):
+    path = upload_folder / 'meter.csv'
+    path.write_text('kWh\n1\n2\n3\n')
+    scan = meter_app.IncrementalScan(meter_app.StatisticsAccumulator.from_frame)
+    assert scan.get(str(path)).result()['kWh']['max'] == 3
+
+    with open(path, 'a') as f:
+        f.write('4\n5\n')
+    result = scan.get(str(path)).result()['kWh']
+    assert (result['mean'], result['max']) == (3, 5)
+    # File locks only exist while a scan is pending
+    assert not scan._file_locks